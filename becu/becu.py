@@ -53,9 +53,8 @@ import sys
 import os
 import json
 import time
-import xml.dom.minidom
-import copy
 import argparse
+import concurrent.futures
 
 import xmltodict
 import api_lib_pa as pa_api
@@ -99,13 +98,14 @@ def error_check(response, operation):
         sys.exit(0)
 
 
-def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None):
+def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None, fetched_rules=None):
     """
     Create output files, upload to PA/Panorama, print to screen.
     This function utilizes settings.PUSH_CONFIG_TO_PA
 
     :param modified_rules: modified rules to be created/uploaded to file/PA.
     :param filename: xml filename to use
+    :param fetched_rules: not used, the rules as fetched (see pa_api.output_and_push_diff)
     :return: dictionary version of the file 
     """
 
@@ -115,13 +115,8 @@ def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None):
     # Prepare output
     add_entry_tag = {"entry": modified_rules}   # Adds the <entry> tag to each rule
     modified_rules_xml = {"config": {"security": {"rules": add_entry_tag} } } # Provides an xpath for importing
-    data = xmltodict.unparse(modified_rules_xml)    # Turn XML into a string
-    prettyxml = xml.dom.minidom.parseString(data).toprettyxml() # Pretty-fi the XML before creating file
-    prettyxml = prettyxml.replace('<?xml version="1.0" ?>', "") # Can't import with this in the XML, remove it
     # Create output file
-    with open(filename, "w") as fout:
-        fout.write(prettyxml)
-        print(f"\nOutput at: {filename}\n")
+    pa_api.write_config_file(modified_rules_xml, filename)
 
     if settings.PUSH_CONFIG_TO_PA:
         # Ask for filename
@@ -156,9 +151,7 @@ def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None):
                     xpath = xpath.replace(pa.device_group, new_device_group)
 
             fname = filename.rsplit('/', 1)[1]  # Get filename, strip any folders before the filename.
-            load_url = f"https://{pa.pa_ip}:443/api/?type=op&key={pa.key}&cmd=<load><config><partial><mode>replace</mode><from-xpath>/config/security/rules</from-xpath><to-xpath>{xpath}</to-xpath><from>{fname}</from></partial></config></load>"
-            
-            response = pa.session[pa.pa_ip].get(load_url, verify=False)
+            response = pa.load_partial_config(fname, "/config/security/rules", xpath)
             error_check(response, "Loading Configuration")
 
             print("\nCandidate configuration successfully loaded...enjoy the new ruleset!")
@@ -175,79 +168,70 @@ def modify_rules(security_rules):
     This accepts a dictionary of existing rules and modifies them to a cloud-based intra-zone ruleset.
     This function utilizes settings.EXISTING_PRIVATE_ZONES, and settings.NEW_PRIVATE_INTRAZONE
 
-    :param security_rules: existing security rules
+    :param security_rules: existing security rules (list, single rule, or generator from iter_api_entries)
     :return: modified_rules, new/modified security rule-set
     """
-    def modify(srcdst, tofrom, x_zone, x_addr):
+    def modify(srcdst, tofrom):
         """
         inner function (possibly to be moved outside later)
         The bulk of the logic for zone modification is done here
         Source & destination behave the same, this allows the same code to be used for both.
 
-        :param srcdst: the xml ZONE tag needed for insertion into the new rule
-        :param tofrom: the xml Address-Object tag needed for insertion into the new rule
-        :param x_zone: from or to, zone name
-        :param x_addr: source or destination, address/group object
-        :return: none, This function modifies the local variable newrule
+        :param srcdst: source or destination, the Rule's address/group objects
+        :param tofrom: from_zone or to_zone, the Rule's zones
+        :return: none, This function replaces the local variable newrule
         """
-
-        try:
-            if not isinstance(x_zone, list):
-                x_zone = [x_zone]
-                newrule[tofrom]["member"] = [newrule[tofrom]["member"]]
-            if not isinstance(x_addr, list):
-                x_addr = [x_addr]
-                newrule[srcdst]["member"] = [newrule[srcdst]["member"]]
-
-            for zone in x_zone: 
-                if zone in settings.EXISTING_PRIVATE_ZONES:
-                    # Zone found, update this zone to the new private intra-zone
-                    newrule[tofrom]["member"].remove(zone)
-                    if settings.NEW_PRIVATE_INTRAZONE not in newrule[tofrom]["member"]:
-                        newrule[tofrom]["member"].append(settings.NEW_PRIVATE_INTRAZONE)
-
-                    # Get the address/group object associated to this zone
-                    new_addr_obj = settings.EXISTING_PRIVATE_ZONES[zone]
-
-                    for x in x_addr:
-                        if x == "any":  # The source/destination IP's are 'any', update the rule to use the new object
-                            if "any" in newrule[srcdst]["member"]:
-                                newrule[srcdst]["member"].remove("any")
-                            if new_addr_obj not in newrule[srcdst]["member"]:
-                                newrule[srcdst]["member"].append(new_addr_obj)
-                else:
-                    zonenotfound = f"{zone:<15} zone not found, not updating this zone."
-                    rulename = f"Rule Name: {newrule['@name']}"
-                    print(f"{rulename:<50}\t{zonenotfound:<10}")
-
-        except TypeError:
-            print("\nError, candidate config detected. Please commit or revert changes before proceeding.\n")
-            sys.exit(0)              
-
-        if len(newrule[tofrom]["member"]) == 1:
-            newrule[tofrom]["member"] = newrule[tofrom]["member"][0]
-        if len(newrule[srcdst]["member"]) == 1:
-            newrule[srcdst]["member"] = newrule[srcdst]["member"][0]
+        nonlocal newrule
+
+        zones = list(getattr(newrule, tofrom))
+        addrs = list(getattr(newrule, srcdst))
+        changed = False
+
+        for zone in getattr(rule, tofrom): 
+            if zone in settings.EXISTING_PRIVATE_ZONES:
+                # Zone found, update this zone to the new private intra-zone
+                changed = True
+                zones.remove(zone)
+                if settings.NEW_PRIVATE_INTRAZONE not in zones:
+                    zones.append(settings.NEW_PRIVATE_INTRAZONE)
+
+                # Get the address/group object associated to this zone
+                new_addr_obj = settings.EXISTING_PRIVATE_ZONES[zone]
+
+                for x in getattr(rule, srcdst):
+                    if x == "any":  # The source/destination IP's are 'any', update the rule to use the new object
+                        if "any" in addrs:
+                            addrs.remove("any")
+                        if new_addr_obj not in addrs:
+                            addrs.append(new_addr_obj)
+            else:
+                zonenotfound = f"{zone:<15} zone not found, not updating this zone."
+                rulename = f"Rule Name: {rule.name}"
+                print(f"{rulename:<50}\t{zonenotfound:<10}")
+
+        # Copy-on-write, rule is never modified
+        if changed:
+            newrule = newrule.replace(**{tofrom: zones, srcdst: addrs})
     
-        return None # This function modifies the local variable newrule
+        return None # This function replaces the local variable newrule
 
     # modify_rules(security_rules)
     modified_rules = []
-    if not isinstance(security_rules, list):
+    if isinstance(security_rules, dict):
         security_rules = [security_rules]
     print("\nModifying...\n")
     for oldrule in security_rules:
-        newrule = copy.deepcopy(oldrule)
-        from_zone = oldrule["from"]["member"]
-        to_zone = oldrule["to"]["member"]
-        src_addr = oldrule["source"]["member"]
-        dst_addr = oldrule["destination"]["member"]
+        rule = pa_api.Rule.from_dict(oldrule)
+        if not rule.parsed:
+            print("\nError, candidate config detected. Please commit or revert changes before proceeding.\n")
+            sys.exit(0)
+        newrule = rule
 
         # Check and modify to intra-zone based rules
-        modify("source", "from", from_zone,src_addr)
-        modify("destination", "to", to_zone,dst_addr)
+        modify("source", "from_zone")
+        modify("destination", "to_zone")
 
-        modified_rules.append(newrule)
+        modified_rules.append(newrule.to_dict() if newrule is not rule else oldrule)
 
     print("..Done.")
     return modified_rules
@@ -280,7 +264,85 @@ def get_device_group(pa):
     return device_group
 
 
-def becu(pa_ip, username, password, pa_type, filename=None):
+def retarget_device_group(pa, xpaths):
+    """
+    --batch on Panorama, load into the existing Device Group or pick another one.
+
+    :param xpaths: rulebase xpaths with the current device group
+    :return: xpaths to load into
+    """
+    if not pa.device_group:
+        return xpaths
+
+    same_dg = ""
+    while same_dg.lower() not in ("y", "n"):
+        same_dg = input(f"Push to existing Device Group ({pa.device_group})? [y/n]: ")
+
+    # Update xpaths to new device-group
+    if same_dg == "n":
+        new_device_group = get_device_group(pa)
+        xpaths = [xpath.replace(pa.device_group, new_device_group) for xpath in xpaths]
+    return xpaths
+
+
+def sweep_device_group(job):
+    """
+    Modify one device group's pre & post rules, run in a worker process (--device-groups).
+
+    :param job: (device group, pre-rules, post-rules)
+    :return: (modified pre-rules, modified post-rules)
+    """
+    device_group, pre_rules, post_rules = job
+    print(f"\nDevice Group: {device_group}")
+    modified_rules_pre = modify_rules(pre_rules) if pre_rules else []
+    modified_rules_post = modify_rules(post_rules) if post_rules else []
+    return modified_rules_pre, modified_rules_post
+
+
+def sweep_device_groups(pa, device_groups):
+    """
+    Sweep mode (--device-groups), non-interactive.
+    Grabs every device group's rules at once, then modifies the device groups in worker processes.
+
+    :param device_groups: list of device group names, or ["all"]
+    :return: to_output list, [modified_rules, filename, xpath, pa, fetched rules]
+    """
+    if device_groups == ["all"]:
+        device_groups, _ = pa.grab_panorama_objects()
+    pa.device_group = None  # More than one
+
+    dg_jobs = {}
+    for dg in device_groups:
+        dg_jobs[dg] = (
+            (pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", dg), f"output/api/{dg}-pre-rules.xml"),
+            (pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", dg), f"output/api/{dg}-post-rules.xml"),
+        )
+
+    print(f"Grabbing the rules for {len(device_groups)} Device Groups..")
+    api_output = pa.grab_api_output_batch([job for jobs in dg_jobs.values() for job in jobs])
+
+    def entries(job):
+        output = api_output[job]
+        if output and output.get("result") and output["result"].get("rules"):
+            return pa_api.as_list(output["result"]["rules"].get("entry"))
+        return []
+
+    jobs = [(dg, entries(pre_job), entries(post_job)) for dg, (pre_job, post_job) in dg_jobs.items()]
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        results = list(executor.map(sweep_device_group, jobs))
+
+    to_output = []
+    for (dg, pre_rules, post_rules), (modified_rules_pre, modified_rules_post) in zip(jobs, results):
+        if pre_rules:
+            XPATH_PRE = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", dg)
+            to_output.append([modified_rules_pre, f"output/{dg}-modified-pre-rules.xml", XPATH_PRE, pa, pre_rules])
+        if post_rules:
+            XPATH_POST = pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", dg)
+            to_output.append([modified_rules_post, f"output/{dg}-modified-post-rules.xml", XPATH_POST, pa, post_rules])
+    return to_output
+
+
+def becu(pa_ip, username, password, pa_type, filename=None, stream=False, batch=False, diff=False, device_groups=None, snapshot=None, record=None, replay=None):
     """
     Main point of entry.
     Connect to PA/Panorama.
@@ -293,14 +355,28 @@ def becu(pa_ip, username, password, pa_type, filename=None):
     :param password: Password
     :pa_type: PA or Panorama, or XML (offline)
     :filename: Filename to read security rules from (offline mode only)
+    :stream: Parse the rulebases one rule at a time as they are downloaded (large rulebases)
+    :batch: Upload all the modified rulebases as one named config and load them in one pass
+    :diff: Only push the rules that changed (set/edit/move) instead of replacing the rulebases
+    :device_groups: Sweep these Device Groups (list or ["all"]) without prompting, always pushed as a batch/diff
+    :snapshot: Grab the whole "running" or "candidate" config once instead of one API call per xpath
+    :record: Save every API response to this folder (cassette) for replay
+    :replay: Offline, answer every API call from this record folder instead of the PA/Panorama
     :return: None, end of script.
     """
     
     # Grab 'start' time    
     start = time.perf_counter()
 
-    if pa_type != "xml":
+    if replay:
+        pa = pa_api.api_lib_pa.replay(replay, pa_type)
+        pa_type = pa.pa_type
+    elif pa_type != "xml":
         pa = pa_api.api_lib_pa(pa_ip, username, password, pa_type)
+        if record:
+            pa.record(record)
+    if snapshot and pa_type != "xml":
+        pa.use_snapshot(snapshot, f"output/api/{snapshot}-config.xml")
     to_output = []
 
     if pa_type == "xml":
@@ -309,6 +385,12 @@ def becu(pa_ip, username, password, pa_type, filename=None):
         modified_rules = modify_rules(security_rules["result"]["rules"]["entry"])
         output_and_push_changes(modified_rules, "output/modified-xml-rules.xml")
 
+    elif pa_type == "panorama" and device_groups:
+        # Sweep the Device Groups, non-interactive
+        to_output = sweep_device_groups(pa, device_groups)
+        if not diff:
+            batch = True
+
     elif pa_type == "panorama":
         # Grab the Device Groups 
         pa.device_group = get_device_group(pa)
@@ -317,30 +399,55 @@ def becu(pa_ip, username, password, pa_type, filename=None):
         XPATH_PRE = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", pa.device_group)
         XPATH_POST = pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", pa.device_group)
 
-        # Grab Panorama Rules
-        pre_security_rules = pa.grab_api_output("xml", XPATH_PRE, "output/api/pre-rules.xml")
-        post_security_rules = pa.grab_api_output("xml", XPATH_POST, "output/api/post-rules.xml")
-
-        # Modify the rules, Pre & Post, then append to output list
-        if pre_security_rules["result"]:
-            modified_rules_pre = modify_rules(pre_security_rules["result"]["rules"]["entry"])
-            to_output.append([modified_rules_pre,"output/modified-pre-rules.xml", XPATH_PRE, pa])
-        if post_security_rules["result"]:
-            modified_rules_post = modify_rules(post_security_rules["result"]["rules"]["entry"])
-            to_output.append([modified_rules_post,"output/modified-post-rules.xml", XPATH_POST, pa])
+        if stream:
+            # Modify the rules as they are downloaded, Pre & Post, then append to output list
+            fetched_pre = [] if diff else None
+            modified_rules_pre = modify_rules(pa_api.tee_entries(pa.iter_api_entries(XPATH_PRE, "output/api/pre-rules.xml"), fetched_pre))
+            if modified_rules_pre:
+                to_output.append([modified_rules_pre,"output/modified-pre-rules.xml", XPATH_PRE, pa, fetched_pre])
+            fetched_post = [] if diff else None
+            modified_rules_post = modify_rules(pa_api.tee_entries(pa.iter_api_entries(XPATH_POST, "output/api/post-rules.xml"), fetched_post))
+            if modified_rules_post:
+                to_output.append([modified_rules_post,"output/modified-post-rules.xml", XPATH_POST, pa, fetched_post])
+        else:
+            # Grab Panorama Rules
+            PRE_JOB = (XPATH_PRE, "output/api/pre-rules.xml")
+            POST_JOB = (XPATH_POST, "output/api/post-rules.xml")
+            api_output = pa.grab_api_output_batch([PRE_JOB, POST_JOB])
+            pre_security_rules = api_output[PRE_JOB]
+            post_security_rules = api_output[POST_JOB]
+
+            # Modify the rules, Pre & Post, then append to output list
+            if pre_security_rules["result"]:
+                modified_rules_pre = modify_rules(pre_security_rules["result"]["rules"]["entry"])
+                to_output.append([modified_rules_pre,"output/modified-pre-rules.xml", XPATH_PRE, pa, pre_security_rules["result"]["rules"]["entry"]])
+            if post_security_rules["result"]:
+                modified_rules_post = modify_rules(post_security_rules["result"]["rules"]["entry"])
+                to_output.append([modified_rules_post,"output/modified-post-rules.xml", XPATH_POST, pa, post_security_rules["result"]["rules"]["entry"]])
             
     elif pa_type == "pa":
         # Grab PA Rules
         XPATH = pa_api.XPATH_SECURITYRULES
-        security_rules = pa.grab_api_output("xml", XPATH, "output/api/pa-rules.xml")
-        if security_rules["result"]:
-            # Modify the rules, append to be output
-            modified_rules = modify_rules(security_rules["result"]["rules"]["entry"])
-            to_output.append([modified_rules,"output/modified-pa-rules.xml", XPATH, pa])
+        if stream:
+            fetched = [] if diff else None
+            modified_rules = modify_rules(pa_api.tee_entries(pa.iter_api_entries(XPATH, "output/api/pa-rules.xml"), fetched))
+            if modified_rules:
+                to_output.append([modified_rules,"output/modified-pa-rules.xml", XPATH, pa, fetched])
+        else:
+            security_rules = pa.grab_api_output("xml", XPATH, "output/api/pa-rules.xml")
+            if security_rules["result"]:
+                # Modify the rules, append to be output
+                modified_rules = modify_rules(security_rules["result"]["rules"]["entry"])
+                to_output.append([modified_rules,"output/modified-pa-rules.xml", XPATH, pa, security_rules["result"]["rules"]["entry"]])
 
     # Begin creating output and/or pushing rules to PA/PAN
-    for ruletype in to_output:
-        output_and_push_changes(*ruletype)
+    if diff:
+        pa_api.output_and_push_diff(to_output, push=settings.PUSH_CONFIG_TO_PA)
+    elif batch:
+        pa_api.output_and_push_batch(to_output, push=settings.PUSH_CONFIG_TO_PA, retarget=retarget_device_group)
+    else:
+        for ruletype in to_output:
+            output_and_push_changes(*ruletype)
 
     end = time.perf_counter()
     runtime = end - start
@@ -353,12 +460,21 @@ def becu(pa_ip, username, password, pa_type, filename=None):
 if __name__ == "__main__":
 
     # Check arguments, if 'xml' then don't need the rest of the input
-    argrequired = '--xml' not in sys.argv and '-x' not in sys.argv
+    argrequired = '--xml' not in sys.argv and '-x' not in sys.argv and '--replay' not in sys.argv
     parser = argparse.ArgumentParser(description="Please use this syntax:")
     parser.add_argument("-x", "--xml", help="Optional XML Filename", type=str)
+    parser.add_argument("--record", help="Save every API response to this folder, see --replay", type=str)
+    parser.add_argument("--replay", help="Offline, answer every API call from a --record folder", type=str)
     parser.add_argument("-u", "--username", help="Username", type=str, required=argrequired)
     parser.add_argument("-i", "--ipaddress", help="IP or FQDN of PA/Panorama", type=str, required=argrequired)
+    parser.add_argument("-s", "--stream", help="Stream large rulebases one rule at a time (less memory)", action="store_true")
+    parser.add_argument("-b", "--batch", help="Upload pre & post rules as one config and load them in one pass", action="store_true")
+    parser.add_argument("-d", "--diff", help="Only push the rules that changed instead of replacing the rulebase", action="store_true")
+    parser.add_argument("-c", "--config", help="Grab the whole running/candidate config once", choices=["running", "candidate"])
+    parser.add_argument("-g", "--device-groups", help="Sweep these Device Groups without prompting, ie. DG1,DG2 or all", type=str)
     args = parser.parse_args()
+    if args.device_groups and args.stream:
+        parser.error("--device-groups grabs every Device Group's rules at once, it can't be combined with --stream")
 
     # IF XML, do not connect to PA/Pan
     if args.xml:
@@ -367,6 +483,12 @@ if __name__ == "__main__":
         becu("n/a","n/a","n/a","xml",filename)
         sys.exit(0)
 
+    # IF REPLAY, do not connect to PA/Pan
+    if args.replay:
+        device_groups = args.device_groups.split(",") if args.device_groups else None
+        becu("n/a", "n/a", "n/a", None, stream=args.stream, batch=args.batch, diff=args.diff, device_groups=device_groups, snapshot=args.config, replay=args.replay)
+        sys.exit(0)
+
     # Gather input
     pa_ip = args.ipaddress
     username = args.username
@@ -385,4 +507,5 @@ if __name__ == "__main__":
 
     # Run program
     print("\nThank you...connecting..\n")
-    becu(pa_ip, username, password, pa_type)
\ No newline at end of file
+    device_groups = args.device_groups.split(",") if args.device_groups else None
+    becu(pa_ip, username, password, pa_type, stream=args.stream, batch=args.batch, diff=args.diff, device_groups=device_groups, snapshot=args.config, record=args.record)
\ No newline at end of file
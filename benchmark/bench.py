@@ -0,0 +1,341 @@
+"""
+Description:
+    Offline benchmark for the rule/NAT processing in gARP, becu, eastwest-helper and suu-copy-rules.
+    Generates a synthetic PAN-OS config (interfaces with subinterfaces, NAT rules, security rules,
+    address objects and nested address groups), then times each pipeline stage at every size.
+    Reports time, throughput, peak memory (tracemalloc) and how each stage scales between sizes,
+    so regressions show up before running against a production Panorama.
+
+    Nothing is sent to a PA/Panorama, each project's own api_lib_pa/zone_settings are used.
+
+Requires:
+    xmltodict
+    numpy (eastwest-helper)
+        to install try: pip3 install xmltodict numpy
+
+Tested:
+    Python: 3.11
+
+Example usage:
+        $ python3 bench.py
+        $ python3 bench.py -n 1000,10000,50000 -r 3 -j results.json
+        $ python3 bench.py -n 20000 -w big-config.xml        # Also write the config, ie. garp.py -x big-config.xml
+
+Cautions:
+    Peak memory is measured in a separate run, tracemalloc slows everything down.
+"""
+
+import sys
+import os
+import io
+import json
+import math
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Project modules, loaded from their own folder (each has it's own api_lib_pa/zone_settings)
+PROJECTS = {
+    "garp": ("gARP", "garp.py"),
+    "becu": ("becu", "becu.py"),
+    "eastwest": ("eastwest-helper", "eastwest-helper.py"),
+    "suu": ("suu-copy-rules", "suu_copy.py"),
+}
+SHARED_MODULES = ("api_lib_pa", "zone_settings")
+
+XPATH_VSYS = "/config/devices/entry[@name='localhost.localdomain']/vsys/entry[@name='vsys1']"
+
+
+def load_project(name):
+    """
+    Import a project's script in isolation, the shared module names are cleared from sys.modules
+    first so each project gets it's own api_lib_pa/zone_settings.
+
+    :return: (module, import seconds)
+    """
+    folder, filename = PROJECTS[name]
+    folder = os.path.join(ROOT, folder)
+    for module in SHARED_MODULES:
+        sys.modules.pop(module, None)
+
+    sys.path.insert(0, folder)
+    try:
+        start = time.perf_counter()
+        spec = importlib.util.spec_from_file_location(f"bench_{name}", os.path.join(folder, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        return module, time.perf_counter() - start
+    finally:
+        sys.path.remove(folder)
+
+
+###############################################################################################
+# Synthetic config
+
+def members(values):
+    return "".join(f"<member>{x}</member>" for x in values)
+
+
+def generate_config(size, zones, trust_subnet="192.168.77.0/24", seed=1):
+    """
+    Synthetic firewall config, scaled by 'size':
+        size security rules, size/2 NAT rules, size address objects, size/10 address groups
+        (nested up to 3 deep), size/50 interfaces with 4 subinterfaces each.
+
+    :param zones: zone names to use in the rules, ie. the zones the scripts look for
+    :param trust_subnet: some address objects are placed in this subnet
+    :return: XML string, <config>
+    """
+    rand = random.Random(seed)
+    trust_base = trust_subnet.split("/", 1)[0].rsplit(".", 1)[0]
+
+    n_objects = max(size, 10)
+    n_groups = max(size // 10, 3)
+    n_interfaces = max(size // 50, 2)
+
+    # Address objects, 1 in 10 inside the trust subnet
+    objects = []
+    for i in range(n_objects):
+        if i % 10 == 0:
+            ip = f"{trust_base}.{i % 250 + 1}"
+        else:
+            ip = f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"
+        objects.append(f'<entry name="obj-{i}"><ip-netmask>{ip}</ip-netmask></entry>')
+
+    # Address groups, the later groups also contain earlier groups (nesting)
+    groups = []
+    for i in range(n_groups):
+        names = [f"obj-{rand.randrange(n_objects)}" for _ in range(rand.randint(2, 6))]
+        if i >= 3 and rand.random() < 0.3:
+            names.append(f"grp-{rand.randrange(i)}")
+        groups.append(f'<entry name="grp-{i}"><static>{members(names)}</static></entry>')
+
+    # Interfaces, 4 subinterfaces each, every other one with a secondary IP
+    interfaces = []
+    for i in range(n_interfaces):
+        units = "".join(
+            f'<entry name="ethernet1/{i + 1}.{u}"><ip><entry name="172.{16 + u}.{i % 256}.1/24"/>'
+            + (f'<entry name="172.{16 + u}.{i % 256}.2/24"/>' if u % 2 else "")
+            + f"</ip><tag>{u}</tag></entry>"
+            for u in range(1, 5)
+        )
+        interfaces.append(
+            f'<entry name="ethernet1/{i + 1}"><layer3><ip><entry name="203.0.{i % 256}.1/24"/></ip>'
+            f"<units>{units}</units></layer3></entry>"
+        )
+
+    # NAT rules, interface address, translated object, IP and group
+    nat_rules = []
+    for i in range(max(size // 2, 1)):
+        kind = i % 4
+        if kind == 0:
+            snat = f"<dynamic-ip-and-port><interface-address><interface>ethernet1/{i % n_interfaces + 1}</interface></interface-address></dynamic-ip-and-port>"
+        elif kind == 1:
+            snat = f"<static-ip><translated-address>obj-{rand.randrange(n_objects)}</translated-address></static-ip>"
+        elif kind == 2:
+            snat = f"<dynamic-ip-and-port><translated-address>{members([f'203.0.{i % n_interfaces % 256}.{i % 250 + 2}'])}</translated-address></dynamic-ip-and-port>"
+        else:
+            snat = f"<dynamic-ip><translated-address>{members([f'grp-{rand.randrange(n_groups)}'])}</translated-address></dynamic-ip>"
+        nat_rules.append(
+            f'<entry name="nat-{i}"><to>{members(["untrust"])}</to><from>{members(["any"])}</from>'
+            f"<source>{members(['any'])}</source><destination>{members(['any'])}</destination>"
+            f"<service>any</service><source-translation>{snat}</source-translation></entry>"
+        )
+
+    # Security rules
+    addresses = ["any"] * 3 + [f"obj-{i}" for i in range(0, n_objects, max(n_objects // 200, 1))] + [f"grp-{i}" for i in range(n_groups)]
+    security_rules = []
+    for i in range(size):
+        from_zones = rand.sample(zones, rand.randint(1, min(2, len(zones))))
+        to_zones = rand.sample(zones, rand.randint(1, min(2, len(zones))))
+        sources = rand.sample(addresses, rand.randint(1, 3))
+        destinations = rand.sample(addresses, rand.randint(1, 3))
+        security_rules.append(
+            f'<entry name="rule-{i}" uuid="00000000-0000-0000-0000-{i:012d}"><to>{members(to_zones)}</to>'
+            f"<from>{members(from_zones)}</from><source>{members(sources)}</source>"
+            f"<destination>{members(destinations)}</destination><source-user>{members(['any'])}</source-user>"
+            f"<category>{members(['any'])}</category><application>{members(['any'])}</application>"
+            f"<service>{members(['application-default'])}</service><source-hip>{members(['any'])}</source-hip>"
+            f"<destination-hip>{members(['any'])}</destination-hip><action>allow</action>"
+            f"<tag>{members(['bench'])}</tag></entry>"
+        )
+
+    return (
+        '<config version="10.1.0"><devices><entry name="localhost.localdomain">'
+        f'<network><interface><ethernet>{"".join(interfaces)}</ethernet></interface></network>'
+        '<vsys><entry name="vsys1">'
+        f'<address>{"".join(objects)}</address><address-group>{"".join(groups)}</address-group>'
+        f'<rulebase><security><rules>{"".join(security_rules)}</rules></security>'
+        f'<nat><rules>{"".join(nat_rules)}</rules></nat></rulebase>'
+        "</entry></vsys></entry></devices></config>"
+    )
+
+
+###############################################################################################
+# Pipeline stages, each returns (function to time, number of items it processes)
+
+def entries(pa_api, snapshot, xpath, tag):
+    output = snapshot.grab_api_output(xpath)
+    return pa_api.as_list(output["result"][tag].get("entry"))
+
+
+def stages(modules, config):
+    """
+    :param modules: {project: module}
+    :param config: XML string from generate_config()
+    :return: list of (stage name, function, items)
+    """
+    pa_api = modules["garp"].pa_api
+    snapshot = pa_api.ConfigSnapshot.from_string(config)
+    objects = entries(pa_api, snapshot, XPATH_VSYS + "/address", "address")
+    groups = entries(pa_api, snapshot, XPATH_VSYS + "/address-group", "address-group")
+    rules = entries(pa_api, snapshot, pa_api.XPATH_SECURITYRULES, "rules")
+    interfaces = snapshot.grab_api_output(pa_api.XPATH_INTERFACES)["result"]["interface"]
+    nat_rules = snapshot.grab_api_output(pa_api.XPATH_NAT_RULES)["result"]["rules"]
+
+    def parse():
+        snap = pa_api.ConfigSnapshot.from_string(config)
+        for xpath in (pa_api.XPATH_SECURITYRULES, pa_api.XPATH_NAT_RULES, pa_api.XPATH_INTERFACES):
+            snap.grab_api_output(xpath)
+
+    def resolver():
+        resolver = pa_api.AddressResolver(objects, groups)
+        for grp in groups:
+            resolver.resolve(grp["@name"])
+
+    garp = modules["garp"]
+
+    def garp_commands():
+        garp.build_garp_output({
+            "interfaces": interfaces,
+            "pre-nat-rules": None,
+            "post/nat-rules": nat_rules,
+            "resolver": garp.pa_api.AddressResolver(objects, groups),
+        })
+
+    eastwest = modules["eastwest"]
+
+    def eastwest_addnew_zone():
+        eastwest.mem.resolver = eastwest.pa_api.AddressResolver(objects, groups)
+        eastwest.mem.matcher = None
+        eastwest.mem.trust_matches = {}
+        eastwest.eastwest_addnew_zone(rules)
+
+    becu = modules["becu"]
+    suu = modules["suu"]
+    suu_zone = next(iter(becu.settings.EXISTING_PRIVATE_ZONES))
+
+    return [
+        ("parse (snapshot)", parse, len(rules) + len(nat_rules["entry"])),
+        ("address resolver", resolver, len(objects) + len(groups)),
+        ("garp.build_garp_output", garp_commands, len(nat_rules["entry"]) + len(interfaces["ethernet"]["entry"])),
+        ("eastwest_addnew_zone", eastwest_addnew_zone, len(rules)),
+        ("becu.modify_rules", lambda: becu.modify_rules(rules), len(rules)),
+        ("suu_copy.copy_rules", lambda: suu.copy_rules(rules, suu_zone), len(rules)),
+    ]
+
+
+def measure(func, repeat):
+    """
+    :return: (best seconds of 'repeat' runs, peak bytes)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes, repeat=1, write=None):
+    """
+    Main point of entry.
+
+    :param sizes: list of config sizes (security rules), see generate_config()
+    :param repeat: runs per stage, the best time is kept
+    :param write: optional filename, the largest config is written to it
+    :return: results dictionary, imports and per-stage results per size
+    """
+    results = {"imports": {}, "stages": {}}
+
+    # Work from a temp folder, the scripts write review/output files
+    cwd = os.getcwd()
+    os.chdir(tempfile.mkdtemp(prefix="pa-bench-"))
+    try:
+        modules = {}
+        for name in PROJECTS:
+            modules[name], results["imports"][name] = load_project(name)
+
+        print("\nImport times:")
+        print("-------------------------------------------------------------------------")
+        for name, seconds in results["imports"].items():
+            print(f"{name:<28}{seconds * 1000:>10.1f} ms")
+
+        zones = sorted(
+            {modules["eastwest"].settings.EXISTING_TRUST_ZONE, "untrust", "dmz-bench"}
+            | set(modules["becu"].settings.EXISTING_PRIVATE_ZONES)
+        )
+
+        for size in sizes:
+            start = time.perf_counter()
+            config = generate_config(size, zones, modules["eastwest"].settings.EXISTING_TRUST_SUBNET[0])
+            print(f"\nSize {size}: config {len(config) / 1e6:.1f} MB, generated in {time.perf_counter() - start:.2f}s")
+            if write and size == max(sizes):
+                with open(os.path.join(cwd, write), "w") as fout:
+                    fout.write(config)
+
+            print("-------------------------------------------------------------------------")
+            print(f"{'stage':<28}{'items':>8}{'seconds':>12}{'items/s':>12}{'peak MB':>10}")
+            for name, func, items in stages(modules, config):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    seconds, peak = measure(func, repeat)
+                results["stages"].setdefault(name, []).append(
+                    {"size": size, "items": items, "seconds": seconds, "peak_bytes": peak}
+                )
+                print(f"{name:<28}{items:>8}{seconds:>12.4f}{items / seconds if seconds else 0:>12.0f}{peak / 1e6:>10.1f}")
+    finally:
+        os.chdir(cwd)
+
+    # Scaling, time ~ size^k, k ~ 1 is linear
+    if len(sizes) > 1:
+        print("\nScaling (time ~ size^k):")
+        print("-------------------------------------------------------------------------")
+        for name, runs in results["stages"].items():
+            curve = []
+            for a, b in zip(runs, runs[1:]):
+                if a["seconds"] and b["seconds"] and b["items"] != a["items"]:
+                    curve.append(math.log(b["seconds"] / a["seconds"]) / math.log(b["items"] / a["items"]))
+            print(f"{name:<28}" + "".join(f"{k:>8.2f}" for k in curve))
+
+    return results
+
+
+# If run from the command line
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Offline benchmark with synthetic configs")
+    parser.add_argument("-n", "--sizes", help="Config sizes (security rules), ie. 1000,5000,20000", type=str, default="1000,5000,20000")
+    parser.add_argument("-r", "--repeat", help="Runs per stage, the best time is kept", type=int, default=1)
+    parser.add_argument("-j", "--json", help="Write the results to this .json file", type=str)
+    parser.add_argument("-w", "--write", help="Write the largest generated config to this file", type=str)
+    args = parser.parse_args()
+
+    sizes = sorted(int(x) for x in args.sizes.split(","))
+    results = run(sizes, args.repeat, args.write)
+    if args.json:
+        with open(args.json, "w") as fout:
+            json.dump(results, fout, indent=4)
+        print(f"\nResults written to {args.json}")
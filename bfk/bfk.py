@@ -1,5 +1,3 @@
-import copy
-
 def modify(security_rules):
 
     modified_rules = []
@@ -13,7 +11,8 @@ def modify(security_rules):
 
     for oldrule in security_rules:
 
-        newrule = copy.deepcopy(oldrule)
+        # Shallow copy, only the changed fields are replaced (never modified in place), so oldrule is untouched
+        newrule = oldrule.copy()
 
         from_zone = oldrule["from"]["member"]
         to_zone = oldrule["to"]["member"]
@@ -28,8 +27,8 @@ def modify(security_rules):
         print(f"From Zone = {from_zone}, Source Addr = {src_addr}")
         print(f"To Zone = {to_zone}, Destination Addr = {dst_addr}\n")
 
-        newrule["source"]["member"] = "MODIFIED!"
-        newrule["from"]["member"] = ["zone1"]
+        newrule["source"] = {"member": "MODIFIED!"}
+        newrule["from"] = {"member": ["zone1"]}
         newrule["from"]["member"].append("zone2")
 
         modified_rules.append(newrule)
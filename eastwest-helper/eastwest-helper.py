@@ -7,6 +7,7 @@ Description:
 Requires:
     requests
     xmltodict
+    numpy (optional, faster subnet checks)
         to install try: pip3 install -r requirements.txt
 
 Author:
@@ -41,11 +42,8 @@ import os
 import concurrent.futures
 import json
 import time
-import xml.dom.minidom
-import copy
 import argparse
 
-import ipcalc
 import xmltodict
 import api_lib_pa as pa_api
 import zone_settings as settings
@@ -55,6 +53,10 @@ import zone_settings as settings
 class mem:
     address_object_entries = None
     address_group_entries = None
+    resolver = pa_api.AddressResolver()
+    resolvers = {}          # device group: AddressResolver, --device-groups worker processes
+    matcher = None          # pa_api.SubnetMatcher(settings.EXISTING_TRUST_SUBNET)
+    trust_matches = {}      # address/group name: True if it overlaps EXISTING_TRUST_SUBNET
 
 def grab_xml_or_json_file(filename):
     """
@@ -90,57 +92,25 @@ def error_check(response, operation):
 
 
 def address_group_lookup(entry):
-
-    found = False
-
-    for addr_group in mem.address_group_entries:
-        if entry in addr_group.get("@name"):
-            if "member" in addr_group.get("static"):
-                found = True
-                member_objects = addr_group["static"]["member"]
-            else:
-                print("Not supported, hi.")
-    
-    if not found:
+    """
+    Expand an address group (nested groups included) to it's IP addresses.
+    Returns a LIST, or None if entry isn't an address group
+    """
+    if not mem.resolver.is_group(entry):
         return None
-    else:
-        ips = []
-        for member in member_objects:
-            ips += address_lookup(member)
-        
-        return ips
+    return mem.resolver.resolve(entry)
 
 
 def address_lookup(entry):
     """
-    Used to find the translated addresses objects on the PA/Panorama.
-    Runs another api call to grab the object and return it's value (the actual ip address)
-    If the NAT rule isn't using an object, we can assume this value is the IP address.
+    Used to find the addresses objects on the PA/Panorama, and return it's value (the actual ip address)
+    If the rule isn't using an object, we can assume this value is the IP address.
     Returns a LIST
     """
-
-    found = False
-    for addr_object in mem.address_object_entries:
-        if entry in addr_object.get("@name"):
-            if "ip-netmask" in addr_object:
-                found = True
-                ips = addr_object["ip-netmask"]
-            else:
-                found = True
-                ips = ['1.1.1.1']
-                #add_review_entry(addr_object, "not-ip-netmask")
-    if not found:
-        ips = entry
-
-    if isinstance(ips,list):
-        pass # Good (for now)
-    else:
-        ips = [ips]
-
-    return ips # Always returns a list (currently)
+    return mem.resolver.resolve(entry) # Always returns a list (currently)
 
 
-def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None):
+def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None, fetched_rules=None):
 
     # Always create an output file with the modified-rules.
     if not filename:
@@ -148,13 +118,8 @@ def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None):
     # Prepare output
     add_entry_tag = {"entry": modified_rules}   # Adds the <entry> tag to each rule
     modified_rules_xml = {"config": {"security": {"rules": add_entry_tag} } } # Provides an xpath for importing
-    data = xmltodict.unparse(modified_rules_xml)    # Turn XML into a string
-    prettyxml = xml.dom.minidom.parseString(data).toprettyxml() # Pretty-fi the XML before creating file
-    prettyxml = prettyxml.replace('<?xml version="1.0" ?>', "") # Can't import with this in the XML, remove it
     # Create output file
-    with open(filename, "w") as fout:
-        fout.write(prettyxml)
-        print(f"\nOutput at: {filename}\n")
+    pa_api.write_config_file(modified_rules_xml, filename)
 
     if settings.PUSH_CONFIG_TO_PA:
         # Ask for filename
@@ -189,9 +154,7 @@ def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None):
                     xpath = xpath.replace(pa.device_group, new_device_group)
 
             fname = filename.rsplit('/', 1)[1]  # Get filename, strip any folders before the filename.
-            load_url = f"https://{pa.pa_ip}:443/api/?type=op&key={pa.key}&cmd=<load><config><partial><mode>replace</mode><from-xpath>/config/security/rules</from-xpath><to-xpath>{xpath}</to-xpath><from>{fname}</from></partial></config></load>"
-            
-            response = pa.session[pa.pa_ip].get(load_url, verify=False)
+            response = pa.load_partial_config(fname, "/config/security/rules", xpath)
             error_check(response, "Loading Configuration")
 
             print("\nCandidate configuration successfully loaded...enjoy the new ruleset!")
@@ -202,142 +165,172 @@ def output_and_push_changes(modified_rules, filename=None, xpath=None, pa=None):
     return None
 
 
-def addr_obj_check(addrobj):
+def trust_subnet_matcher():
+    if not mem.matcher or mem.matcher.subnets != list(settings.EXISTING_TRUST_SUBNET):
+        mem.matcher = pa_api.SubnetMatcher(settings.EXISTING_TRUST_SUBNET)
+        mem.trust_matches = {}
+    return mem.matcher
 
-    ips = address_group_lookup(addrobj)
-    if not ips:
-        ips = address_lookup(addrobj)
 
-    found = False
-    for ip in ips:
-        try:
-            tip = address_group_lookup(ip) # One level of nested address groups, just in case..
-            if not tip:
-                tip = ip
-            iprange = ipcalc.Network(tip)
+def rule_members(sec_rule, srcdst, tofrom):
+    """
+    Source/destination members of a Rule, only if the matching zone is EXISTING_TRUST_ZONE.
+    Returns a LIST
+    """
+    if settings.EXISTING_TRUST_ZONE not in getattr(sec_rule, tofrom):
+        return []
+    return [x for x in getattr(sec_rule, srcdst) if x != "any"]
 
-            for subnet in settings.EXISTING_TRUST_SUBNET:
-                if subnet in iprange:
-                    found = True
 
-            if found:
-                return True
-            else:
-                pass
+def precompute_trust_matches(security_rules):
+    """
+    Check every address/group used with EXISTING_TRUST_ZONE against EXISTING_TRUST_SUBNET 
+    in one vectorized pass (pa_api.SubnetMatcher), so addr_obj_check() is a dictionary lookup.
+    """
+    matcher = trust_subnet_matcher()
+    names = set()
+    for sec_rule in security_rules:
+        names.update(rule_members(sec_rule, "source", "from_zone"))
+        names.update(rule_members(sec_rule, "destination", "to_zone"))
+    names = [name for name in names if name not in mem.trust_matches]
 
-        except:
-            print("Not supported, call me.")
-    
-    return False
+    mask = matcher.mask([address_lookup(name) for name in names])
+    mem.trust_matches.update(zip(names, (bool(x) for x in mask)))
+
+
+def trust_rule_mask(security_rules, subnets=None):
+    """
+    Which rules use an address within the subnets (default: EXISTING_TRUST_SUBNET) 
+    on their EXISTING_TRUST_ZONE side(s).
+
+    :param subnets: optional list of subnets, returns one column per subnet instead
+    :return: boolean array, one row per rule
+    """
+    address_sets = []
+    for sec_rule in security_rules:
+        addresses = []
+        for name in rule_members(sec_rule, "source", "from_zone") + rule_members(sec_rule, "destination", "to_zone"):
+            addresses += address_lookup(name)
+        address_sets.append(addresses)
+
+    if subnets:
+        return pa_api.SubnetMatcher(subnets).matrix(address_sets)
+    return trust_subnet_matcher().mask(address_sets)
+
+
+def plan_subnets(security_rules, subnets, label=""):
+    """
+    Print how many rules each candidate subnet would affect, without modifying anything.
+    """
+    if isinstance(security_rules, dict):
+        security_rules = [security_rules]
+    security_rules = [pa_api.Rule.from_dict(x) for x in security_rules]
+    matrix = trust_rule_mask(security_rules, subnets)
+
+    print(f"\nPlanning {label}({len(security_rules)} rules, zone {settings.EXISTING_TRUST_ZONE}):")
+    print("--------------------------------------------")
+    for index, subnet in enumerate(subnets):
+        matched = [rule.name for rule, row in zip(security_rules, matrix) if row[index]]
+        print(f"{subnet:<20}{len(matched)} rules")
+        for name in matched:
+            print(f"\t{name}")
+    print("--------------------------------------------\n")
+
+
+def addr_obj_check(addrobj):
+
+    # Already checked (precompute_trust_matches)
+    if addrobj in mem.trust_matches:
+        return mem.trust_matches[addrobj]
+
+    # Address objects and groups (including nested groups) resolved to their IP's
+    ips = address_lookup(addrobj)
+    found = trust_subnet_matcher().overlaps(ips)
+    mem.trust_matches[addrobj] = found
+
+    return found
 
 
 def should_be_cloned(sec_rule):
     """
-    inner function (possibly to be moved outside later)
     The bulk of the logic for rule modification is done here
-    Source & destination behave the same, this allows the same code to be used for both.
 
-    :param srcdst: the xml ZONE tag needed for insertion into the new rule
-    :param tofrom: the xml Address-Object tag needed for insertion into the new rule
-    :param x_zone: from or to, zone name
-    :param x_addr: source or destination, address/group object
+    :param sec_rule: Rule
+    :return: the new (cloned) Rule, or False
     """
     def add_tag(tag):
-        if "tag" in new_rule:
-            if isinstance(new_rule["tag"]["member"], list):
-                new_rule["tag"]["member"].append(tag)
-            else:
-                temp = new_rule["tag"]["member"]
-                new_rule["tag"]["member"] = [temp, tag]
-        else:
-            new_rule["tag"] = {"member":tag}
+        nonlocal new_rule
+        new_rule = new_rule.replace(tag=new_rule.tag + (tag,))
 
 
-    def check_and_modify(srcdst, tofrom, x_zone, x_addr):
+    def check_and_modify(srcdst, tofrom):
         """
         inner function (possibly to be moved outside later)
         The bulk of the logic for zone modification is done here
         Source & destination behave the same, this allows the same code to be used for both.
 
-        :param srcdst: the xml ZONE tag needed for insertion into the new rule
-        :param tofrom: the xml Address-Object tag needed for insertion into the new rule
-        :param x_zone: from or to, zone name
-        :param x_addr: source or destination, address/group object
+        :param srcdst: source or destination, the Rule's address/group objects
+        :param tofrom: from_zone or to_zone, the Rule's zones
         """
+        nonlocal new_rule
         clone = False
         singleip = False
         for subnet in settings.EXISTING_TRUST_SUBNET:
             if subnet.endswith("/32"):
                 singleip = True
 
-        try:
-            if not isinstance(x_zone, list):
-                x_zone = [x_zone]
-                new_rule[tofrom]["member"] = [new_rule[tofrom]["member"]]
-            if not isinstance(x_addr, list):
-                x_addr = [x_addr]
-                new_rule[srcdst]["member"] = [new_rule[srcdst]["member"]]
-
-            for zone in x_zone: 
-                if zone == settings.EXISTING_TRUST_ZONE:
-                    for addrobj in x_addr:
-                        if addrobj == "any":
-                            if not singleip:
-                                # Clone/Modify this
-                                clone = True
-                                new_rule[tofrom]["member"].remove(zone) if zone in new_rule[tofrom]["member"] else clone
-                                if settings.NEW_EASTWEST_ZONE not in new_rule[tofrom]["member"]:
-                                    new_rule[tofrom]["member"].append(settings.NEW_EASTWEST_ZONE)
-                            else:
-                                # Single-IP, only clone/tag for review the rules relevant to the single IP
-                                pass
+        zones = list(getattr(new_rule, tofrom))
+        addrs = list(getattr(new_rule, srcdst))
+
+        for zone in getattr(sec_rule, tofrom): 
+            if zone == settings.EXISTING_TRUST_ZONE:
+                for addrobj in getattr(sec_rule, srcdst):
+                    if addrobj == "any":
+                        if not singleip:
+                            # Clone/Modify this
+                            clone = True
+                            zones.remove(zone) if zone in zones else clone
+                            if settings.NEW_EASTWEST_ZONE not in zones:
+                                zones.append(settings.NEW_EASTWEST_ZONE)
                         else:
-                            # Check address object against EXISTING_TRUST_SUBNET
-                            tag = addr_obj_check(addrobj)
-                            if tag:
-                                clone = True
-                                add_tag(settings.REVIEW_TAG)
-                                new_rule[tofrom]["member"].remove(zone) if zone in new_rule[tofrom]["member"] else clone
-                                if settings.NEW_EASTWEST_ZONE not in new_rule[tofrom]["member"]:
-                                    new_rule[tofrom]["member"].append(settings.NEW_EASTWEST_ZONE)
-                            else:
-                                # Don't need this address object even if we end up cloning the rule.
-                                new_rule[srcdst]["member"].remove(addrobj)
-
-                else:
-                    # ZONE NOT RELEVANT TO THIS DISCUSSION
-                    pass
+                            # Single-IP, only clone/tag for review the rules relevant to the single IP
+                            pass
+                    else:
+                        # Check address object against EXISTING_TRUST_SUBNET
+                        tag = addr_obj_check(addrobj)
+                        if tag:
+                            clone = True
+                            add_tag(settings.REVIEW_TAG)
+                            zones.remove(zone) if zone in zones else clone
+                            if settings.NEW_EASTWEST_ZONE not in zones:
+                                zones.append(settings.NEW_EASTWEST_ZONE)
+                        else:
+                            # Don't need this address object even if we end up cloning the rule.
+                            addrs.remove(addrobj)
 
-        except TypeError:
-            print("\nError, candidate config detected. Please commit or revert changes before proceeding.\n")
-            sys.exit(0)              
+            else:
+                # ZONE NOT RELEVANT TO THIS DISCUSSION
+                pass
 
-        # If I only made it a list to make it easier on myself, change it back.
-        if len(new_rule[tofrom]["member"]) == 1:
-            new_rule[tofrom]["member"] = new_rule[tofrom]["member"][0]
-        if len(new_rule[srcdst]["member"]) == 1:
-            new_rule[srcdst]["member"] = new_rule[srcdst]["member"][0]
+        # Copy-on-write, sec_rule is never modified
+        if tuple(zones) != getattr(new_rule, tofrom) or tuple(addrs) != getattr(new_rule, srcdst):
+            new_rule = new_rule.replace(**{tofrom: zones, srcdst: addrs})
         
         # Return True/False
         if clone:
             add_tag(settings.CLONED_TAG)
-            new_rule["@name"] = new_rule["@name"] + settings.CLONED_SUFFIX
+            new_rule = new_rule.replace(name=new_rule.name + settings.CLONED_SUFFIX)
         return clone
     
-    new_rule = copy.deepcopy(sec_rule)
-
-    from_zone = sec_rule["from"]["member"]
-    to_zone = sec_rule["to"]["member"]
-    src_addr = sec_rule["source"]["member"]
-    dst_addr = sec_rule["destination"]["member"]
+    new_rule = sec_rule
 
     # Check and modify to intra-zone based rules
-    clone = check_and_modify("source", "from", from_zone,src_addr)
+    clone = check_and_modify("source", "from_zone")
 
     if clone:
-        check_and_modify("destination", "to", to_zone,dst_addr)
+        check_and_modify("destination", "to_zone")
     else:
-        clone = check_and_modify("destination", "to", to_zone,dst_addr)
+        clone = check_and_modify("destination", "to_zone")
 
     # Return new_rule or False
     if clone:
@@ -351,7 +344,7 @@ def eastwest_addnew_zone(security_rules):
     MODIFY SECURITY RULES
     This accepts a dictionary of rules and 
 
-    :param security_rules: existing security rules
+    :param security_rules: existing security rules (list, single rule, or generator from iter_api_entries)
     :return: modified_rules, new/modified security rule-set
     """
 
@@ -362,18 +355,31 @@ def eastwest_addnew_zone(security_rules):
     def eastwest_clone(sec_rule):
         new_ruleset.append(sec_rule)
         return None
+
+    def to_rule(oldrule):
+        rule = pa_api.Rule.from_dict(oldrule)
+        if not rule.parsed:
+            print("\nError, candidate config detected. Please commit or revert changes before proceeding.\n")
+            sys.exit(0)
+        return oldrule, rule
     
     new_ruleset = []
-    if not isinstance(security_rules, list):
+    if isinstance(security_rules, dict):
         security_rules = [security_rules]
+    if isinstance(security_rules, list):
+        # Whole rulebase available, check all the address objects at once
+        security_rules = [to_rule(x) for x in security_rules]
+        precompute_trust_matches([rule for _, rule in security_rules])
+    else:
+        security_rules = (to_rule(x) for x in security_rules)
     print("\nModifying...\n")
 
-    for oldrule in security_rules:
+    for oldrule, rule in security_rules:
 
         # Check if rule should be cloned
-        new_rule = should_be_cloned(oldrule)
+        new_rule = should_be_cloned(rule)
         if new_rule:
-            eastwest_clone(new_rule)
+            eastwest_clone(new_rule.to_dict())
             eastwest_add(oldrule)
         else:
             eastwest_add(oldrule)
@@ -403,16 +409,142 @@ def get_device_group(pa):
 
 
 
-def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
+def retarget_device_group(pa, xpaths):
+    """
+    --batch on Panorama, load into the existing Device Group or pick another one.
+
+    :param xpaths: rulebase xpaths with the current device group
+    :return: xpaths to load into
+    """
+    if not pa.device_group:
+        return xpaths
+
+    same_dg = ""
+    while same_dg.lower() not in ("y", "n"):
+        same_dg = input(f"Push to existing Device Group ({pa.device_group})? [y/n]: ")
+
+    # Update xpaths to new device-group
+    if same_dg == "n":
+        new_device_group = get_device_group(pa)
+        xpaths = [xpath.replace(pa.device_group, new_device_group) for xpath in xpaths]
+    return xpaths
+
+
+def sweep_init(resolvers):
+    """
+    Worker process setup (--device-groups), every device group's resolver is sent once per process.
+    The Shared/parent DG objects are shared by the resolvers, so they are only pickled once.
+    """
+    mem.resolvers = resolvers
+
+
+def sweep_device_group(job):
+    """
+    Modify one device group's pre & post rules, run in a worker process (--device-groups).
+
+    :param job: (device group, pre-rules, post-rules)
+    :return: (modified pre-rules, modified post-rules)
+    """
+    device_group, pre_rules, post_rules = job
+    mem.resolver = mem.resolvers[device_group]
+    mem.trust_matches = {}
+
+    print(f"\nDevice Group: {device_group}")
+    modified_rules_pre = eastwest_addnew_zone(pre_rules) if pre_rules else []
+    modified_rules_post = eastwest_addnew_zone(post_rules) if post_rules else []
+    return modified_rules_pre, modified_rules_post
+
+
+def sweep_device_groups(pa, device_groups, plan=None):
+    """
+    Sweep mode (--device-groups), non-interactive.
+    Grabs every device group's objects and rules at once, Shared and the parent device groups
+    only once for all of them, then modifies the device groups in worker processes.
+
+    :param device_groups: list of device group names, or ["all"]
+    :param plan: list of candidate subnets, only report which rules each subnet would affect
+    :return: to_output list, [modified_rules, filename, xpath, pa, fetched rules]
+    """
+    if device_groups == ["all"]:
+        device_groups, _ = pa.grab_panorama_objects()
+    pa.device_group = None  # More than one
+
+    # Every device group's rules
+    rule_jobs = {}
+    for dg in device_groups:
+        rule_jobs[dg] = (
+            (pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", dg), f"output/api/{dg}-pre-rules.xml"),
+            (pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", dg), f"output/api/{dg}-post-rules.xml"),
+        )
+
+    # Objects of every device group, their parents and Shared (each level once), and the rules
+    print(f"Grabbing the address objects, groups and rules for {len(device_groups)} Device Groups..")
+    cache = pa_api.DeviceGroupCache(pa)
+    api_output = cache.prefetch(device_groups, jobs=[job for jobs in rule_jobs.values() for job in jobs])
+
+    def entries(job):
+        output = api_output[job]
+        if output and output.get("result") and output["result"].get("rules"):
+            return pa_api.as_list(output["result"]["rules"].get("entry"))
+        return []
+
+    # Parsed once per level, shared by every device group below it
+    resolvers = {dg: cache.resolver(dg) for dg in device_groups}
+    jobs = [(dg, entries(pre_job), entries(post_job)) for dg, (pre_job, post_job) in rule_jobs.items()]
+
+    if plan:
+        for dg, pre_rules, post_rules in jobs:
+            mem.resolver = resolvers[dg]
+            mem.trust_matches = {}
+            plan_subnets(pre_rules, plan, f"{dg} pre-rules ")
+            plan_subnets(post_rules, plan, f"{dg} post-rules ")
+        return []
+
+    with concurrent.futures.ProcessPoolExecutor(initializer=sweep_init, initargs=(resolvers,)) as executor:
+        results = list(executor.map(sweep_device_group, jobs))
+
+    to_output = []
+    for (dg, pre_rules, post_rules), (modified_rules_pre, modified_rules_post) in zip(jobs, results):
+        if pre_rules:
+            XPATH_PRE = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", dg)
+            to_output.append([modified_rules_pre, f"output/{dg}-modified-pre-rules.xml", XPATH_PRE, pa, pre_rules])
+        if post_rules:
+            XPATH_POST = pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", dg)
+            to_output.append([modified_rules_post, f"output/{dg}-modified-post-rules.xml", XPATH_POST, pa, post_rules])
+    return to_output
+
+
+def eastwesthelper(pa_ip, username, password, pa_type, filename=None, stream=False, plan=None, batch=False, diff=False, device_groups=None, snapshot=None, record=None, replay=None):
     """
     Main point of entry.
     Connect to PA/Panorama.
     Grab security rules from pa/pan.
     Modify them for intra-zone migration.
+    If stream, rules are modified one at a time as they are downloaded (large rulebases)
+    If plan (list of candidate subnets), only report which rules each subnet would affect.
+    If batch, pre & post rules are uploaded as one named config and loaded in one pass
+    If diff, only the cloned/changed rules are pushed (set/edit/move) instead of replacing the rulebases
+    If device_groups (list or ["all"]), sweep those Device Groups without prompting, always pushed as a batch/diff
+    If snapshot ("running" or "candidate"), the whole config is grabbed once instead of one API call per xpath
+    If record (folder), every API response is saved for replay.
+    If replay (folder), every API call is answered from a record folder, offline.
     """
 
-    if pa_type != "xml":
+    def modify_rules(security_rules, label=""):
+        if plan:
+            plan_subnets(security_rules, plan, label)
+            return []
+        return eastwest_addnew_zone(security_rules)
+
+    if replay:
+        pa = pa_api.api_lib_pa.replay(replay, pa_type)
+        pa_type = pa.pa_type
+    elif pa_type != "xml":
         pa = pa_api.api_lib_pa(pa_ip, username, password, pa_type)
+        if record:
+            pa.record(record)
+    if snapshot and pa_type != "xml":
+        pa.use_snapshot(snapshot, f"output/api/{snapshot}-config.xml")
     to_output = []
 
     if pa_type == "xml":
@@ -420,8 +552,17 @@ def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
         start = time.perf_counter()
         # Grab XML file, modify rules, and create output file.
         security_rules = grab_xml_or_json_file(filename)
-        modified_rules = eastwest_addnew_zone(security_rules["result"]["rules"]["entry"])
-        output_and_push_changes(modified_rules, "output/modified-xml-rules.xml")
+        modified_rules = modify_rules(security_rules["result"]["rules"]["entry"])
+        if not plan:
+            output_and_push_changes(modified_rules, "output/modified-xml-rules.xml")
+
+    elif pa_type == "panorama" and device_groups:
+        # Grab 'start' time
+        start = time.perf_counter()
+        # Sweep the Device Groups, non-interactive
+        to_output = sweep_device_groups(pa, device_groups, plan)
+        if not diff:
+            batch = True
 
     elif pa_type == "panorama":
 
@@ -432,66 +573,45 @@ def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
         start = time.perf_counter()
     
         # Set the XPath now that we have the Device Group
-        XPATH_ADDR_OBJ = pa_api.XPATH_ADDRESS_OBJ_PAN.replace("DEVICE_GROUP", pa.device_group)
-        XPATH_ADDR_GRP = pa_api.XPATH_ADDRESS_GROUP_PAN.replace("DEVICE_GROUP", pa.device_group)
         XPATH_PRE = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", pa.device_group)
         XPATH_POST = pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", pa.device_group)
-
-        # Grab Rules
-        mem.address_object_entries = pa.grab_address_objects("xml", XPATH_ADDR_OBJ, "output/api/address-objects.xml")
-        mem.address_group_entries = pa.grab_address_groups("xml", XPATH_ADDR_GRP, "output/api/address-groups.xml")
-
-        if not isinstance(mem.address_object_entries, list):
-            mem.address_object_entries = [mem.address_object_entries]
-        if not isinstance(mem.address_group_entries,list):
-            mem.address_group_entries = [mem.address_group_entries]
-
-        shared_objs = pa.grab_address_objects("xml", pa_api.XPATH_ADDRESS_OBJ_SHARED, "output/api/shared-address-objects.xml")
-        if shared_objs:
-            if not isinstance(shared_objs, list):
-                shared_objs = [shared_objs]
-            mem.address_object_entries += shared_objs
-        
-        print("Grabbing the Shared address objects and groups..")
-        shared_grps = pa.grab_address_groups("xml", pa_api.XPATH_ADDRESS_GRP_SHARED, "output/api/shared-address-groups.xml")
-        if shared_grps:
-            if not isinstance(shared_grps, list):
-                shared_grps = [shared_grps]
-            mem.address_group_entries += shared_grps
-
-        if settings.OBJ_PARENT_DEVICE_GROUP:
-            XPATH_ADDR = pa_api.XPATH_ADDRESS_OBJ_PAN.replace("DEVICE_GROUP", settings.OBJ_PARENT_DEVICE_GROUP)
-            XPATH_GRP = pa_api.XPATH_ADDRESS_GROUP_PAN.replace("DEVICE_GROUP", settings.OBJ_PARENT_DEVICE_GROUP)
-
-            print(f"Grabbing the {settings.OBJ_PARENT_DEVICE_GROUP} address objects and groups..")
-            shared_objs = pa.grab_address_objects("xml", XPATH_ADDR, f"output/api/{settings.OBJ_PARENT_DEVICE_GROUP}-address-objects.xml")
-            if shared_objs:
-                if not isinstance(shared_objs, list):
-                    shared_objs = [shared_objs]
-                mem.address_object_entries += shared_objs
-            
-            shared_grps = pa.grab_address_groups("xml", XPATH_GRP, f"output/api/{settings.OBJ_PARENT_DEVICE_GROUP}-address-groups.xml")
-            if shared_grps:
-                if not isinstance(shared_grps, list):
-                    shared_grps = [shared_grps]
-                mem.address_group_entries += shared_grps
-
-        pre_security_rules = pa.grab_api_output("xml", XPATH_PRE, "output/api/pre-rules.xml")
-        post_security_rules = pa.grab_api_output("xml", XPATH_POST, "output/api/post-rules.xml")
-
-        # Modify the rules, Pre & Post, then append to output list
-        if pre_security_rules:
-            if pre_security_rules["result"]:
-                if pre_security_rules["result"]["rules"]:
-                    if "entry" in pre_security_rules["result"]["rules"]:
-                        modified_rules_pre = eastwest_addnew_zone(pre_security_rules["result"]["rules"]["entry"])
-                        to_output.append([modified_rules_pre,"output/modified-pre-rules.xml", XPATH_PRE, pa])
-        if post_security_rules:
-            if post_security_rules["result"]:
-                if post_security_rules["result"]["rules"]:
-                    if "entry" in post_security_rules["result"]["rules"]:
-                        modified_rules_post = eastwest_addnew_zone(post_security_rules["result"]["rules"]["entry"])
-                        to_output.append([modified_rules_post,"output/modified-post-rules.xml", XPATH_POST, pa])
+        PRE_JOB = (XPATH_PRE, "output/api/pre-rules.xml")
+        POST_JOB = (XPATH_POST, "output/api/post-rules.xml")
+
+        # Grab Objects (Device Group, parent Device Groups and Shared) and Rules, all at once
+        print("Grabbing the address objects, groups and rules..")
+        rule_jobs = [] if stream else [PRE_JOB, POST_JOB]
+        cache = pa_api.DeviceGroupCache(pa)
+        api_output = cache.prefetch([pa.device_group], jobs=rule_jobs)
+        mem.resolver = cache.resolver(pa.device_group)
+
+        if stream:
+            # Modify the rules as they are downloaded, Pre & Post, then append to output list
+            fetched_pre = [] if diff else None
+            modified_rules_pre = modify_rules(pa_api.tee_entries(pa.iter_api_entries(XPATH_PRE, "output/api/pre-rules.xml"), fetched_pre), "pre-rules ")
+            if modified_rules_pre:
+                to_output.append([modified_rules_pre,"output/modified-pre-rules.xml", XPATH_PRE, pa, fetched_pre])
+            fetched_post = [] if diff else None
+            modified_rules_post = modify_rules(pa_api.tee_entries(pa.iter_api_entries(XPATH_POST, "output/api/post-rules.xml"), fetched_post), "post-rules ")
+            if modified_rules_post:
+                to_output.append([modified_rules_post,"output/modified-post-rules.xml", XPATH_POST, pa, fetched_post])
+        else:
+            pre_security_rules = api_output[PRE_JOB]
+            post_security_rules = api_output[POST_JOB]
+
+            # Modify the rules, Pre & Post, then append to output list
+            if pre_security_rules:
+                if pre_security_rules["result"]:
+                    if pre_security_rules["result"]["rules"]:
+                        if "entry" in pre_security_rules["result"]["rules"]:
+                            modified_rules_pre = modify_rules(pre_security_rules["result"]["rules"]["entry"], "pre-rules ")
+                            to_output.append([modified_rules_pre,"output/modified-pre-rules.xml", XPATH_PRE, pa, pre_security_rules["result"]["rules"]["entry"]])
+            if post_security_rules:
+                if post_security_rules["result"]:
+                    if post_security_rules["result"]["rules"]:
+                        if "entry" in post_security_rules["result"]["rules"]:
+                            modified_rules_post = modify_rules(post_security_rules["result"]["rules"]["entry"], "post-rules ")
+                            to_output.append([modified_rules_post,"output/modified-post-rules.xml", XPATH_POST, pa, post_security_rules["result"]["rules"]["entry"]])
             
     elif pa_type == "pa":
         # Grab 'start' time
@@ -500,23 +620,42 @@ def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
         XPATH = pa_api.XPATH_SECURITYRULES
         XPATH_ADDR_OBJ = pa_api.XPATH_ADDRESS_OBJ
         XPATH_ADDR_GRP = pa_api.XPATH_ADDRESS_GRP
-        mem.address_object_entries = pa.grab_address_objects("xml", XPATH_ADDR_OBJ, "output/api/address-objects.xml")
-        address_groups = pa.grab_address_groups("xml", XPATH_ADDR_GRP, "output/api/address-groups.xml")
+        OBJ_JOB = (XPATH_ADDR_OBJ, "output/api/address-objects.xml")
+        GRP_JOB = (XPATH_ADDR_GRP, "output/api/address-groups.xml")
+        RULES_JOB = (XPATH, "output/api/pa-rules.xml")
+        rule_jobs = [] if stream else [RULES_JOB]
+        api_output = pa.grab_api_output_batch([OBJ_JOB, GRP_JOB] + rule_jobs)
+
+        mem.address_object_entries = pa_api.validate_entries(api_output[OBJ_JOB], "address")
+        address_groups = pa_api.validate_entries(api_output[GRP_JOB], "address-group")
         if address_groups:
             if not isinstance(address_groups, list):
-                print('notlist')
                 mem.address_group_entries = [address_groups]
             else:
                 mem.address_group_entries = address_groups
-        security_rules = pa.grab_api_output("xml", XPATH, "output/api/pa-rules.xml")
-        if security_rules["result"]:
-            # Modify the rules, append to be output
-            modified_rules = eastwest_addnew_zone(security_rules["result"]["rules"]["entry"])
-            to_output.append([modified_rules,"output/modified-pa-rules.xml", XPATH, pa])
+        mem.resolver = pa_api.AddressResolver(mem.address_object_entries, mem.address_group_entries)
+        if stream:
+            fetched = [] if diff else None
+            modified_rules = modify_rules(pa_api.tee_entries(pa.iter_api_entries(XPATH, "output/api/pa-rules.xml"), fetched))
+            if modified_rules:
+                to_output.append([modified_rules,"output/modified-pa-rules.xml", XPATH, pa, fetched])
+        else:
+            security_rules = api_output[RULES_JOB]
+            if security_rules["result"]:
+                # Modify the rules, append to be output
+                modified_rules = modify_rules(security_rules["result"]["rules"]["entry"])
+                to_output.append([modified_rules,"output/modified-pa-rules.xml", XPATH, pa, security_rules["result"]["rules"]["entry"]])
 
     # Begin creating output and/or pushing rules to PA/PAN
-    for ruletype in to_output:
-        output_and_push_changes(*ruletype)
+    if plan:
+        to_output = []
+    if diff:
+        pa_api.output_and_push_diff(to_output, push=settings.PUSH_CONFIG_TO_PA)
+    elif batch:
+        pa_api.output_and_push_batch(to_output, push=settings.PUSH_CONFIG_TO_PA, retarget=retarget_device_group)
+    else:
+        for ruletype in to_output:
+            output_and_push_changes(*ruletype)
 
     end = time.perf_counter()
     runtime = end - start
@@ -527,18 +666,35 @@ def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
 if __name__ == "__main__":
 
     # Check arguments, if 'xml' then don't need the rest of the input
-    argrequired = '--xml' not in sys.argv and '-x' not in sys.argv
+    argrequired = '--xml' not in sys.argv and '-x' not in sys.argv and '--replay' not in sys.argv
     parser = argparse.ArgumentParser(description="Please use this syntax:")
     parser.add_argument("-x", "--xml", help="Optional XML Filename", type=str)
+    parser.add_argument("--record", help="Save every API response to this folder, see --replay", type=str)
+    parser.add_argument("--replay", help="Offline, answer every API call from a --record folder", type=str)
     parser.add_argument("-u", "--username", help="Username", type=str, required=argrequired)
     parser.add_argument("-i", "--ipaddress", help="IP or FQDN of PA/Panorama", type=str, required=argrequired)
+    parser.add_argument("-s", "--stream", help="Stream large rulebases one rule at a time (less memory)", action="store_true")
+    parser.add_argument("-b", "--batch", help="Upload pre & post rules as one config and load them in one pass", action="store_true")
+    parser.add_argument("-d", "--diff", help="Only push the rules that changed instead of replacing the rulebase", action="store_true")
+    parser.add_argument("-c", "--config", help="Grab the whole running/candidate config once", choices=["running", "candidate"])
+    parser.add_argument("-g", "--device-groups", help="Sweep these Device Groups without prompting, ie. DG1,DG2 or all", type=str)
+    parser.add_argument("-p", "--plan", help="Report rules affected per candidate subnet, ie. 10.1.1.0/24,10.1.2.0/24", type=str)
     args = parser.parse_args()
+    plan = args.plan.split(",") if args.plan else None
+    if args.device_groups and args.stream:
+        parser.error("--device-groups grabs every Device Group's rules at once, it can't be combined with --stream")
 
     # IF XML, do not connect to PA/Pan
     if args.xml:
         settings.PUSH_CONFIG_TO_PA = False
         filename = args.xml
-        becu("n/a","n/a","n/a","xml",filename)
+        eastwesthelper("n/a","n/a","n/a","xml",filename, plan=plan)
+        sys.exit(0)
+
+    # IF REPLAY, do not connect to PA/Pan
+    if args.replay:
+        device_groups = args.device_groups.split(",") if args.device_groups else None
+        eastwesthelper("n/a", "n/a", "n/a", None, stream=args.stream, plan=plan, batch=args.batch, diff=args.diff, device_groups=device_groups, snapshot=args.config, replay=args.replay)
         sys.exit(0)
 
     # Gather input
@@ -559,4 +715,5 @@ if __name__ == "__main__":
 
     # Run program
     print("\nThank you...connecting..\n")
-    eastwesthelper(pa_ip, username, password, pa_type)
\ No newline at end of file
+    device_groups = args.device_groups.split(",") if args.device_groups else None
+    eastwesthelper(pa_ip, username, password, pa_type, stream=args.stream, plan=plan, batch=args.batch, diff=args.diff, device_groups=device_groups, snapshot=args.config, record=args.record)
\ No newline at end of file
@@ -40,13 +40,33 @@ Legal:
 
 import sys
 import os
+import re
 import json
+import time
+import gzip
+import io
+import hashlib
+import ipaddress
+import asyncio
+import random
+import threading
+import weakref
 import xmltodict
 import xml.dom.minidom
+import xml.sax
+import xml.sax.saxutils
+import xml.etree.ElementTree as ElementTree
+import concurrent.futures
 from datetime import datetime
+from urllib.parse import urlsplit, parse_qsl
 
 import requests
 
+try:
+    import numpy    # Optional, see SubnetMatcher
+except ImportError:
+    numpy = None
+
 # Who cares about SSL?
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
@@ -54,9 +74,39 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 #########################################################################################################
 DEBUG = False
+MAX_WORKERS = 8     # Concurrent API calls per PA/Panorama, see grab_api_output_batch()
+
+# API key cache, skips keygen when a still-valid key exists for this host+user. See login()
+KEY_CACHE = True
+KEY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".pa_api_keys.json")
+KEY_CACHE_TTL = 8 * 60 * 60     # Seconds, re-run keygen after this
+
+# API output archive (api/<timestamp>/ folders), responses are written exactly as received
+ARCHIVE_COMPRESSION = None      # None, "gzip" (.gz) or "zstd" (.zst, pip install zstandard)
+ARCHIVE_PRETTY = False          # Indent the archived XML, slower on large configs
+
+# Incremental push, see push_rule_delta()
+MULTI_CONFIG_SIZE = 100         # set/edit/move/delete per multi-config request (PAN-OS 9.0+)
+
+# Request scheduler, every call to a PA/Panorama goes through it, see RequestScheduler
+REQUEST_TIMEOUT = (10, 300)     # Seconds, (connect, read)
+REQUEST_RETRIES = 4             # Retries on connection errors, timeouts and 5xx/429 replies (429 only for config changes)
+REQUEST_BACKOFF = 1             # Seconds, base of the jittered exponential backoff
+REQUEST_BACKOFF_MAX = 60        # Seconds, longest wait between retries
+RATE_LIMIT = 10                 # Requests per second per PA/Panorama (token bucket), None for no limit
+RATE_BURST = 20                 # Requests allowed at once before RATE_LIMIT kicks in
+LATENCY_FACTOR = 3              # Halve the concurrency when latency reaches this times the baseline, None to disable
+LATENCY_MIN = 1                 # Seconds, latency below this is never treated as overload
+
+# asyncio client, see async_api_lib_pa (pip install aiohttp)
+ASYNC_LIMIT_PER_HOST = MAX_WORKERS  # Concurrent API calls per PA/Panorama
+ASYNC_RETRIES = 3                   # Retries on connection errors, timeouts and 5xx/429 replies (429 only for config changes)
+ASYNC_BACKOFF = 0.5                 # Seconds before the first retry, doubled every retry
+ASYNC_TIMEOUT = 60                  # Seconds per API call
 
 #PA:
 XPATH_ADDRESS_OBJ =  "/config/devices/entry[@name='localhost.localdomain']/vsys/entry[@name='vsys1']/address"
+XPATH_ADDRESS_GRP =  "/config/devices/entry[@name='localhost.localdomain']/vsys/entry[@name='vsys1']/address-group"
 XPATH_INTERFACES =    "/config/devices/entry[@name='localhost.localdomain']/network/interface"
 XPATH_SECURITYRULES = "/config/devices/entry[@name='localhost.localdomain']/vsys/entry[@name='vsys1']/rulebase/security/rules"
 XPATH_NAT_RULES = "/config/devices/entry[@name='localhost.localdomain']/vsys/entry[@name='vsys1']/rulebase/nat/rules"
@@ -119,8 +169,12 @@ def get_pa_type():
     return pa_type
 
 
-def create_xml_files(temp, filename):
-
+def archive_filename(filename):
+    """
+    Insert a <year-month-day--hour-minute> folder before the filename, ie.
+    'output/api/pre-rules.xml' -> 'output/api/2020-6-1--13-5//pre-rules.xml'
+    and create the folder(s) if they don't already exist.
+    """
     # Pull folder name from string
     end = filename.rfind("/")
     if end != -1:
@@ -137,30 +191,202 @@ def create_xml_files(temp, filename):
     # Create the root folder and subfolder if it doesn't already exist
         os.makedirs(folder + timestamp, exist_ok=True)
 
+    return filename
 
-    # Because XML: remove <response/><result/> and <?xml> tags
-    # Using get().get() won't cause exception on KeyError
-    # Check for various response type and ensure xml is written consistently
 
-    #Set data
-    if not isinstance(temp,list):
-        data = temp.get("response")
-        data = {"response": data}
+def element_to_dict(elem):
+    """
+    Convert an ElementTree element to the same structure xmltodict.parse() would create:
+    attributes as '@name', repeated tags as lists, text as '#text' (or the value itself).
+    """
+    output = {f"@{key}": value for key, value in elem.attrib.items()}
+    for child in elem:
+        value = element_to_dict(child)
+        if child.tag in output:
+            if isinstance(output[child.tag], list):
+                output[child.tag].append(value)
+            else:
+                output[child.tag] = [output[child.tag], value]
+        else:
+            output[child.tag] = value
+
+    text = elem.text.strip() if elem.text else None
+    if text:
+        if not output:
+            return text
+        output["#text"] = text
+
+    return output if output else None
+
+
+class _TeeReader:
+    """
+    File-like wrapper for the raw response stream, everything read is also written to fout.
+    """
+    def __init__(self, raw, fout=None):
+        self.raw = raw
+        self.fout = fout
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if self.fout and data:
+            self.fout.write(data)
+        return data
 
-        if data:
-            # data = temp.get("response").get("result")
-            if data:
-                data = xmltodict.unparse(data)
+
+class _IndentingWriter(xml.sax.handler.ContentHandler):
+    """
+    SAX handler that writes the XML back out indented, one element at a time.
+    Used by ArchiveWriter when ARCHIVE_PRETTY is set, the document is never held in memory.
+    """
+    def __init__(self, fout, indent="  "):
+        super().__init__()
+        self.fout = fout
+        self.indent = indent
+        self.depth = 0
+        self.pending = None     # Start tag not written yet, might be <empty/> or <tag>text</tag>
+        self.text = []
+
+    def _start_tag(self, name, attrs):
+        attributes = "".join(
+            f" {key}={xml.sax.saxutils.quoteattr(value)}" for key, value in attrs.items()
+        )
+        return f"<{name}{attributes}"
+
+    def _write(self, data):
+        self.fout.write(data.encode())
+
+    def _flush_pending(self):
+        if self.pending:
+            name, attrs = self.pending
+            self._write(f"{self.indent * (self.depth - 1)}{self._start_tag(name, attrs)}>\n")
+            self.pending = None
+            self.text = []
+
+    def startElement(self, name, attrs):
+        self._flush_pending()
+        self.pending = (name, dict(attrs))
+        self.depth += 1
+
+    def characters(self, content):
+        if self.pending:
+            self.text.append(content)
+
+    def endElement(self, name):
+        self.depth -= 1
+        padding = self.indent * self.depth
+        if self.pending:
+            _, attrs = self.pending
+            text = "".join(self.text).strip()
+            if text:
+                self._write(
+                    f"{padding}{self._start_tag(name, attrs)}>{xml.sax.saxutils.escape(text)}</{name}>\n"
+                )
             else:
-                data = xmltodict.unparse(temp)
+                self._write(f"{padding}{self._start_tag(name, attrs)}/>\n")
+            self.pending = None
+            self.text = []
+        else:
+            self._write(f"{padding}</{name}>\n")
+
+
+class ArchiveWriter:
+    """
+    Write API responses to the archive exactly as received (bytes), optionally compressed
+    and/or indented on the fly. Adds the timestamp folder, see archive_filename().
+
+    Example:
+        with ArchiveWriter("api/interfaces.xml") as fout:
+            fout.write(response.content)
+    """
+    def __init__(self, filename, compression=None, pretty=None):
+        compression = ARCHIVE_COMPRESSION if compression is None else compression
+        pretty = ARCHIVE_PRETTY if pretty is None else pretty
+        self.filename = archive_filename(filename)
+
+        if compression == "gzip":
+            self.filename += ".gz"
+            self.fout = gzip.open(self.filename, "wb")
+        elif compression == "zstd":
+            import zstandard    # Optional, only needed for zstd archives
+
+            self.filename += ".zst"
+            self.fout = zstandard.ZstdCompressor().stream_writer(open(self.filename, "wb"))
+        else:
+            self.fout = open(self.filename, "wb")
+
+        self.parser = None
+        if pretty:
+            self.parser = xml.sax.make_parser()
+            self.parser.setContentHandler(_IndentingWriter(self.fout))
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        if self.parser:
+            self.parser.feed(data)
         else:
-            data = xmltodict.unparse(temp)
-        data = data.replace('<?xml version="1.0" encoding="utf-8"?>', "")
+            self.fout.write(data)
+
+    def close(self):
+        try:
+            if self.parser:
+                self.parser.close()
+        finally:
+            self.fout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_archive(data, filename):
+    """
+    Write a raw API response (str or bytes) to the archive, see ArchiveWriter.
+    """
+    with ArchiveWriter(filename) as fout:
+        fout.write(data)
+
+
+def read_archive(filename):
+    """
+    Read an archived API response back in, .gz and .zst files are decompressed.
 
-        prettyxml = xml.dom.minidom.parseString(data).toprettyxml()
+    :return: bytes
+    """
+    if filename.endswith(".gz"):
+        with gzip.open(filename, "rb") as fin:
+            return fin.read()
+    elif filename.endswith(".zst"):
+        import zstandard
+
+        with open(filename, "rb") as fin:
+            return zstandard.ZstdDecompressor().stream_reader(fin).read()
+    else:
+        with open(filename, "rb") as fin:
+            return fin.read()
+
+
+def create_xml_files(temp, filename):
+    """
+    Write an already parsed (xmltodict) object, ie. a single rule for review, or a list of lines.
+    API responses should use write_archive() instead, no need to re-create the XML.
+    """
+    filename = archive_filename(filename)
+
+    #Set data
+    if not isinstance(temp,list):
+        # Full response, or a single <entry>
+        if "response" in temp:
+            data = {"response": temp["response"]}
+        else:
+            data = {"entry": temp}
+        data = xmltodict.unparse(data, full_document=False, pretty=ARCHIVE_PRETTY)
 
         with open(filename, "w") as fout:
-            fout.write(prettyxml)
+            fout.write(data)
     else:
         data = temp
         with open(filename, "w") as fout:
@@ -175,21 +401,7 @@ def create_json_files(temp, filename):
     :param template_type: 'feature' or 'device'
     :return: None, print output
     """
-    # Pull folder name from string
-    end = filename.rfind("/")
-    folder = filename[0:end]
-
-    timestamp = "/" + \
-    str(datetime.now().year) + '-' + \
-    str(datetime.now().month) + '-' + \
-    str(datetime.now().day) + '--' + \
-    str(datetime.now().hour) + '-' + \
-    str(datetime.now().minute) + '/'
-
-    filename = folder + timestamp + filename[end:]
-
-    # Create the root folder and subfolder if it doesn't already exist
-    os.makedirs(folder + timestamp, exist_ok=True)
+    filename = archive_filename(filename)
 
     data = json.dumps(temp, indent=4, sort_keys=True)
     # Write Data
@@ -199,6 +411,1423 @@ def create_json_files(temp, filename):
 
     # print("\tCreated: {}\n".format(filename))
 
+def as_list(value):
+    """
+    xmltodict returns a single item for one <entry>/<member>, a list for more than one.
+    Always return a list (empty for None).
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+_XPATH_STEP = re.compile(r"([^/\[]+)(?:\[@name='([^']*)'\])?")
+
+
+def xpath_to_dict(xpath, leaf, tree=None):
+    """
+    Nest 'leaf' at the xpath, so a named configuration has the same xpaths as the real config, ie.
+    "/config/devices/entry[@name='localhost.localdomain']/device-group/entry[@name='DG']/pre-rulebase/security/rules"
+    Entries with the same name are shared, so multiple xpaths (pre, post, device groups) can go in one tree.
+
+    :param leaf: dictionary to put at the xpath, ie. {"entry": rules}
+    :param tree: existing tree to add to
+    :return: tree
+    """
+    tree = {} if tree is None else tree
+    node = tree
+    steps = _XPATH_STEP.findall(xpath)
+    for index, (tag, name) in enumerate(steps):
+        last = index == len(steps) - 1
+        if name:
+            entries = as_list(node.get(tag))
+            match = next((x for x in entries if x.get("@name") == name), None)
+            if match is None:
+                match = {"@name": name}
+                entries = entries + [match]
+                node[tag] = entries[0] if len(entries) == 1 else entries
+            node = match
+            if last:
+                node.update(leaf)
+        elif last:
+            node[tag] = leaf
+        else:
+            node = node.setdefault(tag, {})
+    return tree
+
+
+def tee_entries(entries, into=None):
+    """
+    Pass entries (ie. from iter_api_entries) through, keeping a reference to each one in 'into' (list).
+    Used to keep the fetched rules for rule_delta() when streaming.
+    """
+    for entry in entries:
+        if into is not None:
+            into.append(entry)
+        yield entry
+
+
+def entry_element(entry):
+    """
+    :param entry: <entry> dictionary
+    :return: <entry name="..">...</entry> XML string, for the API's 'element'
+    """
+    return xmltodict.unparse({"entry": entry}, full_document=False)
+
+
+def rule_delta(old_rules, new_rules):
+    """
+    Changes needed to turn the fetched rulebase into the modified one, instead of replacing all of it.
+    New rules are added ('set' puts them at the bottom) then moved before the rule that follows them,
+    changed rules are replaced ('edit'), rules that are gone are deleted. Existing rules keep their order.
+    New rules (ie. clones) lose the @uuid copied from their source rule, PAN-OS gives them their own.
+
+    :param old_rules: rules (entry dictionaries) as fetched
+    :param new_rules: modified rules, in order
+    :return: list of (action, rule name, entry or None, move before rule name or None)
+    """
+    old = {rule["@name"]: rule for rule in as_list(old_rules)}
+    new_rules = as_list(new_rules)
+    new_names = {rule["@name"] for rule in new_rules}
+
+    sets, edits, moves = [], [], []
+    for index, rule in enumerate(new_rules):
+        name = rule["@name"]
+        if name not in old:
+            if "@uuid" in rule:
+                rule = {field: value for field, value in rule.items() if field != "@uuid"}
+            sets.append(("set", name, rule, None))
+            if index + 1 < len(new_rules):
+                moves.append(("move", name, None, new_rules[index + 1]["@name"]))
+        elif rule != old[name]:
+            edits.append(("edit", name, rule, None))
+    deletes = [("delete", name, None, None) for name in old if name not in new_names]
+
+    # Moved last one first, so the rule each one is moved before is already in place
+    return sets + edits + moves[::-1] + deletes
+
+
+def write_config_file(config, filename):
+    """
+    Create a pretty XML file that can be imported as a named configuration.
+
+    :param config: dictionary, starting at {"config": ...}
+    :param filename: xml filename to use
+    """
+    data = xmltodict.unparse(config)    # Turn XML into a string
+    prettyxml = xml.dom.minidom.parseString(data).toprettyxml() # Pretty-fi the XML before creating file
+    prettyxml = prettyxml.replace('<?xml version="1.0" ?>', "") # Can't import with this in the XML, remove it
+    with open(filename, "w") as fout:
+        fout.write(prettyxml)
+        print(f"\nOutput at: {filename}\n")
+
+
+def output_and_push_batch(to_output, filename="output/batch-rules.xml", push=True, retarget=None):
+    """
+    Batched push (--batch), shared by becu, eastwest-helper and suu-copy-rules.
+    Creates one output file per rulebase, then uploads all the rulebases (pre, post) as ONE named
+    configuration, with the rules at their real xpaths, and loads them all in one pass. One status at the end.
+
+    :param to_output: list of [rules, filename, xpath, pa, ...]
+    :param filename: xml filename to use for the combined named configuration
+    :param push: upload and load (ie. settings.PUSH_CONFIG_TO_PA), otherwise only the output files
+    :param retarget: Panorama only, function(pa, xpaths) returning the xpaths to load into (ie. another device group)
+    :return: list of (xpath, True/False) loaded, None if not pushed
+    """
+
+    # Always create the output files, one per rulebase
+    for rules, rules_filename, *_ in to_output:
+        write_config_file({"config": {"security": {"rules": {"entry": rules}}}}, rules_filename)
+
+    if not to_output or not push:
+        return None
+
+    # One named configuration with every rulebase at it's own xpath
+    pa = to_output[0][3]
+    config = {}
+    for rules, _, xpath, *_ in to_output:
+        xpath_to_dict(xpath, {"entry": rules}, config)
+    write_config_file(config, filename)
+
+    # Import Named Configuration .xml via Palo Alto API, once
+    with open(filename) as fin:
+        print("\nUploading Configuration, Please Wait....")
+        response = pa.import_named_configuration(fin)
+    if response.status_code != 200 or "error" in response.text:
+        print("\n\nImporting Configuration Failed.")
+        print(f"Response Code: {response.status_code}")
+        print(f"Response: {response.text}\n\n")
+        sys.exit(0)
+    print("\nConfig Uploaded.")
+
+    load_config = ""
+    while load_config.lower() not in ("y", "n"):
+        load_config = input(f"\nLoad config ({len(to_output)} rulebases) as candidate configuration? [y/n]: ")
+    if load_config != "y":
+        print("\nThank you, finished.\n")
+        return None
+
+    from_xpaths = [xpath for _, _, xpath, *_ in to_output]
+    xpaths = list(from_xpaths)
+    if pa.pa_type == "panorama" and retarget:
+        xpaths = retarget(pa, xpaths)
+
+    # Load every rulebase, don't stop at the first failure so the status covers all of them
+    fname = filename.rsplit('/', 1)[-1]  # Get filename, strip any folders before the filename.
+    results = []
+    for from_xpath, xpath in zip(from_xpaths, xpaths):
+        response = pa.load_partial_config(fname, from_xpath, xpath)
+        loaded = response.status_code == 200 and "error" not in response.text
+        results.append((xpath, loaded))
+        if not loaded:
+            print(f"\nLoading Configuration Failed: {xpath}")
+            print(f"Response Code: {response.status_code}")
+            print(f"Response: {response.text}\n")
+
+    print("\nBatch load status:")
+    print("--------------------------------------------")
+    for xpath, loaded in results:
+        print(f"{'Loaded' if loaded else 'FAILED':<10}{xpath}")
+    print("--------------------------------------------")
+    if all(loaded for _, loaded in results):
+        print("\nCandidate configuration successfully loaded...enjoy the new ruleset!")
+    print("Review configuration and Commit manually via the GUI.\n")
+
+    return results
+
+
+def output_and_push_diff(to_output, push=True):
+    """
+    Incremental push (--diff), shared by becu and eastwest-helper.
+    Creates one output file per rulebase, then only pushes the rules that were added, changed, or removed
+    compared to the fetched rulebase (set/edit/move/delete, batched multi-config requests, see
+    push_rule_delta()) instead of replacing the whole rulebase.
+
+    :param to_output: list of [rules, filename, xpath, pa, fetched rules]
+    :param push: push the changes (ie. settings.PUSH_CONFIG_TO_PA), otherwise only the output files
+    :return: list of (xpath, True/False) pushed, None if not pushed
+    """
+
+    # Always create the output files, one per rulebase
+    for rules, rules_filename, *_ in to_output:
+        write_config_file({"config": {"security": {"rules": {"entry": rules}}}}, rules_filename)
+
+    if not to_output or not push:
+        return None
+
+    # Only what changed
+    deltas = []
+    print("\nChanges:")
+    print("--------------------------------------------")
+    for rules, _, xpath, pa, fetched_rules in to_output:
+        delta = rule_delta(fetched_rules, rules)
+        deltas.append((xpath, pa, delta))
+        counts = {action: 0 for action in ("set", "edit", "move", "delete")}
+        for action, *_ in delta:
+            counts[action] += 1
+        print(f"{xpath}")
+        print(f"\tnew: {counts['set']}, changed: {counts['edit']}, moved: {counts['move']}, deleted: {counts['delete']}")
+    print("--------------------------------------------")
+
+    total = sum(len(delta) for _, _, delta in deltas)
+    if not total:
+        print("\nNothing changed, nothing to push.\n")
+        return None
+
+    load_config = ""
+    while load_config.lower() not in ("y", "n"):
+        load_config = input(f"\nPush {total} changes to the candidate configuration? [y/n]: ")
+    if load_config != "y":
+        print("\nThank you, finished.\n")
+        return None
+
+    # Push every rulebase, don't stop at the first failure so the status covers all of them
+    results = []
+    for xpath, pa, delta in deltas:
+        if not delta:
+            continue
+        print("\nPushing Changes, Please Wait....")
+        responses = pa.push_rule_delta(xpath, delta)
+        pushed = all(success for _, success, _ in responses)
+        results.append((xpath, pushed))
+        for count, success, text in responses:
+            if not success:
+                print(f"\nPushing {count} changes Failed: {xpath}")
+                print(f"Response: {text}\n")
+
+    print("\nPush status:")
+    print("--------------------------------------------")
+    for xpath, pushed in results:
+        print(f"{'Pushed' if pushed else 'FAILED':<10}{xpath}")
+    print("--------------------------------------------")
+    if all(pushed for _, pushed in results):
+        print("\nCandidate configuration successfully updated...enjoy the new ruleset!")
+    print("Review configuration and Commit manually via the GUI.\n")
+
+    return results
+
+
+_field_orders = {}      # Field order tuples shared between entries, see _Entry
+
+
+def _parse_members(value):
+    """
+    {'member': 'a'} or {'member': ['a', 'b']} -> ('a', 'b'), interned
+    None/empty -> (), anything else (ie. candidate config <member admin=".."/>) -> None
+    """
+    if value is None:
+        return ()
+    if not isinstance(value, dict) or list(value) != ["member"]:
+        return None
+    members = as_list(value["member"])
+    if not all(isinstance(x, str) for x in members):
+        return None
+    return tuple(sys.intern(x) for x in members)
+
+
+def _members_value(members):
+    """
+    ('a', 'b') -> {'member': ['a', 'b']}, one member is a string and none is None (same as xmltodict)
+    """
+    if not members:
+        return None
+    return {"member": members[0] if len(members) == 1 else list(members)}
+
+
+class _Entry:
+    """
+    Base for the slotted <entry> models (Rule, AddressObject, AddressGroup).
+    MEMBERS fields (<member> lists) are tuples of interned strings, TEXT fields are interned strings,
+    anything else (profile-setting, @uuid, etc.) is kept as is in 'other'. 'order' is the XML field order,
+    shared between all entries with the same fields, so to_dict() gives back the same dictionary.
+    """
+    __slots__ = ("name", "order", "other")
+    MEMBERS = {}    # xml field: attribute
+    TEXT = {}       # xml field: attribute
+
+    def __init__(self, name, order=None, other=None, **fields):
+        self.name = sys.intern(name)
+        self.order = order
+        self.other = other      # tuple of (xml field, value), None if nothing else
+        for attr in self.MEMBERS.values():
+            setattr(self, attr, tuple(sys.intern(x) for x in fields.pop(attr, ())))
+        for attr in self.TEXT.values():
+            value = fields.pop(attr, None)
+            setattr(self, attr, sys.intern(value) if value is not None else None)
+        if fields:
+            raise TypeError(f"Unknown {type(self).__name__} fields: {', '.join(fields)}")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+    @classmethod
+    def from_dict(cls, entry):
+        """
+        :param entry: xmltodict <entry> dictionary
+        """
+        self = cls.__new__(cls)
+        self.name = None
+        other = []
+        for attr in cls.MEMBERS.values():
+            setattr(self, attr, ())
+        for attr in cls.TEXT.values():
+            setattr(self, attr, None)
+        for field, value in entry.items():
+            if field == "@name":
+                self.name = sys.intern(value)
+            elif field in cls.MEMBERS and _parse_members(value) is not None:
+                setattr(self, cls.MEMBERS[field], _parse_members(value))
+            elif field in cls.TEXT and isinstance(value, str):
+                setattr(self, cls.TEXT[field], sys.intern(value))
+            else:
+                other.append((field, value))
+        order = tuple(entry)
+        self.order = _field_orders.setdefault(order, order)
+        self.other = tuple(other) or None
+        return self
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        :param entries: xmltodict <entry> (list or single entry)
+        :return: list of models
+        """
+        return [cls.from_dict(entry) for entry in as_list(entries)]
+
+    @property
+    def parsed(self):
+        """
+        False if a MEMBERS/TEXT field couldn't be parsed and was kept in 'other' (candidate config)
+        """
+        return not any(field in self.MEMBERS or field in self.TEXT for field, _ in self.other or ())
+
+    def to_dict(self):
+        """
+        :return: xmltodict <entry> dictionary, the same as the one from_dict() was given
+        """
+        other = dict(self.other or ())
+        order = self.order
+        if order is None:
+            order = ("@name",) + tuple(
+                field for field, attr in {**self.MEMBERS, **self.TEXT}.items() if getattr(self, attr)
+            ) + tuple(other)
+
+        entry = {}
+        for field in order:
+            if field == "@name":
+                entry[field] = self.name
+            elif field in other:
+                entry[field] = other[field]
+            elif field in self.MEMBERS:
+                entry[field] = _members_value(getattr(self, self.MEMBERS[field]))
+            else:
+                entry[field] = getattr(self, self.TEXT[field])
+        return entry
+
+    def replace(self, **changes):
+        """
+        Copy-on-write, the new entry shares everything that didn't change with this one.
+
+        Example:
+            new_rule = rule.replace(from_zone=["new-zone"], tag=rule.tag + ("cloned",))
+        """
+        fields = {attr: field for field, attr in {**self.MEMBERS, **self.TEXT}.items()}
+        new = self.__new__(type(self))
+        for cls in type(self).__mro__:
+            for attr in getattr(cls, "__slots__", ()):
+                setattr(new, attr, getattr(self, attr))
+
+        for attr, value in changes.items():
+            if attr == "name":
+                new.name = sys.intern(value)
+                continue
+            field = fields[attr]
+            if field in self.MEMBERS:
+                value = tuple(sys.intern(x) for x in value)
+            elif value is not None:
+                value = sys.intern(value)
+            setattr(new, attr, value)
+            if new.other and field in dict(new.other):
+                new.other = tuple(x for x in new.other if x[0] != field) or None
+            if new.order is not None and field not in new.order:
+                order = new.order + (field,)
+                new.order = _field_orders.setdefault(order, order)
+        return new
+
+
+class Rule(_Entry):
+    """
+    Security rule.
+
+    Example:
+        rule = Rule.from_dict(entry)
+        if "trust" in rule.from_zone:
+            new_rule = rule.replace(name=rule.name + "-cloned", from_zone=["new-zone"])
+            output.append(new_rule.to_dict())
+    """
+    __slots__ = (
+        "from_zone", "to_zone", "source", "destination", "source_user", "category",
+        "application", "service", "source_hip", "destination_hip", "tag",
+        "action", "description", "disabled",
+    )
+    MEMBERS = {
+        "to": "to_zone",
+        "from": "from_zone",
+        "source": "source",
+        "destination": "destination",
+        "source-user": "source_user",
+        "category": "category",
+        "application": "application",
+        "service": "service",
+        "source-hip": "source_hip",
+        "destination-hip": "destination_hip",
+        "tag": "tag",
+    }
+    TEXT = {
+        "action": "action",
+        "description": "description",
+        "disabled": "disabled",
+    }
+
+
+class AddressObject(_Entry):
+    """
+    Address object, only one of ip_netmask, ip_range, ip_wildcard or fqdn is set.
+    """
+    __slots__ = ("ip_netmask", "ip_range", "ip_wildcard", "fqdn", "description", "tag")
+    MEMBERS = {
+        "tag": "tag",
+    }
+    TEXT = {
+        "ip-netmask": "ip_netmask",
+        "ip-range": "ip_range",
+        "ip-wildcard": "ip_wildcard",
+        "fqdn": "fqdn",
+        "description": "description",
+    }
+
+
+class AddressGroup(_Entry):
+    """
+    Address group, static members in 'static', dynamic groups keep their <dynamic><filter> in 'other'.
+    """
+    __slots__ = ("static", "description", "tag")
+    MEMBERS = {
+        "static": "static",
+        "tag": "tag",
+    }
+    TEXT = {
+        "description": "description",
+    }
+
+
+class AddressResolver:
+    """
+    Exact-name index of address objects and address groups, built once per run.
+    Add the closest objects first (Device Group, then parent DG, then Shared), the first
+    definition of a name wins just like the PA/Panorama override order.
+
+    Example:
+        resolver = AddressResolver(address_objects, address_groups)
+        resolver.resolve("web-servers")  # ['10.1.1.10/32', '10.1.1.11/32']
+    """
+    def __init__(self, address_objects=None, address_groups=None):
+        self.objects = {}       # name: AddressObject
+        self.groups = {}        # name: AddressGroup
+        self.unsupported = {}   # name: AddressObject/AddressGroup, non ip-netmask objects and dynamic groups seen by resolve()
+        self._memo = {}
+        self.add(address_objects, address_groups)
+
+    @classmethod
+    def from_panos(cls, address_objects=None, address_groups=None):
+        """
+        Build from pan-os-python objects.AddressObject/AddressGroup (sdk-ew).
+        """
+        objs = [
+            AddressObject(obj.name, **{obj.type.replace("-", "_"): obj.value})
+            for obj in address_objects or []
+        ]
+        grps = []
+        for grp in address_groups or []:
+            if grp.static_value:
+                grps.append(AddressGroup(grp.name, static=grp.static_value))
+            else:
+                grps.append(AddressGroup(grp.name, other=(("dynamic", {"filter": grp.dynamic_value}),)))
+        return cls(objs, grps)
+
+    def add(self, address_objects=None, address_groups=None):
+        """
+        Add more objects/groups (entry dicts, models, or lists of them), existing names are kept.
+        """
+        for entry in as_list(address_objects):
+            if isinstance(entry, dict):
+                entry = AddressObject.from_dict(entry)
+            self.objects.setdefault(entry.name, entry)
+        for entry in as_list(address_groups):
+            if isinstance(entry, dict):
+                entry = AddressGroup.from_dict(entry)
+            self.groups.setdefault(entry.name, entry)
+        self._memo.clear()
+
+    def with_overrides(self, address_objects=None, address_groups=None):
+        """
+        New resolver with these objects/groups (ie. a device group's) first, then this resolver's
+        (ie. Shared). The parsed objects are shared between the resolvers, not copied.
+        """
+        resolver = AddressResolver(address_objects, address_groups)
+        for name, obj in self.objects.items():
+            resolver.objects.setdefault(name, obj)
+        for name, grp in self.groups.items():
+            resolver.groups.setdefault(name, grp)
+        return resolver
+
+    def lookup(self, name):
+        """
+        :return: the address object or address group entry (dictionary) named 'name', None if not found
+        """
+        if name in self.objects:
+            return self.objects[name].to_dict()
+        if name in self.groups:
+            return self.groups[name].to_dict()
+        return None
+
+    def is_group(self, name):
+        return name in self.groups
+
+    def resolve(self, name):
+        """
+        Resolve an address object, address group (nested groups are expanded) or IP to a list
+        of networks. A name that isn't an object is assumed to be the IP/network itself.
+        Objects that aren't ip-netmask, and dynamic groups, resolve to nothing and are
+        recorded in self.unsupported for review.
+
+        :return: list of ip-netmask strings
+        """
+        return list(self._resolve(name, ()))
+
+    def _resolve(self, name, parents):
+        if name in self._memo:
+            return self._memo[name]
+
+        if name in parents:
+            print(f"Address group loop found, skipping: {' -> '.join(parents + (name,))}")
+            return ()
+
+        if name in self.objects:
+            obj = self.objects[name]
+            if obj.ip_netmask:
+                networks = (obj.ip_netmask,)
+            else:
+                self.unsupported[name] = obj
+                networks = ()
+        elif name in self.groups:
+            grp = self.groups[name]
+            if grp.static:
+                networks = []
+                for member in grp.static:
+                    networks += self._resolve(member, parents + (name,))
+                networks = tuple(networks)
+            else:
+                self.unsupported[name] = grp
+                networks = ()
+        else:
+            networks = (name,)  # IP as Name
+
+        self._memo[name] = networks
+        return networks
+
+    def unsupported_members(self, name):
+        """
+        The non ip-netmask objects and dynamic groups resolve() skips for this object/group,
+        including the ones nested in static groups, even if the rest of the group resolves.
+
+        :return: dictionary of name: AddressObject/AddressGroup
+        """
+        self.resolve(name)
+        found = {}
+        stack = [name]
+        seen = set()
+        while stack:
+            member = stack.pop()
+            if member in seen:
+                continue
+            seen.add(member)
+            if member in self.unsupported:
+                found[member] = self.unsupported[member]
+            elif member in self.groups and member not in self.objects:
+                stack.extend(reversed(self.groups[member].static or ()))
+        return found
+
+
+def network_range(network):
+    """
+    :param network: IP or network string, ie. 10.1.1.0/24
+    :return: (version, start, end) as integers, None if not an IP/network (FQDN, range, etc.)
+    """
+    try:
+        network = ipaddress.ip_network(network, strict=False)
+    except ValueError:
+        return None
+    return (
+        network.version,
+        int(network.network_address),
+        int(network.broadcast_address),
+    )
+
+
+class SubnetMatcher:
+    """
+    Subnet overlap checks for a whole rulebase at once (eastwest-helper, sdk-ew).
+    Target subnets (ie. settings.EXISTING_TRUST_SUBNET) are stored as integer ranges per IP version,
+    every address is converted once, then "does any address overlap any subnet" is answered for all
+    of them in a single vectorized NumPy pass (plain Python if numpy isn't installed).
+
+    Example:
+        matcher = SubnetMatcher(["192.168.77.0/24", "192.168.78.0/24"])
+        matcher.overlaps(["192.168.77.14/32"])                # True
+        matcher.mask([["10.1.1.0/24"], ["192.168.0.0/16"]])   # array([False,  True])
+        matcher.matrix([["192.168.77.5"]])                    # array([[ True, False]])
+    """
+    def __init__(self, subnets):
+        self.subnets = list(subnets)
+        self.ranges = {4: [], 6: []}   # version: [(subnet index, start, end)]
+        for index, subnet in enumerate(self.subnets):
+            subnet_range = network_range(subnet)
+            if subnet_range:
+                version, start, end = subnet_range
+                self.ranges[version].append((index, start, end))
+
+    def overlaps(self, networks):
+        """
+        :param networks: list of IP/network strings
+        :return: True if any of them overlap any of the subnets
+        """
+        return bool(self.mask([networks])[0])
+
+    def mask(self, address_sets):
+        """
+        :param address_sets: list of address lists, ie. the resolved addresses of each rule
+        :return: boolean array (list without numpy), True where the set overlaps any subnet
+        """
+        matrix = self.matrix(address_sets)
+        if numpy is not None:
+            return matrix.any(axis=1)
+        return [any(row) for row in matrix]
+
+    def matrix(self, address_sets):
+        """
+        Check every address set against every subnet individually (ie. planning many candidate subnets).
+
+        :param address_sets: list of address lists
+        :return: boolean array [len(address_sets), len(subnets)] (list of lists without numpy)
+        """
+        # Flatten, remember which set each address came from
+        flattened = {4: [], 6: []}     # version: [(set index, start, end)]
+        for set_index, networks in enumerate(address_sets):
+            for network in networks:
+                address_range = network_range(network)
+                if address_range:
+                    version, start, end = address_range
+                    flattened[version].append((set_index, start, end))
+
+        if numpy is None:
+            return self._matrix_python(len(address_sets), flattened)
+
+        result = numpy.zeros((len(address_sets), len(self.subnets)), dtype=bool)
+        for version in (4, 6):
+            addresses = flattened[version]
+            subnets = self.ranges[version]
+            if not addresses or not subnets:
+                continue
+
+            # IPv6 doesn't fit in 64 bits, compare as Python ints (object arrays)
+            dtype = numpy.uint64 if version == 4 else object
+            set_index, addr_start, addr_end = (numpy.array(x) for x in zip(*addresses))
+            addr_start = addr_start.astype(dtype)
+            addr_end = addr_end.astype(dtype)
+            subnet_index, subnet_start, subnet_end = (numpy.array(x) for x in zip(*subnets))
+            subnet_start = subnet_start.astype(dtype)
+            subnet_end = subnet_end.astype(dtype)
+
+            # Overlap when each range starts before the other one ends
+            hits = (addr_start[:, None] <= subnet_end[None, :]) & (
+                addr_end[:, None] >= subnet_start[None, :]
+            )
+            hits = numpy.asarray(hits, dtype=bool)
+
+            # OR each address row into it's set's row
+            version_result = numpy.zeros((len(address_sets), len(subnets)), dtype=bool)
+            numpy.logical_or.at(version_result, set_index.astype(numpy.intp), hits)
+            result[:, subnet_index.astype(numpy.intp)] |= version_result
+
+        return result
+
+    def _matrix_python(self, set_count, flattened):
+        result = [[False] * len(self.subnets) for _ in range(set_count)]
+        for version in (4, 6):
+            for set_index, addr_start, addr_end in flattened[version]:
+                for subnet_index, subnet_start, subnet_end in self.ranges[version]:
+                    if addr_start <= subnet_end and addr_end >= subnet_start:
+                        result[set_index][subnet_index] = True
+        return result
+
+
+class ConfigSnapshot:
+    """
+    The whole config, grabbed once (or loaded from an exported config file) and indexed in memory.
+    Answers grab_api_output() style xpath queries locally instead of one API call per xpath.
+
+    Example:
+        snapshot = ConfigSnapshot.from_file("running-config.xml")
+        snapshot.grab_api_output(XPATH_INTERFACES)   # Same dictionary as the API 'get'
+        pa.use_snapshot("candidate")                 # api_lib_pa queries served from a snapshot
+    """
+    def __init__(self, config):
+        """
+        :param config: ElementTree element, <config> or an API response containing it
+        """
+        if config.tag != "config":
+            config = config.find(".//config")
+        if config is None:
+            raise ValueError("No <config> found, export the running/candidate config and try again.")
+        self.root = config
+        self._children = {}     # id(element): {(tag, name): child element}
+        self._found = {}        # xpath: element or None
+
+    @classmethod
+    def from_string(cls, data):
+        return cls(ElementTree.fromstring(data))
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Exported config file (Device > Setup > Operations) or an archived API response, see read_archive().
+        """
+        return cls.from_string(read_archive(filename))
+
+    @classmethod
+    def from_pa(cls, pa, source="running", filename=None):
+        """
+        Grab the whole running or candidate config with one op command.
+
+        :param source: "running" or "candidate"
+        :param filename: optional archive filename for the config
+        """
+        url = f"https://{pa.pa_ip}:443/api?type=op&cmd=<show><config><{source}></{source}></config></show>&key={pa.key}"
+        response = pa.session[pa.pa_ip].get(url, verify=False)
+        if DEBUG:
+            print(f"\nResponse Status Code = {response.status_code}")
+        if filename:
+            write_archive(response.content, filename)
+        return cls.from_string(response.content)
+
+    @property
+    def pa_type(self):
+        """
+        :return: "panorama" or "pa", based on what the config contains
+        """
+        if self.find(XPATH_DEVICE_GROUPS) is not None or self.root.find("panorama") is not None:
+            return "panorama"
+        return "pa"
+
+    def _child(self, elem, tag, name):
+        index = self._children.get(id(elem))
+        if index is None:
+            index = {}
+            for child in elem:
+                index.setdefault((child.tag, child.get("name")), child)
+            self._children[id(elem)] = index
+        return index.get((tag, name))
+
+    def find(self, xpath):
+        """
+        :param xpath: absolute xpath, steps with an optional [@name='...'], ie. XPATH_SECURITYRULES
+        :return: ElementTree element, None if not found
+        """
+        if xpath in self._found:
+            return self._found[xpath]
+
+        elem = None
+        steps = _XPATH_STEP.findall(xpath)
+        if steps and steps[0] == ("config", ""):
+            elem = self.root
+            for tag, name in steps[1:]:
+                elem = self._child(elem, tag, name or None)
+                if elem is None:
+                    break
+        self._found[xpath] = elem
+        return elem
+
+    def response(self, xpath):
+        """
+        :return: the XML API 'get' response for xpath, as a string
+        """
+        elem = self.find(xpath)
+        if elem is None:
+            return '<response status="success"><result total-count="0" count="0"/></response>'
+        return f'<response status="success"><result total-count="1" count="1">{ElementTree.tostring(elem, encoding="unicode")}</result></response>'
+
+    def grab_api_output(self, xpath, filename=None):
+        """
+        Same dictionary as api_lib_pa.grab_api_output(), ie. output["result"]["rules"]["entry"]
+
+        :param filename: optional, the response is archived just like an API call
+        """
+        elem = self.find(xpath)
+        if filename:
+            write_archive(self.response(xpath), filename)
+        if elem is None:
+            return {"@status": "success", "result": None}
+        return {
+            "@status": "success",
+            "result": {"@total-count": "1", "@count": "1", elem.tag: element_to_dict(elem)},
+        }
+
+    def iter_entries(self, xpath):
+        """
+        :return: generator of entry dictionaries directly under xpath, see api_lib_pa.iter_api_entries()
+        """
+        elem = self.find(xpath)
+        if elem is not None:
+            for child in elem.iterfind("entry"):
+                yield element_to_dict(child)
+
+
+class DeviceGroupCache:
+    """
+    Panorama objects per device group, inherited and override aware.
+    The device group parents come from <show><dg-hierarchy>, and each level (device group or Shared)
+    is grabbed once, no matter how many device groups inherit from it.
+
+    Example:
+        cache = DeviceGroupCache(pa)
+        cache.prefetch(["DG1", "DG2"])              # Both, their parents and Shared, all at once
+        cache.lookup("DG1", "address", "web-01")    # Closest definition wins
+        cache.resolver("DG1").resolve("web-servers")
+    """
+    SHARED = "shared"
+    KINDS = ("address", "address-group", "service", "service-group", "tag")
+
+    def __init__(self, pa, folder="output/api"):
+        self.pa = pa
+        self.folder = folder
+        self._parents = None    # device group: parent device group, SHARED at the top
+        self._entries = {}      # (level, kind): {name: entry}
+        self._resolvers = {}    # level: AddressResolver
+
+    def parents(self):
+        """
+        :return: {device group: parent device group or SHARED}
+        """
+        if self._parents is None and getattr(self.pa, "snapshot", None):
+            # Offline, the parents are in the readonly part of the config
+            self._parents = {}
+            readonly = self.pa.snapshot.find(XPATH_DEVICE_GROUPS.replace("/config/", "/config/readonly/"))
+            for dg in readonly if readonly is not None else []:
+                self._parents[dg.get("name")] = dg.findtext("parent-dg") or self.SHARED
+        if self._parents is None:
+            url = f"https://{self.pa.pa_ip}:443/api?type=op&cmd=<show><dg-hierarchy></dg-hierarchy></show>&key={self.pa.key}"
+            response = self.pa.session[self.pa.pa_ip].get(url, verify=False)
+            if DEBUG:
+                print(f"\nResponse = {response.text}")
+            result = xmltodict.parse(response.text)["response"].get("result") or {}
+
+            self._parents = {}
+            nodes = [(dg, self.SHARED) for dg in as_list((result.get("dg-hierarchy") or {}).get("dg"))]
+            while nodes:
+                dg, parent = nodes.pop()
+                self._parents[dg["@name"]] = parent
+                nodes += [(child, dg["@name"]) for child in as_list(dg.get("dg"))]
+        return self._parents
+
+    def chain(self, device_group):
+        """
+        :return: [device group, parent, ..., SHARED]
+        """
+        chain = [device_group]
+        while chain[-1] != self.SHARED and chain[-1] not in chain[:-1]:
+            chain.append(self.parents().get(chain[-1], self.SHARED))
+        return chain if chain[-1] == self.SHARED else chain[:-1] + [self.SHARED]
+
+    def xpath(self, level, kind):
+        if level == self.SHARED:
+            return f"/config/shared/{kind}"
+        return f"{XPATH_DEVICE_GROUPS}/entry[@name='{level}']/{kind}"
+
+    def prefetch(self, device_groups, kinds=("address", "address-group"), jobs=()):
+        """
+        Grab every level of the device groups' chains not already cached, all at once.
+
+        :param jobs: extra grab_api_output_batch() jobs to send in the same batch, ie. the rules
+        :return: grab_api_output_batch() results of the extra jobs
+        """
+        levels = []
+        for device_group in device_groups:
+            levels += [level for level in self.chain(device_group) if level not in levels]
+        return self._fetch(levels, kinds, jobs)
+
+    def _fetch(self, levels, kinds, jobs=()):
+        """
+        Grab these levels (device groups and/or SHARED) not already cached, with the extra jobs.
+        """
+        object_jobs = {}
+        for level in levels:
+            for kind in kinds:
+                if (level, kind) not in self._entries:
+                    object_jobs[(level, kind)] = (self.xpath(level, kind), f"{self.folder}/{level}-{kind}.xml")
+
+        api_output = self.pa.grab_api_output_batch(list(object_jobs.values()) + list(jobs))
+        for (level, kind), job in object_jobs.items():
+            output = api_output.pop(job)
+            entries = {}
+            if output and output.get("result") and output["result"].get(kind):
+                entries = {entry["@name"]: entry for entry in as_list(output["result"][kind].get("entry"))}
+            self._entries[(level, kind)] = entries
+        return api_output
+
+    def entries(self, level, kind):
+        """
+        :return: {name: entry} defined at this level only (device group or SHARED)
+        """
+        if (level, kind) not in self._entries:
+            self._fetch([level], [kind])
+        return self._entries[(level, kind)]
+
+    def find(self, device_group, kind, name):
+        """
+        :return: (level, entry) of the closest definition, (None, None) if not found
+        """
+        for level in self.chain(device_group):
+            entry = self.entries(level, kind).get(name)
+            if entry is not None:
+                return level, entry
+        return None, None
+
+    def lookup(self, device_group, kind, name):
+        """
+        :param kind: one of KINDS, ie. "address"
+        :return: entry of the closest definition of name as seen from device_group, None if not found
+        """
+        return self.find(device_group, kind, name)[1]
+
+    def inherited(self, device_group, kind):
+        """
+        :return: {name: entry} of everything the device group can use, overrides applied
+        """
+        merged = {}
+        for level in reversed(self.chain(device_group)):
+            merged.update(self.entries(level, kind))
+        return merged
+
+    def resolver(self, level):
+        """
+        AddressResolver for a device group (or SHARED), built on it's parent's resolver so
+        each level's objects are only parsed once.
+        """
+        if level not in self._resolvers:
+            objects = self.entries(level, "address").values()
+            groups = self.entries(level, "address-group").values()
+            if level == self.SHARED:
+                self._resolvers[level] = AddressResolver(list(objects), list(groups))
+            else:
+                parent = self.chain(level)[1]
+                self._resolvers[level] = self.resolver(parent).with_overrides(list(objects), list(groups))
+        return self._resolvers[level]
+
+
+READ_ONLY_TYPES = ("keygen", "version", "export")    # XML API types that never change anything
+READ_ONLY_ACTIONS = ("get", "show")                  # type=config (and log/report) actions that only read
+READ_ONLY_OPS = ("<show>",)                          # type=op commands that only read
+
+
+def is_idempotent(method, url, params=None, data=None):
+    """
+    Whether an API call only reads, so it can be sent again after a timeout or a 5xx.
+    Decided from the call itself, not the HTTP method, PAN-OS changes the config with GETs too
+    (type=op load/commit, type=config&action=set/edit/delete&element=...).
+
+    :param params: query parameters (dictionary) not already in the url
+    :param data: POST data (dictionary or list of pairs)
+    """
+    parts = urlsplit(url)
+    if "/restapi/" in parts.path:
+        return method == "GET"
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    for extra in (params, data):
+        if isinstance(extra, dict):
+            query.update(extra)
+        elif isinstance(extra, (list, tuple)):
+            query.update(x for x in extra if isinstance(x, tuple) and len(x) == 2)
+
+    call_type = query.get("type")
+    if call_type in READ_ONLY_TYPES:
+        return True
+    if call_type == "op":
+        return (query.get("cmd") or "").lstrip().startswith(READ_ONLY_OPS)
+    return query.get("action") in READ_ONLY_ACTIONS
+
+
+def _never_sent(error):
+    """
+    :return: True if the request failed before reaching the PA/Panorama (connect error/timeout)
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, requests.packages.urllib3.exceptions.NewConnectionError)
+
+
+class RequestScheduler:
+    """
+    Per PA/Panorama throttling for every API call, so long runs survive a busy management plane
+    without slowing the GUI down for everyone else:
+        - token bucket, at most RATE_LIMIT requests per second (RATE_BURST at once)
+        - adaptive concurrency, halved when latency rises to LATENCY_FACTOR times the baseline
+          or the PA/Panorama refuses a call, then grown back one call at a time (up to MAX_WORKERS)
+        - retries with jittered exponential backoff, calls that change something (see is_idempotent)
+          are only sent again on a 429 or if they never reached the PA/Panorama
+    """
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    RETRY_STATUS_UNSAFE = (429,)    # Refused before being processed
+    _hosts = {}
+    _hosts_lock = threading.Lock()
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, max_concurrency=MAX_WORKERS):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.latency = None     # Seconds, moving average
+        self.baseline = None    # Seconds, lowest latency seen (slowly forgotten)
+        self._decreased = 0     # time.monotonic() of the last decrease
+        self._cond = threading.Condition()
+
+    @classmethod
+    def for_host(cls, pa_ip):
+        """
+        :return: the RequestScheduler shared by every session talking to pa_ip
+        """
+        with cls._hosts_lock:
+            if pa_ip not in cls._hosts:
+                cls._hosts[pa_ip] = cls()
+            return cls._hosts[pa_ip]
+
+    def _take_token(self):
+        while self.rate:
+            with self._cond:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def _acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        self._take_token()
+
+    def _release(self, elapsed, overloaded):
+        with self._cond:
+            self.in_flight -= 1
+            if not overloaded:
+                self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+                self.baseline = elapsed if self.baseline is None else min(elapsed, self.baseline * 1.01)
+                if LATENCY_FACTOR and self.latency > max(LATENCY_FACTOR * self.baseline, LATENCY_MIN):
+                    overloaded = True
+
+            now = time.monotonic()
+            if overloaded:
+                # Once per round trip, the calls already in flight saw the same overload
+                if now - self._decreased > (self.latency or elapsed):
+                    self.limit = max(1.0, self.limit / 2)
+                    self._decreased = now
+                    if DEBUG:
+                        print(f"Slowing down, {int(self.limit)} concurrent calls")
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def backoff(self, attempt, response=None):
+        """
+        :return: seconds to wait before retry 'attempt', Retry-After is honored if sent
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), REQUEST_BACKOFF_MAX)
+        return random.uniform(0, min(REQUEST_BACKOFF_MAX, REQUEST_BACKOFF * 2 ** attempt))
+
+    def send(self, idempotent, send):
+        """
+        :param idempotent: the call only reads, it can be sent again whatever failed (see is_idempotent)
+        :param send: function making the request, called again for each retry
+        :return: requests.Response
+        """
+        for attempt in range(REQUEST_RETRIES + 1):
+            self._acquire()
+            start = time.monotonic()
+            response = error = None
+            try:
+                response = send()
+            except requests.exceptions.RequestException as e:
+                error = e
+            finally:
+                overloaded = error is not None or (response is not None and response.status_code in self.RETRY_STATUS)
+                self._release(time.monotonic() - start, overloaded)
+
+            if error is not None:
+                # A config change/op command might have been applied already, only retry if it never connected
+                retry = idempotent or _never_sent(error)
+            else:
+                retry = response.status_code in (self.RETRY_STATUS if idempotent else self.RETRY_STATUS_UNSAFE)
+            if not retry or attempt == REQUEST_RETRIES:
+                if error is not None:
+                    raise error
+                return response
+
+            wait = self.backoff(attempt, response)
+            if DEBUG:
+                print(f"Retrying in {wait:.1f}s ({attempt + 1}/{REQUEST_RETRIES}): {error or response.status_code}")
+            if response is not None:
+                response.close()
+            time.sleep(wait)
+
+
+class ScheduledSession(requests.Session):
+    """
+    requests session with every call going through the PA/Panorama's RequestScheduler,
+    and a default timeout (REQUEST_TIMEOUT).
+    Pass idempotent=True/False to override is_idempotent() for a call.
+    """
+    def __init__(self, pa_ip):
+        super().__init__()
+        self.scheduler = RequestScheduler.for_host(pa_ip)
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        if idempotent is None:
+            idempotent = is_idempotent(method.upper(), url, kwargs.get("params"), kwargs.get("data"))
+
+        # Uploaded files are read again if the call is retried
+        files = [f for f in (kwargs.get("files") or {}).values() if hasattr(f, "seek")]
+        positions = [f.tell() for f in files]
+
+        def send():
+            for f, position in zip(files, positions):
+                f.seek(position)
+            return super(ScheduledSession, self).request(method, url, **kwargs)
+
+        return self.scheduler.send(idempotent, send)
+
+
+# In-process logins, {(pa_ip, username): (session, key, password_hash)}
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _password_hash(password, salt):
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), 100000).hex()
+
+
+def read_key_cache():
+    """
+    Read the on-disk API key cache.
+
+    :return: dictionary of {"host|user": {"key", "expires", "salt", "check"}}, empty if unreadable
+    """
+    try:
+        with open(KEY_CACHE_FILE, "r") as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_key_cache(cache):
+    """
+    Write the API key cache, readable by the current user only (0600).
+    Expired entries are dropped.
+    """
+    now = time.time()
+    cache = {k: v for k, v in cache.items() if v.get("expires", 0) > now}
+    fd = os.open(KEY_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.chmod(KEY_CACHE_FILE, 0o600)     # In case the file already existed with wider permissions
+    with os.fdopen(fd, "w") as fout:
+        json.dump(cache, fout, indent=4)
+
+
+def get_cached_key(pa_ip, username, password):
+    """
+    Return the cached API key for this host/user, None if missing, expired,
+    or cached under a different password.
+    """
+    entry = read_key_cache().get(f"{pa_ip}|{username}")
+    if not entry or entry.get("expires", 0) < time.time():
+        return None
+    if _password_hash(password, entry["salt"]) != entry["check"]:
+        return None
+    return entry["key"]
+
+
+def cache_key(pa_ip, username, password, key):
+    """
+    Save an API key for this host/user to the on-disk cache, expires after KEY_CACHE_TTL.
+    The password itself is never stored, only a salted hash to confirm it matches next time.
+    """
+    salt = os.urandom(16).hex()
+    cache = read_key_cache()
+    cache[f"{pa_ip}|{username}"] = {
+        "key": key,
+        "expires": time.time() + KEY_CACHE_TTL,
+        "salt": salt,
+        "check": _password_hash(password, salt),
+    }
+    try:
+        write_key_cache(cache)
+    except OSError as e:
+        if DEBUG:
+            print(f"Unable to write {KEY_CACHE_FILE}: {e}")
+
+
+def uncache_key(pa_ip, username):
+    cache = read_key_cache()
+    if cache.pop(f"{pa_ip}|{username}", None):
+        try:
+            write_key_cache(cache)
+        except OSError:
+            pass
+
+
+def parse_api_output(xml_or_rest, response, xpath_or_restcall, filename=None):
+    """
+    Parse and archive a grab_api_output() response (api_lib_pa and async_api_lib_pa).
+
+    :param response: response text, XML or JSON
+    :return: the parsed response, ie. output["result"]["rules"]["entry"]
+    """
+    success = False
+    if xml_or_rest == "xml":
+
+        xml_response = xmltodict.parse(response)
+
+        if xml_response["response"]["@status"] == "success":
+            success = True
+
+        if filename:
+            write_archive(response, filename)
+
+        # if not xml_response["response"]["result"]:
+        #     print("Nothing found on PA/Panorama, are you connecting to the right device?")
+        #     print(f"Check {filename} for XML API reply")
+        #     sys.exit(0)
+
+    elif xml_or_rest == "rest":
+
+        json_response = json.loads(response)
+        if json_response["@status"] == "success":
+            success = True
+        if filename:
+            create_json_files(json_response, filename)
+
+        # if not json_response["result"]:
+        #     print("Nothing found on PA/Panorama, are you connecting to the right device?")
+        #     print(f"Check {filename} for XML API reply")
+
+    if not success:
+        # Extra logging when debugging
+        if DEBUG:
+            print(f"\nGET request sent: xpath={xpath_or_restcall}.\n")
+            print(f"\nResponse: \n{response}")
+            if filename:
+                write_archive(response, filename)
+                print(f"Output also written to {filename}")
+        else:
+            print(f"\nError exporting '{filename}' object.")
+            print(
+                "(Normally this just means no object found, set DEBUG=True if needed)"
+            )
+
+    if xml_or_rest == "xml":
+        return xml_response["response"]
+    else:
+        return json_response
+
+
+def build_response(url, status_code, content):
+    """
+    requests.Response from an already received reply (Cassette replay, async_api_lib_pa).
+    """
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = status_code
+    response.encoding = "utf-8"
+    response._content = content
+    response.raw = io.BytesIO(content)    # iter_api_entries() stream
+    return response
+
+
+class CassetteMiss(LookupError):
+    """
+    Replay (Cassette) of a request that was never recorded.
+    """
+    pass
+
+
+class Cassette:
+    """
+    Stand-in for the requests session, records every XML/REST response to a folder, or replays
+    them later without a device. Responses are keyed by method and the request parameters
+    (type/action/xpath/cmd, REST path), never the API key. keygen is never recorded.
+
+    Example:
+        pa.record("cassettes/customer1")                           # Live, everything is saved
+        pa = api_lib_pa.replay("cassettes/customer1")              # Offline, same answers
+    """
+    INDEX = "index.json"
+
+    def __init__(self, folder, mode="replay", session=None):
+        """
+        :param mode: "record" (session is required) or "replay"
+        :param session: requests session used to record
+        """
+        self.folder = folder
+        self.mode = mode
+        self.session = session
+        self._lock = threading.Lock()
+        self.index = {}
+        if os.path.exists(os.path.join(folder, self.INDEX)):
+            with open(os.path.join(folder, self.INDEX)) as fin:
+                self.index = json.load(fin)
+        elif mode == "replay":
+            raise CassetteMiss(f"No recordings found in {folder}")
+        self.index.setdefault("responses", {})
+
+    @property
+    def pa_type(self):
+        return self.index.get("pa_type")
+
+    @pa_type.setter
+    def pa_type(self, pa_type):
+        with self._lock:
+            self.index["pa_type"] = pa_type
+            self._write_index()
+
+    def _write_index(self):
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, self.INDEX), "w") as fout:
+            json.dump(self.index, fout, indent=4)
+
+    @staticmethod
+    def request_key(method, url, data=None):
+        """
+        :return: (filename, request details) for this request, the API key is left out
+        """
+        parts = urlsplit(url)
+        params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != "key"]
+        if isinstance(data, dict):
+            params += [(k, str(v)) for k, v in data.items() if k != "key"]
+        details = {"method": method, "path": parts.path, "params": sorted(params)}
+        digest = hashlib.sha1(json.dumps(details, sort_keys=True).encode()).hexdigest()[:16]
+        params = dict(params)
+        label = "-".join(x for x in (params.get("type"), params.get("action")) if x) or "rest"
+        return f"{label}-{digest}.xml", details
+
+    def request(self, method, url, data=None, **kwargs):
+        filename, details = self.request_key(method, url, data)
+
+        if self.mode == "replay":
+            recorded = self.index["responses"].get(filename)
+            if not recorded:
+                raise CassetteMiss(f"Not recorded in {self.folder}: {details}")
+            with open(os.path.join(self.folder, filename), "rb") as fin:
+                return build_response(url, recorded["status_code"], fin.read())
+
+        # Record, read it all (not streamed) so it can be saved and replayed to the caller
+        kwargs.pop("stream", None)
+        response = self.session.request(method, url, data=data, **kwargs)
+        os.makedirs(self.folder, exist_ok=True)
+        with open(os.path.join(self.folder, filename), "wb") as fout:
+            fout.write(response.content)
+        with self._lock:
+            self.index["responses"][filename] = dict(details, status_code=response.status_code)
+            self._write_index()
+        return build_response(url, response.status_code, response.content)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request("POST", url, data=data, **kwargs)
+
+
 # XML API Class for use with Palo Alto API
 class api_lib_pa:
     # Upon creation:
@@ -211,11 +1840,106 @@ class api_lib_pa:
         self.template_name = None
         self.session = {}
         self.key = 0
+        self.snapshot = None    # ConfigSnapshot, see use_snapshot()
 
         self.login(self.pa_ip, username, password)
 
+    @classmethod
+    def _offline(cls, pa_ip, pa_type):
+        # No login, see from_snapshot() and replay()
+        pa = cls.__new__(cls)
+        pa.pa_ip = pa_ip
+        pa.username = None
+        pa.password = None
+        pa.pa_type = pa_type
+        pa.device_group = None
+        pa.template_name = None
+        pa.session = {}
+        pa.key = 0
+        pa.snapshot = None
+        return pa
+
+    @classmethod
+    def from_snapshot(cls, snapshot, pa_type=None):
+        """
+        Offline, every grab_api_output() query is answered from the snapshot, nothing is sent.
+
+        :param snapshot: ConfigSnapshot, ie. ConfigSnapshot.from_file("running-config.xml")
+        :param pa_type: "pa" or "panorama", default is based on the config
+        """
+        pa = cls._offline(None, pa_type or snapshot.pa_type)
+        pa.snapshot = snapshot
+        return pa
+
+    @classmethod
+    def replay(cls, folder, pa_type=None):
+        """
+        Offline, every request is answered from a recording, see record() and Cassette.
+
+        :param folder: cassette folder
+        :param pa_type: "pa" or "panorama", default is the recorded one
+        """
+        cassette = Cassette(folder, "replay")
+        pa = cls._offline("replay", pa_type or cassette.pa_type)
+        pa.session[pa.pa_ip] = cassette
+        return pa
+
+    def record(self, folder):
+        """
+        Save every request's response from now on to a cassette folder, see replay().
+        """
+        cassette = Cassette(folder, "record", self.session[self.pa_ip])
+        cassette.pa_type = self.pa_type
+        self.session[self.pa_ip] = cassette
+        return cassette
+
+    def use_snapshot(self, source="running", filename=None):
+        """
+        Grab the whole running/candidate config once, then answer every grab_api_output()
+        query from it instead of one API call per xpath. Pushes still go to the PA/Panorama.
+
+        :param source: "running" or "candidate"
+        :param filename: optional archive filename for the config
+        """
+        print(f"Grabbing the {source} config..")
+        self.snapshot = ConfigSnapshot.from_pa(self, source, filename)
+        return self.snapshot
+
     # Called from init(), login to the Palo Alto
     def login(self, pa_ip, username, password):
+        """
+        Login to the PA/Panorama, in order of preference:
+            1) Reuse a session/key already created by this process (ie. the login test in __main__)
+            2) Reuse a cached API key (KEY_CACHE_FILE), after confirming it still works
+            3) keygen
+        """
+
+        # Already logged in from this process
+        password_hash = hashlib.sha256(password.encode()).hexdigest()
+        with _sessions_lock:
+            existing = _sessions.get((pa_ip, username))
+        if existing and existing[2] == password_hash:
+            self.session[pa_ip], self.key, _ = existing
+            return
+
+        # Create requests session, size the connection pool for grab_api_output_batch()
+        sess = ScheduledSession(pa_ip)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS
+        )
+        sess.mount("https://", adapter)
+        self.session[pa_ip] = sess
+
+        # Cached key from a previous run
+        if KEY_CACHE:
+            cached_key = get_cached_key(pa_ip, username, password)
+            if cached_key and self.check_key(cached_key):
+                self.key = cached_key
+                with _sessions_lock:
+                    _sessions[(pa_ip, username)] = (sess, self.key, password_hash)
+                return
+            elif cached_key:
+                uncache_key(pa_ip, username)
 
         # Create URL's
         base_url_str = f"https://{pa_ip}/"  # Base URL
@@ -225,9 +1949,6 @@ class api_lib_pa:
             base_url_str + login_action + login_data
         )  # URL for posting login data
 
-        # Create requests session
-        sess = requests.session()
-
         # get API key
         login_response = sess.post(url=login_url, verify=False)
 
@@ -237,13 +1958,38 @@ class api_lib_pa:
             sys.exit(0)
 
         # Set successful session and key
-        self.session[pa_ip] = sess
         temp = xmltodict.parse(login_response.text)
         self.key = temp.get("response").get("result").get("key")
         if not self.key:
             print(f"Login Failed: Response=\n{temp}")
             sys.exit(0)
 
+        with _sessions_lock:
+            _sessions[(pa_ip, username)] = (sess, self.key, password_hash)
+        if KEY_CACHE:
+            cache_key(pa_ip, username, password, self.key)
+
+
+    # Validate an API key without running keygen
+    def check_key(self, key):
+        """
+        Send a lightweight op command with this key.
+
+        :param key: API key to test
+        :return: True if the PA/Panorama accepted the key
+        """
+        url = f"https://{self.pa_ip}:443/api?type=op&cmd=<show><clock></clock></show>&key={key}"
+        try:
+            response = self.session[self.pa_ip].get(url, verify=False)
+        except requests.exceptions.RequestException:
+            return False
+        if response.status_code != 200:
+            return False
+        try:
+            return xmltodict.parse(response.text)["response"]["@status"] == "success"
+        except Exception:
+            return False
+
 
     # Grab Panorama Device Groups & Templates
     def grab_panorama_objects(self):
@@ -254,7 +2000,7 @@ class api_lib_pa:
 
         # Need to check for no response, must be an IP not address
         if "entry" in temp_device_groups["result"]["device-group"]:
-            for entry in temp_device_groups["result"]["device-group"]["entry"]:
+            for entry in as_list(temp_device_groups["result"]["device-group"]["entry"]):
                 device_groups.append(entry["@name"])
         else:
             print(f"Error, Panorama chosen but no Device Groups found.")
@@ -347,56 +2093,393 @@ class api_lib_pa:
 
 
 
+    # POST request for Palo Alto API, for large elements that don't fit in a URL
+    def post_xml_request_pa(self, call_type="config", action="set", xpath=None, element=None):
+        url = f"https://{self.pa_ip}:443/api/"
+        data = {"type": call_type, "action": action, "key": self.key}
+        if xpath:
+            data["xpath"] = xpath
+        if element:
+            data["element"] = element
+
+        # Make the API call
+        response = self.session[self.pa_ip].post(url, data=data, verify=False)
+
+        # Extra logging if debugging
+        if DEBUG:
+            print(
+                f"\nPOST request sent: type={call_type}, action={action}, \n  xpath={xpath}.\n"
+            )
+            print(f"\nResponse Status Code = {response.status_code}")
+            print(f"\nResponse = {response.text}")
+
+        # Return response
+        return response
+
+
+    def push_rule_delta(self, xpath, delta, size=MULTI_CONFIG_SIZE):
+        """
+        Apply a rule_delta() to the rulebase at xpath, 'size' changes per multi-config request (PAN-OS 9.0+).
+        Each request is all or nothing, later requests are still sent if one fails.
+
+        :param xpath: rulebase xpath, ie. XPATH_SECURITY_RULES_PRE_PAN with the device group
+        :return: list of (number of changes, True/False, response text), one per request
+        """
+        results = []
+        for start in range(0, len(delta), size):
+            changes = []
+            for index, (action, name, entry, before) in enumerate(delta[start:start + size], start=start + 1):
+                entry_xpath = xml.sax.saxutils.quoteattr(f"{xpath}/entry[@name='{name}']")
+                if action == "set":
+                    parent_xpath = xml.sax.saxutils.quoteattr(xpath)
+                    changes.append(f'<set id="{index}" xpath={parent_xpath}>{entry_element(entry)}</set>')
+                elif action == "edit":
+                    changes.append(f'<edit id="{index}" xpath={entry_xpath}>{entry_element(entry)}</edit>')
+                elif action == "move":
+                    dst = xml.sax.saxutils.quoteattr(before)
+                    changes.append(f'<move id="{index}" xpath={entry_xpath} where="before" dst={dst}/>')
+                else:
+                    changes.append(f'<delete id="{index}" xpath={entry_xpath}/>')
+
+            element = "<multi-configure-request>" + "".join(changes) + "</multi-configure-request>"
+            response = self.post_xml_request_pa("config", "multi-config", element=element)
+            try:
+                success = xmltodict.parse(response.text)["response"]["@status"] == "success"
+            except Exception:
+                success = False
+            results.append((len(changes), success, response.text))
+        return results
+
+
+    def load_partial_config(self, fname, from_xpath, to_xpath, mode="replace"):
+        """
+        Load part of an imported named configuration (import_named_configuration) into the candidate config.
+
+        :param fname: named configuration, filename without any folders
+        :param from_xpath: xpath within the named configuration
+        :param to_xpath: xpath within the candidate config
+        :return: response
+        """
+        cmd = f"<load><config><partial><mode>{mode}</mode><from-xpath>{from_xpath}</from-xpath><to-xpath>{to_xpath}</to-xpath><from>{fname}</from></partial></config></load>"
+        url = f"https://{self.pa_ip}:443/api/?type=op&key={self.key}&cmd={cmd}"
+
+        # Make the API call
+        response = self.session[self.pa_ip].get(url, verify=False)
+
+        # Extra logging if debugging
+        if DEBUG:
+            print(f"URL = {url}")
+            print(f"\nResponse Status Code = {response.status_code}")
+            print(f"\nResponse = {response.text}")
+
+        # Return response
+        return response
+
+    # Operational command for Palo Alto API
+    def op(self, cmd):
+        """
+        :param cmd: op command XML, ie. <show><system><info></info></system></show>
+        :return: response
+        """
+        url = f"https://{self.pa_ip}:443/api/?type=op&key={self.key}&cmd={cmd}"
+
+        # Make the API call
+        response = self.session[self.pa_ip].get(url, verify=False)
+
+        # Extra logging if debugging
+        if DEBUG:
+            print(f"\nop request sent: cmd={cmd}")
+            print(f"\nResponse Status Code = {response.status_code}")
+            print(f"\nResponse = {response.text}")
+
+        # Return response
+        return response
+
+
     def grab_api_output(
         self, xml_or_rest, xpath_or_restcall, filename=None,
     ):
         # Grab PA/Panorama API Output
-        success = False
-        if xml_or_rest == "xml":
+        if xml_or_rest == "xml" and self.snapshot:
+            return self.snapshot.grab_api_output(xpath_or_restcall, filename)
 
+        if xml_or_rest == "xml":
             response = self.get_xml_request_pa(
                 call_type="config", action="get", xpath=xpath_or_restcall
             )
-            xml_response = xmltodict.parse(response)
-
-            if xml_response["response"]["@status"] == "success":
-                success = True
+        else:
+            response = self.get_rest_request_pa(restcall=xpath_or_restcall)
 
-            if filename:
-                create_xml_files(xml_response, filename)
+        return parse_api_output(xml_or_rest, response, xpath_or_restcall, filename)
 
-            # if not xml_response["response"]["result"]:
-            #     print("Nothing found on PA/Panorama, are you connecting to the right device?")
-            #     print(f"Check {filename} for XML API reply")
-            #     sys.exit(0)
 
-        elif xml_or_rest == "rest":
+    def iter_api_entries(self, xpath, filename=None, depth=4):
+        """
+        Streaming version of grab_api_output() for large rulebases.
+        The response is parsed as it arrives and each <entry> is yielded one at a time
+        (same dict structure as xmltodict), then discarded. The raw response bytes are
+        written straight to the archive (ArchiveWriter), never held in memory as a whole.
 
-            response = self.get_rest_request_pa(restcall=xpath_or_restcall)
-            json_response = json.loads(response)
-            if json_response["@status"] == "success":
-                success = True
+        :param xpath: xpath to 'get', ie. XPATH_SECURITY_RULES_PRE_PAN
+        :param filename: optional archive filename, see archive_filename()
+        :param depth: depth of the <entry> tags to yield, <response><result><rules><entry> = 4
+        :return: generator of entry dictionaries
+        """
+        if self.snapshot:
             if filename:
-                create_json_files(json_response, filename)
-
-            # if not json_response["result"]:
-            #     print("Nothing found on PA/Panorama, are you connecting to the right device?")
-            #     print(f"Check {filename} for XML API reply")
-
-        if not success:
-            # Extra logging when debugging
-            if DEBUG:
-                print(f"\nGET request sent: xpath={xpath_or_restcall}.\n")
-                print(f"\nResponse: \n{response}")
-                create_xml_files(response, filename)
-                print(f"Output also written to {filename}")
-            else:
+                write_archive(self.snapshot.response(xpath), filename)
+            yield from self.snapshot.iter_entries(xpath)
+            return
+
+        url = f"https://{self.pa_ip}:443/api?type=config&action=get&xpath={xpath}&key={self.key}"
+        response = self.session[self.pa_ip].get(url, verify=False, stream=True)
+        response.raw.decode_content = True
+
+        fout = ArchiveWriter(filename) if filename else None
+        try:
+            parents = []
+            success = False
+            for event, elem in ElementTree.iterparse(
+                _TeeReader(response.raw, fout), events=("start", "end")
+            ):
+                if event == "start":
+                    if not parents:
+                        success = elem.get("status") == "success"
+                    parents.append(elem)
+                    continue
+
+                parents.pop()
+                if len(parents) == depth - 1 and elem.tag == "entry":
+                    yield element_to_dict(elem)
+                    parents[-1].remove(elem)   # Done with this entry, free it
+
+            if not success:
                 print(f"\nError exporting '{filename}' object.")
                 print(
                     "(Normally this just means no object found, set DEBUG=True if needed)"
                 )
+        finally:
+            if fout:
+                fout.close()
+            response.close()
+
+
+    def grab_api_output_batch(self, jobs, max_workers=MAX_WORKERS):
+        """
+        Run grab_api_output() for many xpaths at once.
+        Jobs are sent concurrently over a bounded thread pool sharing this object's session,
+        so total wait time is roughly the slowest single call instead of the sum of them all.
+
+        :param jobs: list of (xpath, filename) or (xml_or_rest, xpath_or_restcall, filename) tuples
+        :param max_workers: max number of concurrent API calls
+        :return: dictionary of {job: grab_api_output() result}
+        """
+        results = {}
+        if not jobs:
+            return results
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(max_workers, len(jobs))
+        ) as executor:
+            futures = {}
+            for job in jobs:
+                if len(job) == 2:
+                    args = ("xml", *job)
+                else:
+                    args = job
+                futures[executor.submit(self.grab_api_output, *args)] = job
+
+            for future in concurrent.futures.as_completed(futures):
+                results[futures[future]] = future.result()
+
+        return results
+
+
+# asyncio sibling of api_lib_pa, for talking to many PA/Panoramas from one process
+class async_api_lib_pa:
+    """
+    Same calls as api_lib_pa, as coroutines (aiohttp, pip install aiohttp).
+    Connections are kept alive and pooled, at most ASYNC_LIMIT_PER_HOST calls run at once per
+    PA/Panorama, and failed calls (connection errors, timeouts, 5xx/429) are retried with backoff,
+    POSTs only when they can't have been applied (429/503, or never connected), same as RequestScheduler.
+    Pass the same aiohttp session to every firewall to share one connection pool.
+
+    Example:
+        async with aiohttp.ClientSession() as session:
+            pas = [await async_api_lib_pa.create(ip, username, password, "pa", session) for ip in ips]
+            outputs = await asyncio.gather(*(pa.grab_api_output("xml", XPATH_NAT_RULES) for pa in pas))
+    """
+    # {event loop: {pa_ip: asyncio.Semaphore}}, shared by every object talking to that host,
+    # forgotten with the event loop
+    _semaphores = weakref.WeakKeyDictionary()
 
+    def __init__(self, pa_ip, username, password, pa_type, session=None):
+        self.pa_ip = pa_ip
+        self.username = username
+        self.password = password
+        self.pa_type = pa_type
+        self.device_group = None
+        self.template_name = None
+        self.session = session
+        self.key = 0
+        self._own_session = session is None
+
+    @classmethod
+    async def create(cls, pa_ip, username, password, pa_type, session=None):
+        """
+        :param session: optional aiohttp.ClientSession, shared by all the PA/Panoramas
+        :return: logged in async_api_lib_pa
+        """
+        pa = cls(pa_ip, username, password, pa_type, session)
+        await pa.login()
+        return pa
+
+    async def __aenter__(self):
+        if not self.key:
+            await self.login()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        if self._own_session and self.session:
+            await self.session.close()
+            self.session = None
+
+    def _semaphore(self):
+        semaphores = self._semaphores.setdefault(asyncio.get_running_loop(), {})
+        if self.pa_ip not in semaphores:
+            semaphores[self.pa_ip] = asyncio.Semaphore(ASYNC_LIMIT_PER_HOST)
+        return semaphores[self.pa_ip]
+
+    async def _request(self, method, url, data=None, idempotent=None, **kwargs):
+        """
+        :param data: POST data, or a function returning it (multipart forms can only be sent once)
+        :param idempotent: override is_idempotent() for this call
+        :return: requests.Response (see build_response()), so callers can use it like api_lib_pa's
+        """
+        import aiohttp
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=False, limit_per_host=ASYNC_LIMIT_PER_HOST)
+            )
+            self._own_session = True
+
+        # A config change/op command might have been applied already, see RequestScheduler.send()
+        if idempotent is None:
+            idempotent = is_idempotent(method, url, kwargs.get("params"), None if callable(data) else data)
+        if idempotent:
+            retry_status = RequestScheduler.RETRY_STATUS
+            retry_errors = (aiohttp.ClientError, asyncio.TimeoutError)
+        else:
+            retry_status = RequestScheduler.RETRY_STATUS_UNSAFE
+            retry_errors = aiohttp.ClientConnectorError
+
+        timeout = aiohttp.ClientTimeout(total=ASYNC_TIMEOUT)
+        for attempt in range(ASYNC_RETRIES + 1):
+            try:
+                async with self._semaphore():
+                    async with self.session.request(
+                        method, url, data=data() if callable(data) else data, ssl=False, timeout=timeout, **kwargs
+                    ) as response:
+                        content = await response.read()
+                if response.status not in retry_status or attempt == ASYNC_RETRIES:
+                    return build_response(url, response.status, content)
+            except retry_errors:
+                if attempt == ASYNC_RETRIES:
+                    raise
+            if DEBUG:
+                print(f"Retrying ({attempt + 1}/{ASYNC_RETRIES}): {method} {url.split('&key=')[0]}")
+            await asyncio.sleep(ASYNC_BACKOFF * 2 ** attempt)
+
+    async def login(self):
+        """
+        Cached API key (KEY_CACHE_FILE) if it still works, otherwise keygen.
+        """
+        if KEY_CACHE:
+            cached_key = get_cached_key(self.pa_ip, self.username, self.password)
+            if cached_key and await self.check_key(cached_key):
+                self.key = cached_key
+                return
+            elif cached_key:
+                uncache_key(self.pa_ip, self.username)
+
+        response = await self._request(
+            "POST", f"https://{self.pa_ip}/api?type=keygen",
+            data={"user": self.username, "password": self.password},
+        )
+        if response.status_code == 403:
+            raise PermissionError(f"Login Failed: {self.pa_ip}")
+        temp = xmltodict.parse(response.text)
+        self.key = (temp.get("response").get("result") or {}).get("key")
+        if not self.key:
+            raise PermissionError(f"Login Failed: {self.pa_ip}, Response=\n{temp}")
+        if KEY_CACHE:
+            cache_key(self.pa_ip, self.username, self.password, self.key)
+
+    async def check_key(self, key):
+        url = f"https://{self.pa_ip}:443/api?type=op&cmd=<show><clock></clock></show>&key={key}"
+        try:
+            response = await self._request("GET", url)
+            return xmltodict.parse(response.text)["response"]["@status"] == "success"
+        except Exception:
+            return False
+
+    async def get_xml_request_pa(self, call_type="config", action="show", xpath=None, element=None):
+        if not element:
+            url = f"https://{self.pa_ip}:443/api?type={call_type}&action={action}&xpath={xpath}&key={self.key}"
+        else:
+            url = f"https://{self.pa_ip}:443/api?type={call_type}&action={action}&xpath={xpath}&key={self.key}&element={element}"
+        response = await self._request("GET", url)
+        return response.text
+
+    async def get_rest_request_pa(self, restcall=None, element=None):
+        if not element:
+            url = f"https://{self.pa_ip}:443{restcall}"
+        else:
+            url = f"https://{self.pa_ip}:443{restcall}&element={element}"
+        response = await self._request("GET", url, headers={"X-PAN-KEY": self.key})
+        return response.text
+
+    async def op(self, cmd):
+        """
+        :param cmd: op command XML, ie. <show><system><info></info></system></show>
+        :return: response text
+        """
+        response = await self._request("GET", f"https://{self.pa_ip}:443/api?type=op&cmd={cmd}&key={self.key}")
+        return response.text
+
+    async def import_named_configuration(self, xml_config, call_type="import", category="configuration"):
+        import aiohttp
+
+        url = f"https://{self.pa_ip}:443/api?type={call_type}&category={category}&key={self.key}"
+        filename = os.path.basename(getattr(xml_config, "name", "config.xml"))
+        if hasattr(xml_config, "read"):
+            xml_config = xml_config.read()
+
+        def form():
+            form = aiohttp.FormData()
+            form.add_field("file", xml_config, filename=filename)
+            return form
+
+        return await self._request("POST", url, data=form)
+
+    async def grab_api_output(self, xml_or_rest, xpath_or_restcall, filename=None):
         if xml_or_rest == "xml":
-            return xml_response["response"]
+            response = await self.get_xml_request_pa(call_type="config", action="get", xpath=xpath_or_restcall)
         else:
-            return json_response
+            response = await self.get_rest_request_pa(restcall=xpath_or_restcall)
+        return parse_api_output(xml_or_rest, response, xpath_or_restcall, filename)
+
+    async def grab_api_output_batch(self, jobs):
+        """
+        Same as api_lib_pa.grab_api_output_batch(), bounded by ASYNC_LIMIT_PER_HOST instead of threads.
+
+        :return: dictionary of {job: grab_api_output() result}
+        """
+        outputs = await asyncio.gather(
+            *(self.grab_api_output(*(("xml", *job) if len(job) == 2 else job)) for job in jobs)
+        )
+        return dict(zip(jobs, outputs))
@@ -42,10 +42,8 @@ import concurrent.futures
 import json
 import time
 import xml.dom.minidom
-import copy
 import argparse
 
-import ipcalc
 import xmltodict
 from xml.etree.ElementTree import fromstring, ElementTree
 import api_lib_pa as pa_api
@@ -64,47 +62,44 @@ from panos import device
 class mem:
     address_object_entries = None
     address_group_entries = None
+    resolver = pa_api.AddressResolver()
+    reported = set()
+    matcher = None          # pa_api.SubnetMatcher(settings.EXISTING_TRUST_SUBNET)
+    trust_matches = {}      # address/group name: True if it overlaps EXISTING_TRUST_SUBNET
     singleip = False
 
 
 def addr_obj_check(entry):
-    def address_lookup(address_object, found):
-        for obj in mem.address_object_entries:
-            if address_object in obj.name:
-                if obj.type == "ip-netmask":
-                    found = True
-                    return [obj.value]
-                else:
-                    print("non ip-netmask, add support plz")
-                    return ["1.1.1.1"]
-        if not found:   # IP as Name
-            return [address_object]
-        
-        return None
-
-
-    found = False
-    ips = []
-    # Check Objects
-    for grp in mem.address_group_entries:
-        if entry == grp.name:
-            if grp.static_value:
-                found = True
-                address_objects = grp.static_value
-                for obj in address_objects:
-                    ips += address_lookup(obj, found)
-            else:
-                print("Not supported, hi.")
-    if not found:
-        ips += address_lookup(entry, found)
+
+    # Already checked
+    if entry in mem.trust_matches:
+        return mem.trust_matches[entry]
+
+    # Address objects and groups (including nested groups) resolved to their IP's
+    ips = mem.resolver.resolve(entry)
+    for name in mem.resolver.unsupported.keys() - mem.reported:
+        mem.reported.add(name)
+        print(f"non ip-netmask or dynamic object {name}, add support plz")
     
-    for ip in ips:
-        iprange = ipcalc.Network(ip)
-        for subnet in settings.EXISTING_TRUST_SUBNET:
-            if subnet in iprange:
-                return True 
+    found = mem.matcher.overlaps(ips)
+    mem.trust_matches[entry] = found
+
+    return found
+
+
+def clone_rule(old_rule):
+    """
+    Copy only the rule's values, copy.deepcopy() also copied it's parent (the whole device/rulebase tree).
+    Lists are copied since the clone modifies them in place, everything else is shared with old_rule.
 
-    return False
+    :param old_rule: policies.SecurityRule
+    :return: new, unattached, policies.SecurityRule
+    """
+    params = {
+        key: list(value) if isinstance(value, list) else value
+        for key, value in old_rule.about().items()
+    }
+    return type(old_rule)(**params)
 
 
 def should_be_cloned(old_rule, srcdst, new_rule=None):
@@ -141,7 +136,7 @@ def should_be_cloned(old_rule, srcdst, new_rule=None):
                     # Clone/Modify this
                     clone = True
                     if not new_rule:
-                        new_rule = copy.deepcopy(old_rule)
+                        new_rule = clone_rule(old_rule)
                         new_zones = getattr(new_rule, x_zone_attr)
                         
                     # Remove 'any', add new Zone
@@ -156,7 +151,7 @@ def should_be_cloned(old_rule, srcdst, new_rule=None):
                     if tag:
                         clone = True
                         if not new_rule:
-                            new_rule = copy.deepcopy(old_rule)
+                            new_rule = clone_rule(old_rule)
                             new_zones = getattr(new_rule, x_zone_attr)
 
                         #add_tag(settings.REVIEW_TAG)
@@ -254,6 +249,7 @@ def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
     for subnet in settings.EXISTING_TRUST_SUBNET:
         if subnet.endswith("/32"):
             mem.singleip = True
+    mem.matcher = pa_api.SubnetMatcher(settings.EXISTING_TRUST_SUBNET)
 
     if pa_type == "panorama":
 
@@ -271,28 +267,8 @@ def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
         dg.add(post_rulebase)
         panfw.add(dg)
 
-        # Grab Objects and Rules
-        mem.address_object_entries = objects.AddressObject.refreshall(dg, add=False)#,add=False)
-        mem.address_group_entries = objects.AddressGroup.refreshall(dg, add=False)#,add=False)
-
-        #Grabbing the Shared address objects and groups..
-        shared = panorama.DeviceGroup('shared')
-        panfw.add(shared)
-
-        shared_objects = objects.AddressObject.refreshall(shared, add=False)
-        mem.address_object_entries += shared_objects
-        shared_groups = objects.AddressGroup.refreshall(shared, add=False)
-        mem.address_group_entries += shared_groups
-
-        # Add parent DG (like Shared), if used. Ask Chris Evans or me for details.
-        if settings.OBJ_PARENT_DEVICE_GROUP:
-            parent_dg = panorama.DeviceGroup(settings.OBJ_PARENT_DEVICE_GROUP)
-            panfw.add(parent_dg)
-
-            parent_objects = objects.AddressObject.refreshall(parent_dg, add=False)
-            mem.address_object_entries += parent_objects
-            parent_groups = objects.AddressGroup.refreshall(parent_dg, add=False)
-            mem.address_group_entries += parent_groups
+        # Grab Objects, the device group's, every parent device group's and Shared (closest one wins)
+        mem.resolver = pa_api.DeviceGroupCache(pa).resolver(device_group)
 
         # GRAB PRE/POST RULES
         pre_security_rules = policies.SecurityRule.refreshall(pre_rulebase)#, add=False)
@@ -314,6 +290,8 @@ def eastwesthelper(pa_ip, username, password, pa_type, filename=None):
         mem.address_object_entries = objects.AddressObject.refreshall(panfw,add=False)
         mem.address_group_entries = objects.AddressGroup.refreshall(panfw,add=False)
 
+        mem.resolver = pa_api.AddressResolver.from_panos(mem.address_object_entries, mem.address_group_entries)
+
         rulebase = policies.Rulebase()
         panfw.add(rulebase)
         security_rules = policies.SecurityRule.refreshall(rulebase)
@@ -5,11 +5,10 @@ Description:
     Send Gratuitous ARP out, typically during the cutover of a new FW.
 
 Requires:
-    ipcalc
     requests
     xmltodict
     lxml
-        to install try: pip3 install xmltodict requests lxml ipcalc
+        to install try: pip3 install xmltodict requests lxml
 
 Author:
     Ryan Gillespie rgillespie@compunet.biz
@@ -24,6 +23,23 @@ Example usage:
         $ python3 garp.py <destination folder> <PA(N) mgmt IP> <username>
         Password: 
 
+    Offline, from an exported running/candidate config:
+        $ python3 garp.py -x running-config.xml
+
+    Fleet, every PA/Panorama in an inventory file (host[,template,device group] per line):
+        $ python3 garp.py -f inventory.csv -u <username>
+        Password: 
+
+    Hardware swap, only the IP's new to (or moving interface on) the incoming firewall, each side an
+    archived api/<timestamp>/ folder, an exported config or a PA/Panorama:
+        $ python3 garp.py -d old-running-config.xml <new PA mgmt IP> -u <username>
+
+    Which NAT rules translate to an IP (or a pool/subnet containing it):
+        $ python3 garp.py -x running-config.xml --nat-lookup 203.0.113.10
+
+    Send the gARP's too (through the API, 2 per second per interface), with a report:
+        $ python3 garp.py -i <PA(N) mgmt IP> -u <username> --send --rate 2
+
 Cautions:
     - Source-NAT only (discovers and outputs others)
     - Panorama Post-NAT rules only (for now)
@@ -42,76 +58,254 @@ Legal:
 from getpass import getpass
 import sys
 import os
-import ipcalc
+import ipaddress
 import time
 import argparse
 import copy
+import collections
+import csv
+import json
+import io
+import contextlib
+import concurrent.futures
+import itertools
+import threading
 
 import xmltodict
 import api_lib_pa as pa_api
 
 DEBUG = False
+GARP_RATE = 2       # gARP's per second per interface (--send), spares the upstream switch CPU's
+GARP_WORKERS = 4    # gARP's sent at the same time per PA/Panorama (--send)
+INTERFACE_TYPES = ("ethernet", "aggregate-ethernet", "vlan", "loopback", "tunnel")
+ARP_INTERFACE_TYPES = ("ethernet", "aggregate-ethernet", "vlan")    # The rest don't need a gARP
 
-class mem: 
-    ip_to_eth_dict = {}
-    review_nats = []
-    address_object_entries = None
-
-
-def iterdict(d, searchfor):
+class InterfaceTrie:
     """
-    Traverse through the dictionary (d) and find the key: (searchfor).
-    Return the value of that key.
+    Longest-prefix-match table of interface networks (IPv4 and IPv6), binary trie on the address bits.
+    Built once from the interface IP's, lookups return the most specific interface for an IP/network.
     """
-    for k, v in d.items():
-        if searchfor in k:
-            return v
-        elif isinstance(v, dict):
-            return iterdict(v, searchfor)
-        else:
-            pass
+    def __init__(self):
+        self.roots = {4: [None, None, None], 6: [None, None, None]}  # node = [0-child, 1-child, ifname]
+
+    @staticmethod
+    def _network(ip):
+        try:
+            return ipaddress.ip_network(ip, strict=False)
+        except ValueError:
+            return None
 
+    def insert(self, ip, ifname):
+        """
+        :param ip: interface IP with mask, ie. 10.1.1.1/24
+        :param ifname: interface name
+        :return: False if ip isn't an IP/network (ie. an address object name)
+        """
+        network = self._network(ip)
+        if not network:
+            return False
+
+        node = self.roots[network.version]
+        bits = int(network.network_address)
+        for i in range(network.max_prefixlen - 1, network.max_prefixlen - network.prefixlen - 1, -1):
+            bit = (bits >> i) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:     # Same subnet twice, keep the first interface found
+            node[2] = ifname
+        return True
+
+    def lookup(self, ip):
+        """
+        :param ip: IP or network, ie. 10.1.1.5 or 10.1.1.0/28
+        :return: interface name of the most specific network containing ip, None if not found
+        """
+        network = self._network(ip)
+        if not network:
+            return None
+
+        node = self.roots[network.version]
+        found = node[2]
+        bits = int(network.network_address)
+        for i in range(network.max_prefixlen - 1, network.max_prefixlen - network.prefixlen - 1, -1):
+            node = node[(bits >> i) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                found = node[2]
+        return found
 
-def interface_lookup(ip):
-    """
-    Used to find which physical interface is associated with this IP (NAT entry).
-    Uses existing dictionary mapping ip/mask to physical interface.
-    Searches based on the subnet mask in use on the physical interface.
-    """
-    for key, v in mem.ip_to_eth_dict.items():
-        iprange = ipcalc.Network(key)
-        if ip in iprange:
-            return v
 
+NatTranslation = collections.namedtuple("NatTranslation", "ip interface rule kind address disabled")
 
-def address_lookup(entry):
+
+class NatIndex:
     """
-    Used to find the translated addresses objects on the PA/Panorama.
-    Runs another api call to grab the object and return it's value (the actual ip address)
-    If the NAT rule isn't using an object, we can assume this value is the IP address.
-    Returns a LIST
+    Every NAT rule's translated addresses, built once per run (see add):
+        translated IP -> NatTranslation's (rule, kind, egress interface)
+    Kinds: dynamic-ip-and-port, dynamic-ip, static-ip, static-ip bi-directional, interface-address,
+    destination and dynamic-destination.
+    Objects are resolved, and IP's matched to their interface, once no matter how many rules use them.
     """
+    SOURCE_KINDS = ("dynamic-ip-and-port", "dynamic-ip", "static-ip", "static-ip bi-directional", "interface-address")
+
+    def __init__(self, resolver=None, interface_lookup=None):
+        """
+        :param resolver: pa_api.AddressResolver for the translated address objects
+        :param interface_lookup: function, IP -> egress interface name (or None)
+        """
+        self.resolver = resolver or pa_api.AddressResolver()
+        self.interface_lookup = interface_lookup or (lambda ip: None)
+        self.by_ip = {}         # IP (no mask): [NatTranslation]
+        self.by_address = {}    # address object/IP as configured: [NatTranslation]
+        self.by_rule = {}       # rule name: [NatTranslation]
+        self.pools = {4: {}, 6: {}}     # IP version: {prefix length: {network: [NatTranslation]}}, translated subnets/pools
+        self.unsupported = {}   # object name: entry, objects that aren't ip-netmask
+        self._resolved = {}     # object name: [IP]
+        self._egress = {}       # IP: interface
+
+    @staticmethod
+    def members(value):
+        """
+        'a', ['a', 'b'] or {'member': ...} -> ['a', 'b']
+        """
+        if isinstance(value, dict):
+            value = value.get("member")
+        return [x for x in pa_api.as_list(value) if isinstance(x, str)]
+
+    def resolve(self, name):
+        """
+        :return: list of IP's for an address object/group or IP, memoized
+        """
+        if name not in self._resolved:
+            ips = self.resolver.resolve(name)
+            # Members that aren't IP-NETMASK (or are dynamic groups) are flagged for review, even
+            # when the rest of the group resolves
+            for member, addr_object in self.resolver.unsupported_members(name).items():
+                self.unsupported.setdefault(member, addr_object.to_dict())
+            if not ips:
+                ips = [name]
+            self._resolved[name] = ips
+        return self._resolved[name]
+
+    def egress(self, ip, to_interface=None):
+        """
+        :return: interface the IP lives on, the rule's to-interface if no interface subnet contains it
+        """
+        if ip not in self._egress:
+            self._egress[ip] = self.interface_lookup(ip)
+        if not self._egress[ip] and to_interface and to_interface != "any":
+            return to_interface
+        return self._egress[ip]
+
+    def translations(self, entry):
+        """
+        :param entry: NAT rule (dictionary)
+        :return: list of NatTranslation's for the rule, not indexed
+        """
+        rule = entry["@name"]
+        disabled = entry.get("disabled") == "yes"
+        to_interface = entry.get("to-interface")
+        found = []
+
+        def add(kind, address, ifname=None):
+            for ip in self.resolve(address) if address else [None]:
+                interface = ifname or (self.egress(ip, to_interface) if ip else None)
+                found.append(NatTranslation(ip, interface, rule, kind, address, disabled))
+
+        snat = entry.get("source-translation") or {}
+        dipp = snat.get("dynamic-ip-and-port")
+        if dipp is not None:
+            if "interface-address" in (dipp or {}):
+                int_addr = dipp["interface-address"] or {}
+                add("interface-address", int_addr.get("ip"), int_addr.get("interface"))
+            else:
+                for address in self.members((dipp or {}).get("translated-address")):
+                    add("dynamic-ip-and-port", address)
+        dip = snat.get("dynamic-ip")
+        if dip is not None:
+            for address in self.members((dip or {}).get("translated-address")):
+                add("dynamic-ip", address)
+        static = snat.get("static-ip")
+        if static is not None:
+            static = static or {}
+            kind = "static-ip bi-directional" if static.get("bi-directional") == "yes" else "static-ip"
+            for address in self.members(static.get("translated-address")):
+                add(kind, address)
+
+        for key, kind in (("destination-translation", "destination"), ("dynamic-destination-translation", "dynamic-destination")):
+            if key in entry:
+                for address in self.members((entry[key] or {}).get("translated-address")):
+                    add(kind, address)
+        return found
+
+    def add(self, entry):
+        """
+        Index one NAT rule.
+
+        :return: list of NatTranslation's for the rule
+        """
+        found = self.translations(entry)
+        self.by_rule.setdefault(entry["@name"], []).extend(found)
+        for translation in found:
+            self.by_address.setdefault(translation.address, []).append(translation)
+            if translation.ip is None:
+                continue
+            self.by_ip.setdefault(translation.ip.split("/", 1)[0], []).append(translation)
+            network = InterfaceTrie._network(translation.ip)
+            if network and network.num_addresses > 1 and translation.kind != "interface-address":
+                by_network = self.pools[network.version].setdefault(network.prefixlen, {})
+                by_network.setdefault(int(network.network_address), []).append(translation)
+        return found
+
+    def add_rules(self, entries):
+        """
+        :param entries: NAT rules output ({'entry': ...})
+        """
+        for entry in pa_api.as_list((entries or {}).get("entry")):
+            self.add(entry)
+        return self
+
+    def lookup(self, ip):
+        """
+        Which NAT rules use this IP.
+
+        :param ip: IP, or a translated address object name
+        :return: list of NatTranslation's, including the pools (ie. 1.1.1.0/29) containing the IP
+        """
+        found = list(self.by_ip.get(ip.split("/", 1)[0], []))
+        found += [x for x in self.by_address.get(ip, []) if x not in found]
+        address = InterfaceTrie._network(ip)
+        if address:
+            # One dictionary lookup per pool prefix length (of the IP's version) shorter than the IP's
+            bits = int(address.network_address)
+            for prefixlen, by_network in sorted(self.pools[address.version].items()):
+                if prefixlen > address.prefixlen:
+                    break
+                mask = ((1 << prefixlen) - 1) << (address.max_prefixlen - prefixlen)
+                found += [x for x in by_network.get(bits & mask, []) if x not in found]
+        return found
 
-    if not isinstance(mem.address_object_entries, list):
-        mem.address_object_entries = [mem.address_object_entries]
 
-    found = False
-    for addr_object in mem.address_object_entries:
-        if entry in addr_object.get("@name"):
-            if "ip-netmask" in addr_object:
-                found = True
-                ips = addr_object["ip-netmask"]
-            else:
-                add_review_entry(addr_object, "not-ip-netmask")
-    if not found:
-        ips = entry 
+class mem: 
+    ip_to_eth_dict = {}
+    interface_trie = InterfaceTrie()
+    review_nats = []
+    garp_targets = []       # (ip, interface) of every 'test arp' command, see send_garp()
+    nat_index = NatIndex()
+    address_object_entries = None
+    resolver = pa_api.AddressResolver()
+    review_folder = "api/review"
 
-    if isinstance(ips,list):
-        pass # Good (for now)
-    else:
-        ips = [ips]
 
-    return ips # Always returns a list (currently)
+def interface_lookup(ip):
+    """
+    Used to find which physical interface is associated with this IP (NAT entry).
+    Uses the interface trie built from the interface IP's (see add_garp_command), 
+    the most specific interface subnet containing the IP wins.
+    """
+    return mem.interface_trie.lookup(ip)
 
 
 def add_review_entry(entry, type):
@@ -128,11 +322,19 @@ def add_review_entry(entry, type):
         print("For NAT? I know a couple use cases, but maybe manually add this gARP after reviewing.")
         print("May be redundant or otherwise unnecessary.")
 
-    pa_api.create_xml_files(entry, f"api/review/review-{entry['@name']}.xml")
+    pa_api.create_xml_files(entry, f"{mem.review_folder}/review-{entry['@name']}.xml")
 
     return None
 
 
+def add_interface_ip(ip, ifname):
+    """
+    Update the global interface tables, interface_lookup() uses these for the NAT rules.
+    """
+    mem.ip_to_eth_dict.update({ip: ifname})
+    mem.interface_trie.insert(ip, ifname)
+
+
 def add_garp_command(ip, ifname, nat=None):
     """
     Update global garp_commands list.
@@ -141,142 +343,102 @@ def add_garp_command(ip, ifname, nat=None):
     """
     # Update Global Table
     if not nat:
-        mem.ip_to_eth_dict.update({ip: ifname})
+        add_interface_ip(ip, ifname)
     # Removes anything in IP after /, ie /24
     ip = ip.split("/", 1)[0]  
+    mem.garp_targets.append((ip, ifname))
     garp_command = f"test arp gratuitous ip {ip} interface {ifname}"
     return garp_command
 
 
 
-def process_interface_entry(entry):
-    # Set interface name
-    ifname = entry["@name"]
-    commands = []
+def extract_interfaces(interfaces):
+    """
+    Every interface and subinterface IP, one pass over the interfaces (no try/except guessing
+    whether xmltodict gave us one entry or a list, see pa_api.as_list).
+    ethernet/aggregate-ethernet entries have their IP's under layer3, subinterfaces under layer3/units.
+    vlan/loopback/tunnel are a single interface, IP's directly under it, subinterfaces under units.
 
-    # Should have an IP
-    if "layer3" in entry:
-        found = False
-        errors = []
-        # Normal IP Address on interface
-        if "ip" in entry["layer3"]:
-            found = True
-            try:
-                # Normal 'test arp' generation
-                ip = entry["layer3"]["ip"]["entry"]["@name"]
-                commands.append(add_garp_command(ip, ifname))
-            except:
-                # Secondary addresses, 'test arp'
-                for x_ip in entry["layer3"]["ip"]["entry"]:
-                    ip = x_ip["@name"]
-                    commands.append(add_garp_command(ip, ifname))
-
-        # Sub Interfaces
-        if "units" in entry["layer3"]:
-            try:
-                subifname = entry["layer3"]["units"]["entry"]["@name"]
-                # 1 Subif, 1 IP
-                if "ip" in entry["layer3"]["units"]["entry"]:
-                    found = True
-                    ip = entry["layer3"]["units"]["entry"]["ip"]
-                    try:    # Subif Generate 'test arp'
-                        ip = entry["entry"]["@name"]
-                        commands.append(add_garp_command(ip, ifname))
-                    except: # Secondary addresses, 1 Subif, 'test arp'
-                         for x_ip in ip:
-                             ip_ = x_ip["@name"]
-                             commands.append(add_garp_command(ip_, subifname))
-                else:
-                    errors.append(f"No IP address found (e1)-(DHCP?), {subifname}") 
-            except: # Multiple Subinterfaces
-                for subif in entry["layer3"]["units"]["entry"]:
-                    subifname = subif["@name"]
-
-                    if "ip" in subif:
-                        found = True
-                        try:    # Subif Generate 'test arp'
-                            ip = subif["ip"]["entry"]["@name"]
-                            commands.append(add_garp_command(ip, subifname))
-                        except: # Secondary addresses on subinterface, 'test arp'
-                            for x_ip in subif["ip"]["entry"]:
-                                ip_ = x_ip["@name"]
-                                commands.append(add_garp_command(ip, subifname))
-                    else:
-                        errors.append(f"No IP address found (e2)-(DHCP?), {subifname}")             
-
-        if found:  
-            return commands
-        else:   # Probably DHCP, let DHCP handle it.
-            errors.append(
-                f"No IP address found (e3)-(DHCP?), {ifname}"
-            )
-            return errors
+    :param interfaces: <interface> output as a dictionary
+    :return: list of (interface type, interface name, ip), ip is None if the interface has no IP (DHCP?)
+    """
+    found = []
+
+    def add_ips(if_type, ifname, node, units=True):
+        ips = [entry["@name"] for entry in pa_api.as_list((node.get("ip") or {}).get("entry"))]
+        subifs = pa_api.as_list((node.get("units") or {}).get("entry")) if units else []
+        for ip in ips:
+            found.append((if_type, ifname, ip))
+        for subif in subifs:
+            add_ips(if_type, subif["@name"], subif, units=False)
+        # Parent interfaces with subinterfaces usually don't have an IP themselves
+        if not ips and not subifs:
+            found.append((if_type, ifname, None))
+
+    for if_type in INTERFACE_TYPES:
+        section = interfaces.get(if_type) if interfaces else None
+        if not section:
+            continue
+        if if_type in ("ethernet", "aggregate-ethernet"):
+            for entry in pa_api.as_list(section.get("entry")):
+                # No 'layer3' (layer2, virtual-wire, aggregate-group member...), no IP Address here.
+                add_ips(if_type, entry["@name"], entry.get("layer3") or {})
+        else:
+            add_ips(if_type, if_type, section)
 
-    else:  # No 'layer3', no IP Address here.
-        test_garp = f"No IP address found (e4)-(DHCP?), {ifname}"
-        return test_garp
-    
+    return found
 
 
-def process_nat_entry(entry):
-    
+def build_interface_commands(interfaces):
+    """
+    Build the 'test arp' commands for every interface IP (extract_interfaces).
+    Loopback and tunnel IP's don't ARP, they're only added to the interface lookup for the NAT rules.
+
+    :param interfaces: <interface> output as a dictionary
+    :return: list of 'test arp' commands and errors
+    """
+    if not interfaces:
+        print("No interfaces found.")
+        return []
+    print("Searching through interfaces")
+
     commands = []
+    for if_type, ifname, ip in extract_interfaces(interfaces):
+        if if_type not in ARP_INTERFACE_TYPES:
+            if ip:
+                add_interface_ip(ip, ifname)
+        elif ip:
+            commands.append(add_garp_command(ip, ifname))
+        else:   # Probably DHCP, let DHCP handle it.
+            commands.append(f"No IP address found (DHCP?), {ifname}")
+    return commands
 
-    if "disabled" in entry:
-        if entry["disabled"] == "yes":
-            add_review_entry(entry, "disabled")
-            return None
-    if "destination-translation" in entry:
+
+def process_nat_entry(entry):
+    """
+    Index the NAT rule (mem.nat_index) and build it's 'test arp' commands, source-NAT only.
+    """
+    translations = mem.nat_index.add(entry)
+
+    if entry.get("disabled") == "yes":
+        add_review_entry(entry, "disabled")
+        return None
+    if "destination-translation" in entry or "dynamic-destination-translation" in entry:
         add_review_entry(entry, "dnat")
     if "source-translation" in entry:
-        snat = entry["source-translation"]
-
-        # Returns Address Object typically, could also be an IP
-        # Usually 'translated-address' but also check for 'interface-address'
-        x_addr_obj = iterdict(snat, "translated-address")
-        int_addr_obj = iterdict(snat, "interface-address")
-
-        # 'translated-address'
-        if x_addr_obj:
-            try: # Find the real-ip from the address-object, add 'test arp'
-                ips = address_lookup(x_addr_obj)
-                for ip in ips:
-                    # Set the interface name
-                    ifname = interface_lookup(ip)
-                    if not ifname:
-                        ifname = "INTERFACE NOT FOUND"
-                    commands.append(add_garp_command(ip, ifname, "nat"))
-            except: # I think the only use-case is dynamic-pat with multiple pat pools/ip's.
-                print("\nDYNAMIC PAT MULTIPLE IP'S? IF NOT PLEASE LET ME KNOW\n")
-                ipobjs = []
-                if isinstance(x_addr_obj["member"], list):
-                    [ipobjs.append(obj) for obj in addr_obj["member"]]
-                else:
-                    ipobjs.append(x_addr_obj["member"])
-                
-                for ipobj in ipobjs:
-                    ips = address_lookup(ipobj)
-                    for ip in ips:
-                        ifname = interface_lookup(ip)
-                        if not ifname:
-                            ifname = "INTERFACE NOT FOUND"
-                        commands.append(add_garp_command(ip, ifname, "nat"))
-        if int_addr_obj:    # Dynamic IP and Port / Interface Address
-            ifname = int_addr_obj["interface"]
-
-            if "ip" in int_addr_obj:
-                ipobj = int_addr_obj["ip"]
-                ips = address_lookup(ipobj)
-                for ip in ips:
-                    commands.append(add_garp_command(ip, ifname, "nat"))
-            else: # No IP Found (DHCP?), we have interface already, should have 'test arp' command from that.
-                ip = "IP NOT FOUND, ARP TAKEN CARE OF VIA: "
-                commands.append(add_garp_command(ip, ifname, "nat"))
-        
+        commands = []
+        for translation in translations:
+            if translation.kind not in NatIndex.SOURCE_KINDS:
+                continue
+            if translation.ip:
+                commands.append(add_garp_command(translation.ip, translation.interface or "INTERFACE NOT FOUND", "nat"))
+            else:   # Interface Address, no IP Found (DHCP?), we have interface already, should have 'test arp' command from that.
+                commands.append(add_garp_command("IP NOT FOUND, ARP TAKEN CARE OF VIA: ", translation.interface, "nat"))
+
         if commands:
             return commands
         else:
-            return f"Error, SNAT possibly misconfigured, {snat}"
+            return f"Error, SNAT possibly misconfigured, {entry['source-translation']}"
     
     return None
 
@@ -288,10 +450,8 @@ def build_garp_commands(input_type, entries):
     Currently only supports source-nat, dest-nat's are noted at the end of the output.
     Return this list.
     """
-    # Set whether this is NAT or Interface based
-    if input_type == "ethernet" or input_type == "aggregate-ethernet":
-        process_entries = process_interface_entry
-    elif input_type == "pre-nat-rules" or input_type == "post/nat-rules":
+    # NAT rules, interfaces are done by build_interface_commands()
+    if input_type == "pre-nat-rules" or input_type == "post/nat-rules":
         process_entries = process_nat_entry
     else:
         print(f"Unsupported Type - {input_type}")
@@ -331,6 +491,26 @@ def validate_output(output_type):
         return None
 
 
+def print_nat_lookup(ip, nat_index=None):
+    """
+    --nat-lookup, every NAT rule translating to this IP (or a pool containing it).
+
+    :return: list of NatTranslation's
+    """
+    found = (nat_index or mem.nat_index).lookup(ip)
+    print(f"--------------------NAT RULES USING {ip}--------------------")
+    for translation in found:
+        disabled = " (disabled)" if translation.disabled else ""
+        print(
+            f"{translation.rule}{disabled}: {translation.kind} {translation.address}"
+            f", interface {translation.interface or 'INTERFACE NOT FOUND'}"
+        )
+    if not found:
+        print("No NAT rule found.")
+    print("-----------------------------------------------------------\n")
+    return found
+
+
 def print_garp_output(command_list):
     for command in command_list:
         if isinstance(command,list):
@@ -342,154 +522,686 @@ def print_garp_output(command_list):
                 print(command)
 
 
-def garp_logic(pa_ip, username, password, pa_type, filename=None):
+def select_template(pa):
+    """
+    Panorama needs a Template Name (interfaces) & Device Group (NAT rules), ask for them.
+    """
+    incorrect_input = True
+    while incorrect_input:
+        # Needs Template Name & Device Group
+        device_groups, template_names = pa.grab_panorama_objects()
+        print("\nTemplate Names:")
+        print("---------------------")
+        for template in template_names:
+            print(template)
+        print("--------------\n")
+        print("Device Groups:")
+        print("--------------")
+        for dg in device_groups:
+            print(dg)
+            
+        pa.template_name = input("\nEnter the Template Name: ")
+        pa.device_group = input("\nEnter the Device Group Name: ")
+
+        incorrect_input = (
+            pa.device_group not in device_groups or
+            pa.template_name not in template_names
+        )
+        if incorrect_input:
+            print("\n\nERROR: Template or Device Group not found.\n")
+
+
+def confirm_send(pa, targets, garp_rate=GARP_RATE):
+    """
+    Ask, then send the gARP's (send_garp) and write the report.
+    """
+    answer = input(f"\nSend {len(targets)} gARP's from {pa.pa_ip} now? (y/n): ")
+    if answer.strip().lower() not in ("y", "yes"):
+        print("\nNo gARP's sent.")
+        return
+
+    start = time.perf_counter()
+    report = send_garp(pa, targets, garp_rate)
+    report_file = f"output/garp-report-{pa.pa_ip}.csv"
+    sent, failed, skipped = write_garp_report(report, report_file)
+    for result in report:
+        if result["status"] != "success":
+            print(f"{result['status'].upper()}: {result['ip']} {result['interface']}, {result['message']}")
+    print(f"\ngARP {sent} sent, {failed} failed, {skipped} skipped, took {time.perf_counter() - start:.1f} Seconds.")
+    print(f"Report written to {report_file}")
+
+
+def garp_logic(
+    pa_ip, username, password, pa_type, filename=None, snapshot=None, record=None, replay=None,
+    send=False, garp_rate=GARP_RATE, nat_lookup=None,
+):
     """
     Main point of entry.
     Connect to PA/Panorama.
     Grab 'test arp' output from interfaces and NAT rules.
     Print out the commands.
+    If pa_type is "xml", filename is an exported running/candidate config, nothing is sent.
+    If snapshot ("running" or "candidate"), the whole config is grabbed once instead of per xpath.
+    If record (folder), every API response is saved for replay.
+    If replay (folder), every API call is answered from a record folder, offline.
+    If send, the gARP's are sent too (after a confirmation), garp_rate per second per interface.
+    If nat_lookup (IP), the NAT rules using it are printed too.
     """
 
-    if pa_type != "xml":
+    # pa_type becomes the config's type ("pa"/"panorama") below, nothing to send to offline
+    offline = pa_type == "xml" or bool(replay)
+    if replay:
+        pa = pa_api.api_lib_pa.replay(replay, pa_type)
+        pa_type = pa.pa_type
+    elif pa_type != "xml":
         pa = pa_api.api_lib_pa(pa_ip, username, password, pa_type)
-    else: # XML - DEBUGGING
-        pass
-        # pre_nat_output = None
-        # post_nat_output = None
-        # fin = open(filename, 'r')
-        # temp = fin.read()
-        # fin.close()
-        # int_output = xmltodict.parse(temp)
-        # int_output = int_output["response"]
-        # # print(int_output["response"])
-        # sys.exit(0)
+        if record:
+            pa.record(record)
+    else:
+        # Exported config file, offline
+        try:
+            pa = pa_api.api_lib_pa.from_snapshot(pa_api.ConfigSnapshot.from_file(filename))
+        except (OSError, ValueError, pa_api.ElementTree.ParseError) as e:
+            print(f"Unable to load config file {filename}: {e}")
+            sys.exit(0)
+        pa_type = pa.pa_type
+    if snapshot and not pa.snapshot:
+        pa.use_snapshot(snapshot, f"api/{snapshot}-config.xml")
 
     # Set the correct XPATH for what we need (interfaces and nat rules)
     if pa_type == "panorama":
+        select_template(pa)
 
-        incorrect_input = True
-        while incorrect_input:
-            # Needs Template Name & Device Group
-            device_groups, template_names = pa.grab_panorama_objects()
-            print("\nTemplate Names:")
-            print("---------------------")
-            for template in template_names:
-                print(template)
-            print("--------------\n")
-            print("Device Groups:")
-            print("--------------")
-            for dg in device_groups:
-                print(dg)
-                
-            pa.template_name = input("\nEnter the Template Name: ")
-            pa.device_group = input("\nEnter the Device Group Name: ")
-
-            incorrect_input = (
-                pa.device_group not in device_groups or
-                pa.template_name not in template_names
-            )
-            if incorrect_input:
-                print("\n\nERROR: Template or Device Group not found.\n")
+    # We have what we need, begin the work.
+    start = time.perf_counter()
+    print("\n\nStarting...")
+
+    garp_output = grab_garp_output(pa, pa_type)
+    # Can't run without an interface or a nat rule
+    if not garp_output:
+        print("\nUnable to load required information, see above and correct the issue.\n")
+        sys.exit(0)
+    commands = build_garp_output(garp_output)
+
+    # Output
+    print(f"\n\ngARP Test Commands:")
+    print("-----------------------------------------------------------")
+    print("--------------------ARP FOR Interfaces---------------------")
+    print_garp_output(commands["interfaces"])
+    print("-------------------------ARP FOR NAT-----------------------")
+    print_garp_output(commands["nat"])
+    print("-----------------------------------------------------------")
+    print("--------------------REVIEW THESE NATS----------------------")
+    for nat in commands["review"]:
+        print(nat)
+    print("-----------------------------------------------------------\n")
+    if nat_lookup:
+        print_nat_lookup(nat_lookup)
+    end = time.perf_counter()
+    runtime = end - start
+    print(f"Took {runtime} Seconds.")
+
+    # Send them
+    if send:
+        if offline:
+            print("\nOffline, no gARP's sent.")
+            return
+        confirm_send(pa, commands["targets"], garp_rate)
+
+
+def grab_garp_output(pa, pa_type, folder="api"):
+    """
+    Grab the interfaces, NAT rules and address objects, all at once.
+    Panorama needs pa.template_name and pa.device_group set.
 
-        # Found Device Group / Template Name, Proceed
+    :param folder: API output folder
+    :return: dictionary of entries and the address resolver, None if there's no interface or NAT rule
+    """
+    if pa_type == "panorama":
         XPATH_INTERFACES = pa_api.XPATH_INTERFACES_PAN.replace("TEMPLATE_NAME", pa.template_name)
         XPATH_PRE = pa_api.XPATH_NAT_RULES_PRE_PAN.replace("DEVICE_GROUP", pa.device_group)
         XPATH_POST = pa_api.XPATH_NAT_RULES_POST_PAN.replace("DEVICE_GROUP", pa.device_group)
-        XPATH_ADDR = pa_api.XPATH_ADDRESS_OBJ_PAN.replace("DEVICE_GROUP", pa.device_group)
-        
-        # Grab NAT Rules
-        pre_nat_output = pa.grab_api_output(
-            "xml", XPATH_PRE, f"api/pre-natrules.xml"
-        )
-        post_nat_output = pa.grab_api_output(
-            "xml", XPATH_POST, f"api/post-natrules.xml"
-        )
+        XPATH_ADDR = None   # Device Group, parent Device Groups and Shared, see DeviceGroupCache
+        XPATH_GRP = None
+
+        # NAT Rules
+        PRE_NAT_JOB = (XPATH_PRE, f"{folder}/pre-natrules.xml")
+        POST_NAT_JOB = (XPATH_POST, f"{folder}/post-natrules.xml")
     
-    elif pa_type == "pa":
+    else:
         XPATH_INTERFACES = pa_api.XPATH_INTERFACES
         XPATH_NATRULES = pa_api.XPATH_NAT_RULES
         XPATH_ADDR = pa_api.XPATH_ADDRESS_OBJ
+        XPATH_GRP = pa_api.XPATH_ADDRESS_GRP
 
-        # Grab NAT Rules 
-        pre_nat_output = None
-        post_nat_output = pa.grab_api_output(
-            "xml", XPATH_NATRULES, f"api/pa-natrules.xml"
-        )
-    
-    # We have what we need, begin the work.
-    start = time.perf_counter()
-    print("\n\nStarting...")
+        # NAT Rules, no Pre-NAT on a PA
+        PRE_NAT_JOB = None
+        POST_NAT_JOB = (XPATH_NATRULES, f"{folder}/pa-natrules.xml")
 
-    # Grab Interfaces/objects, NAT already pulled from above
-    int_output = pa.grab_api_output(
-        "xml", XPATH_INTERFACES, f"api/interfaces.xml"
-    )
-    address_objects = pa.grab_api_output(
-        "xml", XPATH_ADDR, f"api/address-objects.xml"
-    )
+    # Grab NAT Rules, Interfaces and objects all at once
+    INTERFACES_JOB = (XPATH_INTERFACES, f"{folder}/interfaces.xml")
+    ADDR_JOB = (XPATH_ADDR, f"{folder}/address-objects.xml") if XPATH_ADDR else None
+    GRP_JOB = (XPATH_GRP, f"{folder}/address-groups.xml") if XPATH_GRP else None
+    jobs = [job for job in (PRE_NAT_JOB, POST_NAT_JOB, INTERFACES_JOB, ADDR_JOB, GRP_JOB) if job]
+    if pa_type == "panorama":
+        cache = pa_api.DeviceGroupCache(pa, folder=folder)
+        api_output = cache.prefetch([pa.device_group], jobs=jobs)
+    else:
+        api_output = pa.grab_api_output_batch(jobs)
+
+    pre_nat_output = api_output.get(PRE_NAT_JOB)
+    post_nat_output = api_output[POST_NAT_JOB]
+    int_output = api_output[INTERFACES_JOB]
+    address_objects = api_output.get(ADDR_JOB)
+    address_groups = api_output.get(GRP_JOB)
 
     # Organize all the XML:
     # Get rid of 'Nonetype' issues
     int_output = validate_output(int_output)
     addr_objects = validate_output(address_objects)
+    addr_groups = validate_output(address_groups)
     pre_nat_output = validate_output(pre_nat_output)
     post_nat_output = validate_output(post_nat_output)
-    # Can't run without an interface or a nat rule
     if not int_output or not post_nat_output:
-        print("\nUnable to load required information, see above and correct the issue.\n")
-        sys.exit(0)
+        return None
+
     # Get the actual entries
-    eth_entries = int_output["interface"].get("ethernet")
-    ae_entries = int_output["interface"].get("aggregate-ethernet")
-    post_nat_entries = post_nat_output["rules"]
-    pre_nat_entries = pre_nat_output["rules"] if pre_nat_output else None
-    mem.address_object_entries = addr_objects["address"]["entry"] if addr_objects else None
+    if pa_type == "panorama":
+        resolver = cache.resolver(pa.device_group)
+    else:
+        resolver = pa_api.AddressResolver(
+            pa_api.as_list(((addr_objects or {}).get("address") or {}).get("entry")),
+            pa_api.as_list(((addr_groups or {}).get("address-group") or {}).get("entry")),
+        )
+    return {
+        "interfaces": int_output["interface"],
+        "pre-nat-rules": pre_nat_output["rules"] if pre_nat_output else None,
+        "post/nat-rules": post_nat_output["rules"],
+        "resolver": resolver,
+    }
+
+
+def build_garp_output(garp_output, review_folder="api/review"):
+    """
+    Build the 'test arp' commands, interfaces first (the NAT rules are matched to them).
+
+    :param garp_output: grab_garp_output() dictionary
+    :param review_folder: folder for the NAT rules to review
+    :return: dictionary of command lists, interfaces, nat and review, and targets [(ip, interface)]
+    """
+    # Start over, mem is per firewall
+    mem.review_folder = review_folder
+    mem.ip_to_eth_dict = {}
+    mem.interface_trie = InterfaceTrie()
+    mem.review_nats = []
+    mem.garp_targets = []
+    mem.resolver = garp_output["resolver"]
+    mem.nat_index = NatIndex(mem.resolver, interface_lookup)
 
     # Start grabbing test arp commands from the entries
-    eth_commands = build_garp_commands("ethernet", eth_entries)
-    ae_commands = build_garp_commands("aggregate-ethernet", ae_entries)
-    pre_nat_commands = build_garp_commands("pre-nat-rules", pre_nat_entries)
-    post_nat_commands = build_garp_commands("post/nat-rules", post_nat_entries)
+    interface_commands = build_interface_commands(garp_output["interfaces"])
+    nat_commands = (
+        build_garp_commands("pre-nat-rules", garp_output["pre-nat-rules"])
+        + build_garp_commands("post/nat-rules", garp_output["post/nat-rules"])
+    )
+    for addr_object in mem.nat_index.unsupported.values():
+        add_review_entry(addr_object, "not-ip-netmask")
 
-    # Output
-    print(f"\n\ngARP Test Commands:")
+    return {
+        "interfaces": interface_commands,
+        "nat": nat_commands,
+        "review": mem.review_nats,
+        "targets": list(dict.fromkeys(mem.garp_targets)),
+    }
+
+
+def flatten_commands(command_list):
+    """
+    :return: (commands, notes), the 'test arp' commands and everything else (errors, DHCP interfaces)
+    """
+    commands = []
+    notes = []
+    for command in command_list:
+        for line in command if isinstance(command, list) else [command]:
+            if not line:
+                continue
+            if line.startswith("test arp"):
+                commands.append(line)
+            else:
+                notes.append(line)
+    return commands, notes
+
+
+class InterfaceThrottle:
+    """
+    At most 'rate' gARP's per second per interface, shared by every sending thread.
+    """
+    def __init__(self, rate=GARP_RATE):
+        self.interval = 1 / rate if rate else 0
+        self.next_send = {}     # interface: time.monotonic() it may send again
+        self.lock = threading.Lock()
+
+    def wait(self, ifname):
+        with self.lock:
+            now = time.monotonic()
+            send_at = max(now, self.next_send.get(ifname, now))
+            self.next_send[ifname] = send_at + self.interval
+        time.sleep(send_at - now)
+
+
+def garp_skip_reason(ip, ifname):
+    """
+    :return: why this (ip, interface) can't be sent, None if it can
+    """
+    if ifname == "INTERFACE NOT FOUND":
+        return "Interface not found"
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return "IP not found"
+    if address.version != 4:
+        return "IPv6, no ARP"
+    return None
+
+
+def op_result(text):
+    """
+    :return: (status, message) from an op command's XML response
+    """
+    try:
+        root = pa_api.ElementTree.fromstring(text)
+    except pa_api.ElementTree.ParseError:
+        return "error", text.strip()[:200]
+    message = " ".join(x.strip() for x in root.itertext() if x.strip())
+    return ("success" if root.get("status") == "success" else "error"), message
+
+
+def send_garp(pa, targets, rate=GARP_RATE, workers=GARP_WORKERS):
+    """
+    Send the gARP's with the 'test arp gratuitous' op command, no more pasting them into the CLI.
+    Interfaces take turns, so the throttle on one busy interface doesn't hold up the others.
+
+    :param targets: [(ip, interface)], see build_garp_output()
+    :param rate: gARP's per second per interface
+    :param workers: gARP's sent at the same time
+    :return: report, list of dictionaries (ip, interface, status, message)
+    """
+    report = []
+    by_interface = {}
+    for ip, ifname in targets:
+        reason = garp_skip_reason(ip, ifname)
+        if reason:
+            report.append({"ip": ip, "interface": ifname, "status": "skipped", "message": reason})
+        else:
+            by_interface.setdefault(ifname, []).append((ip, ifname))
+    queue = [target for batch in itertools.zip_longest(*by_interface.values()) for target in batch if target]
+
+    throttle = InterfaceThrottle(rate)
+
+    def send(target):
+        ip, ifname = target
+        throttle.wait(ifname)
+        try:
+            response = pa.op(
+                f"<test><arp><gratuitous><ip>{ip}</ip><interface>{ifname}</interface></gratuitous></arp></test>"
+            )
+            status, message = op_result(response.text)
+        except Exception as e:
+            status, message = "error", f"{type(e).__name__}: {e}"
+        return {"ip": ip, "interface": ifname, "status": status, "message": message}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        report += list(executor.map(send, queue))
+    return report
+
+
+def write_garp_report(report, filename):
+    """
+    Write the send_garp() report as CSV.
+
+    :return: (sent, failed, skipped) counts
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    with open(filename, "w", newline="") as fout:
+        writer = csv.DictWriter(fout, fieldnames=["ip", "interface", "status", "message"])
+        writer.writeheader()
+        writer.writerows(report)
+    return tuple(sum(1 for x in report if x["status"] == status) for status in ("success", "error", "skipped"))
+
+
+def load_garp_archive(folder):
+    """
+    grab_garp_output() dictionary from an archived api/<timestamp>/ folder, no PA/Panorama needed.
+    Reads interfaces.xml, the NAT rules (pa-natrules.xml or pre/post-natrules.xml) and the address
+    objects and groups (.gz/.zst archives too). Panorama's <level>-address(-group).xml files are merged Shared
+    first, the Device Group hierarchy isn't archived.
+    """
+    def read(name):
+        for ext in ("", ".gz", ".zst"):
+            path = os.path.join(folder, name + ext)
+            if os.path.isfile(path):
+                return validate_output(xmltodict.parse(pa_api.read_archive(path))["response"])
+        return None
+
+    int_output = read("interfaces.xml")
+    pre_nat_output = read("pre-natrules.xml")
+    post_nat_output = read("post-natrules.xml") or read("pa-natrules.xml")
+    if not int_output or not post_nat_output:
+        return None
+
+    addr_objects = read("address-objects.xml")
+    addr_groups = read("address-groups.xml")
+    if addr_objects or addr_groups:
+        resolver = pa_api.AddressResolver(
+            pa_api.as_list(((addr_objects or {}).get("address") or {}).get("entry")),
+            pa_api.as_list(((addr_groups or {}).get("address-group") or {}).get("entry")),
+        )
+    else:
+        resolver = pa_api.AddressResolver()
+        levels = sorted(
+            {name.rsplit("-address", 1)[0] for name in os.listdir(folder) if "-address" in name},
+            key=lambda x: x != pa_api.DeviceGroupCache.SHARED,
+        )
+        for level in levels:
+            objects = read(f"{level}-address.xml")
+            groups = read(f"{level}-address-group.xml")
+            resolver = resolver.with_overrides(
+                pa_api.as_list(((objects or {}).get("address") or {}).get("entry")),
+                pa_api.as_list(((groups or {}).get("address-group") or {}).get("entry")),
+            )
+
+    return {
+        "interfaces": int_output["interface"],
+        "pre-nat-rules": pre_nat_output["rules"] if pre_nat_output else None,
+        "post/nat-rules": post_nat_output["rules"],
+        "resolver": resolver,
+    }
+
+
+def load_garp_source(source, username=None, password=None, folder="api"):
+    """
+    One side of --delta, from an archived api/<timestamp>/ folder, an exported running/candidate
+    config file, or a live PA/Panorama (IP/FQDN).
+
+    :return: (api_lib_pa or None if offline, grab_garp_output() dictionary)
+    """
+    if os.path.isdir(source):
+        garp_output = load_garp_archive(source)
+        pa = None
+    else:
+        if os.path.isfile(source):
+            try:
+                pa = pa_api.api_lib_pa.from_snapshot(pa_api.ConfigSnapshot.from_file(source))
+            except (OSError, ValueError, pa_api.ElementTree.ParseError) as e:
+                print(f"Unable to load config file {source}: {e}")
+                sys.exit(0)
+        else:
+            print(f"\n{source}:")
+            pa = pa_api.api_lib_pa(source, username, password, pa_api.get_pa_type())
+        if pa.pa_type == "panorama":
+            select_template(pa)
+        garp_output = grab_garp_output(pa, pa.pa_type, folder)
+        if pa.snapshot:
+            pa = None
+
+    if not garp_output:
+        print(f"\nUnable to load the interfaces and NAT rules from {source}, see above and correct the issue.\n")
+        sys.exit(0)
+    return pa, garp_output
+
+
+def garp_delta(old, new, username=None, password=None, send=False, garp_rate=GARP_RATE):
+    """
+    Delta mode (--delta), hardware swap/cutover.
+    Only the (IP, interface) pairs the new firewall owns that the old one didn't (new IP's, or IP's
+    moving to a different interface) need a gARP, everything else is left alone.
+
+    :param old: outgoing firewall, see load_garp_source()
+    :param new: incoming firewall, see load_garp_source()
+    :param send: send the gARP's from the new firewall (live only)
+    :return: list of (ip, interface) needing a gARP
+    """
+    start = time.perf_counter()
+    _, old_output = load_garp_source(old, username, password, "api/old")
+    new_pa, new_output = load_garp_source(new, username, password, "api/new")
+
+    # Owned IP's, interfaces and NAT (see build_garp_output)
+    with contextlib.redirect_stdout(io.StringIO()):
+        old_commands = build_garp_output(old_output, "api/old/review")
+        old_targets, old_review = old_commands["targets"], old_commands["review"]
+        commands = build_garp_output(new_output, "api/new/review")
+    new_targets = commands["targets"]
+    old_set = set(old_targets)
+    new_set = set(new_targets)
+    delta = [target for target in new_targets if target not in old_set]
+
+    print(f"\n\ngARP Delta Commands ({old} -> {new}):")
     print("-----------------------------------------------------------")
-    print("--------------------ARP FOR Interfaces---------------------")
-    if eth_commands:
-        print_garp_output(eth_commands)
-    if ae_commands:
-        print_garp_output(ae_commands)
-    print("-------------------------ARP FOR NAT-----------------------")
-    if pre_nat_commands:
-        print_garp_output(pre_nat_commands)
-    if post_nat_commands:
-        print_garp_output(post_nat_commands)
+    for ip, ifname in delta:
+        reason = garp_skip_reason(ip, ifname)
+        if reason:
+            print(f"# {reason}: {ip} {ifname}")
+        else:
+            print(f"test arp gratuitous ip {ip} interface {ifname}")
     print("-----------------------------------------------------------")
     print("--------------------REVIEW THESE NATS----------------------")
-    for nat in mem.review_nats:
-        print(nat)
+    for nat in old_review:
+        print(f"old: {nat}")
+    for nat in commands["review"]:
+        print(f"new: {nat}")
     print("-----------------------------------------------------------\n")
-    end = time.perf_counter()
-    runtime = end - start
-    print(f"Took {runtime} Seconds.")
+    print(
+        f"{len(delta)} new/moved, {len(new_set & old_set)} unchanged"
+        f", {len(old_set - new_set)} only on the old firewall."
+    )
+    print(f"Took {time.perf_counter() - start} Seconds.")
+
+    if send:
+        if not new_pa:
+            print("\nOffline, no gARP's sent.")
+        else:
+            confirm_send(new_pa, delta, garp_rate)
+    return delta
+
+
+def read_inventory(filename):
+    """
+    Inventory file, one target per line: host[,template,device group]
+    A firewall is just the host, a Panorama needs the Template and Device Group.
+    Blank lines and lines starting with # are skipped.
+
+    :return: list of (host, template, device group) tuples
+    """
+    targets = []
+    with open(filename) as fin:
+        for row in csv.reader(fin):
+            row = [x.strip() for x in row]
+            if not row or not row[0] or row[0].startswith("#"):
+                continue
+            if len(row) == 1:
+                targets.append((row[0], None, None))
+            elif len(row) == 3:
+                targets.append(tuple(row))
+            else:
+                print(f"Skipping inventory line, expected host or host,template,device group: {','.join(row)}")
+    return targets
+
+
+def target_name(target):
+    host, template, device_group = target
+    if template:
+        return f"{host}-{template}-{device_group}".replace("/", "_")
+    return host.replace("/", "_")
+
+
+def fleet_fetch(target, username, password, folder):
+    """
+    Login and grab one target's interfaces/NAT rules/objects, run in a worker thread (--fleet).
+
+    :return: (api_lib_pa or None, grab_garp_output() dictionary or None, error message or None)
+    """
+    host, template, device_group = target
+    pa_type = "panorama" if template else "pa"
+    try:
+        pa = pa_api.api_lib_pa(host, username, password, pa_type)
+        pa.template_name = template
+        pa.device_group = device_group
+        garp_output = grab_garp_output(pa, pa_type, f"{folder}/api/{target_name(target)}")
+        if not garp_output:
+            return pa, None, "No interfaces or NAT rules found"
+        return pa, garp_output, None
+    except SystemExit:  # api_lib_pa exits on a failed login
+        return None, None, "Login Failed"
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+
+
+def garp_fleet(
+    inventory, username, password, workers=pa_api.MAX_WORKERS, folder="output/garp", send=False, garp_rate=GARP_RATE,
+):
+    """
+    Fleet mode (--fleet), non-interactive.
+    Every target in the inventory is grabbed concurrently, then the commands are built one target
+    at a time (mem is shared) as each one arrives. One JSON file per target and a summary are written.
+
+    :param inventory: inventory filename, see read_inventory()
+    :param workers: targets grabbed at the same time
+    :param send: send the gARP's too (send_garp), every target at the same time, one report per target
+    :param garp_rate: gARP's per second per interface
+    :return: list of summary dictionaries
+    """
+    targets = read_inventory(inventory)
+    os.makedirs(folder, exist_ok=True)
+    print(f"\n{len(targets)} targets, {workers} at a time\n")
+
+    summary = []
+    sends = {}      # target name: send_garp() future
+    start = time.perf_counter()
+    # Sends get their own threads, so they don't hold up (or wait behind) the fetches
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers) as send_executor:
+        futures = {
+            executor.submit(fleet_fetch, target, username, password, folder): target
+            for target in targets
+        }
+        for future in concurrent.futures.as_completed(futures):
+            target = futures[future]
+            pa, garp_output, error = future.result()
+            result = {
+                "host": target[0],
+                "template": target[1],
+                "device_group": target[2],
+                "interfaces": [],
+                "nat": [],
+                "review": [],
+                "notes": [],
+                "error": error,
+            }
+            if garp_output:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    commands = build_garp_output(garp_output, f"{folder}/api/{target_name(target)}/review")
+                result["interfaces"], notes = flatten_commands(commands["interfaces"])
+                result["nat"], nat_notes = flatten_commands(commands["nat"])
+                result["notes"] = notes + nat_notes
+                result["review"] = list(commands["review"])
+                if send:
+                    sends[target_name(target)] = send_executor.submit(send_garp, pa, commands["targets"], garp_rate)
+
+            print(
+                f"{target_name(target)}: {len(result['interfaces'])} interface, {len(result['nat'])} NAT"
+                f", {len(result['review'])} review" + (f"\n\tERROR: {error}" if error else "")
+            )
+            summary.append(dict(result, file=f"{folder}/{target_name(target)}.json"))
+
+        # Sends still running, wait for the reports
+        for result in summary:
+            name = target_name((result["host"], result["template"], result["device_group"]))
+            if name in sends:
+                report_file = f"{folder}/{name}-garp-report.csv"
+                result["garp"] = dict(
+                    zip(("sent", "failed", "skipped"), write_garp_report(sends[name].result(), report_file)),
+                    report=report_file,
+                )
+                print(f"{name}: gARP {result['garp']['sent']} sent, {result['garp']['failed']} failed"
+                      f", {result['garp']['skipped']} skipped")
+            with open(result["file"], "w") as fout:
+                json.dump({k: v for k, v in result.items() if k != "file"}, fout, indent=4)
+
+    # Keep the summary in inventory order
+    order = {target_name(target): index for index, target in enumerate(targets)}
+    summary.sort(key=lambda x: order[target_name((x["host"], x["template"], x["device_group"]))])
+    with open(f"{folder}/summary.csv", "w", newline="") as fout:
+        writer = csv.writer(fout)
+        writer.writerow([
+            "host", "template", "device_group", "interface_commands", "nat_commands", "review",
+            "garp_sent", "garp_failed", "garp_skipped", "error", "file",
+        ])
+        for result in summary:
+            garp = result.get("garp", {})
+            writer.writerow([
+                result["host"], result["template"] or "", result["device_group"] or "",
+                len(result["interfaces"]), len(result["nat"]), len(result["review"]),
+                garp.get("sent", ""), garp.get("failed", ""), garp.get("skipped", ""),
+                result["error"] or "", result["file"],
+            ])
+    with open(f"{folder}/all-commands.txt", "w") as fout:
+        for result in summary:
+            fout.write(f"# {target_name((result['host'], result['template'], result['device_group']))}\n")
+            for command in result["interfaces"] + result["nat"]:
+                fout.write(command + "\n")
+            fout.write("\n")
+
+    failed = [x for x in summary if x["error"]]
+    print(f"\n{len(summary)} targets, {len(failed)} failed, took {time.perf_counter() - start:.1f} Seconds.")
+    print(f"Summary written to {folder}/summary.csv, all commands to {folder}/all-commands.txt")
+    return summary
 
 
 # If run from the command line
 if __name__ == "__main__":
 
     # Check arguments, if 'xml' then don't need the rest of the input
-    argrequired = '--xml' not in sys.argv and '-x' not in sys.argv
+    argrequired = (
+        '--xml' not in sys.argv and '-x' not in sys.argv and '--replay' not in sys.argv
+        and '--delta' not in sys.argv and '-d' not in sys.argv
+    )
+    fleet = '--fleet' in sys.argv or '-f' in sys.argv
     parser = argparse.ArgumentParser(description="Please use this syntax:")
-    parser.add_argument("-x", "--xml", help="Optional XML Filename", type=str)
+    parser.add_argument("-x", "--xml", help="Exported running/candidate config file, offline", type=str)
+    parser.add_argument("--record", help="Save every API response to this folder, see --replay", type=str)
+    parser.add_argument("--replay", help="Offline, answer every API call from a --record folder", type=str)
+    parser.add_argument("-c", "--config", help="Grab the whole running/candidate config once", choices=["running", "candidate"])
+    parser.add_argument("-f", "--fleet", help="Inventory file, host[,template,device group] per line, non-interactive", type=str)
+    parser.add_argument("-w", "--workers", help="Fleet targets grabbed at the same time", type=int, default=pa_api.MAX_WORKERS)
+    parser.add_argument("-d", "--delta", help="Only new/moved IP's, OLD and NEW are each an api/ archive folder, config file or IP/FQDN", nargs=2, metavar=("OLD", "NEW"))
+    parser.add_argument("-s", "--send", help="Send the gARP's through the API, with a report", action="store_true")
+    parser.add_argument("-n", "--nat-lookup", help="Also list the NAT rules using this IP (or a pool containing it)", type=str)
+    parser.add_argument("-r", "--rate", help="gARP's per second per interface (--send)", type=float, default=GARP_RATE)
     parser.add_argument("-u", "--username", help="Username", type=str, required=argrequired)
-    parser.add_argument("-i", "--ipaddress", help="IP or FQDN of PA/Panorama", type=str, required=argrequired)
+    parser.add_argument("-i", "--ipaddress", help="IP or FQDN of PA/Panorama", type=str, required=argrequired and not fleet)
     args = parser.parse_args()
 
     # IF XML, do not connect to PA/Pan
     if args.xml:
         DEBUG = True
         filename = args.xml
-        garp_logic("n/a", "n/a", "n/a", "xml", filename)
+        garp_logic("n/a", "n/a", "n/a", "xml", filename, nat_lookup=args.nat_lookup)
+        sys.exit(0)
+
+    # IF DELTA, old vs new firewall, only asks for a password if one of them is live
+    if args.delta:
+        password = None
+        if not all(os.path.exists(source) for source in args.delta):
+            if not args.username:
+                print("Username (-u) needed to connect to a PA/Panorama.")
+                sys.exit(0)
+            password = getpass("Enter Password: ")
+        garp_delta(*args.delta, args.username, password, send=args.send, garp_rate=args.rate)
+        sys.exit(0)
+
+    # IF REPLAY, do not connect to PA/Pan
+    if args.replay:
+        garp_logic("n/a", "n/a", "n/a", None, snapshot=args.config, replay=args.replay, nat_lookup=args.nat_lookup)
         sys.exit(0)
 
     # Gather input
@@ -497,6 +1209,11 @@ if __name__ == "__main__":
     username = args.username
     password = getpass("Enter Password: ")    
 
+    # IF FLEET, every PA/Panorama in the inventory, no prompts
+    if args.fleet:
+        garp_fleet(args.fleet, username, password, args.workers, send=args.send, garp_rate=args.rate)
+        sys.exit(0)
+
     # Create connection with the Palo Alto as 'obj' to test login success
     try:
         paobj = pa_api.api_lib_pa(pa_ip, username, password, "test")
@@ -509,4 +1226,7 @@ if __name__ == "__main__":
     pa_type = pa_api.get_pa_type()
     
     # Run program
-    garp_logic(pa_ip, username, password, pa_type)
+    garp_logic(
+        pa_ip, username, password, pa_type, snapshot=args.config, record=args.record,
+        send=args.send, garp_rate=args.rate, nat_lookup=args.nat_lookup,
+    )
@@ -1,20 +1,26 @@
 """
-Discription: 
+Discription:
     Palo alto firewalls api does not expose a way to delete software from devices.
     since pa200 have such tiny harddrives it is often nessary to delete all previous
-    downlaoded or uploaded images from the device. 
-    
+    downlaoded or uploaded images from the device.
+
     Make a file with one firewall address
     per line set the defaults in the defauts section below.
 
+    Firewalls are cleaned up in parallel (--workers), each with its own timeout (--timeout),
+    and a per-device result report can be written as JSON or CSV (--report).
+
+    Software is deleted through the XML API op command by default (--engine api), an SSH
+    session is only opened for firewalls that don't support it (--engine ssh to always use SSH).
+
 Requires:
     getpass
     netmiko
     requests
     json
     xmltodict
-        
-        to install try: pip install netmiko xmltodict requests 
+
+        to install try: pip install netmiko xmltodict requests
 
 Author:
     Devin Callaway dcallaway@compunet.biz
@@ -26,13 +32,17 @@ Tested:
 
 Example usage:
     Set default filename username and global timeout in default section below
-        $ python deleteUnusedSoftware.py
-        Password: 
+        $ python paCleanUp.py
+        Password:
+
+    Fleet run, 20 firewalls at a time, actually delete, save a report:
+        $ python paCleanUp.py -f firewalls.txt -u admin -w 20 --commit -r report.csv
+        Password:
 
 Cautions:
     Diffrent firewalls my require an adjustment to delay factor on any given command
-    PA220 
-    4 for connection 
+    PA220
+    4 for connection
     10 for system info
     15 for software info
 
@@ -46,7 +56,6 @@ Legal:
     OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 Todo:
-    * change the loop to a fuction so not useing continue:
     * test on multiple plaforms
     * change it up to take a csv with diffrent usernames and passwords per firewall.
 """
@@ -56,12 +65,20 @@ from __future__ import print_function, unicode_literals
 from netmiko import Netmiko
 from getpass import getpass
 from netmiko import ConnectHandler
-from netmiko.ssh_exception import NetMikoTimeoutException
-from netmiko.ssh_exception import NetMikoAuthenticationException
+try:
+    from netmiko.exceptions import NetMikoTimeoutException
+    from netmiko.exceptions import NetMikoAuthenticationException
+except ImportError:     # netmiko < 4
+    from netmiko.ssh_exception import NetMikoTimeoutException
+    from netmiko.ssh_exception import NetMikoAuthenticationException
 import requests
 import json
+import csv
+import time
+import argparse
+import concurrent.futures
 import xmltodict
-from requests.packages.urllib3.exceptions import InsecureRequestWarning 
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
 
 #############################
@@ -71,9 +88,11 @@ from requests.packages.urllib3.exceptions import InsecureRequestWarning
 username = "dcallaway"
 global_delay_factor = 4
 filename = "firewalls2.txt"
-password = getpass()
-#set commitChange to True or False depending if you want this script to actully delete the software. 
+#set commitChange to True or False depending if you want this script to actully delete the software.
 commitChange = False
+workers = 10        # firewalls cleaned up at the same time
+timeout = 60        # seconds, per API call / SSH connection
+engine = "api"      # "api" (XML API, falls back to SSH if unsupported) or "ssh"
 
 #############################
 #    END DEFAULTS
@@ -82,84 +101,228 @@ commitChange = False
 #disable RequestWarning because nobody has there certs in order on managment interface
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
-try:
-    firewalls = open(filename)
-except: 
-    print("Please configure default settings with a file firewalls.txt with one hostname per line and configure defaut username and password.")
-    exit()
-print ("Opening " + filename)
-if commitChange:
-    print ("Not a testrun, script will make canges")
-else:    
-    print ("Test run: no changes will be made")
-
-#loop threw each line in filename:
-for aline in firewalls:
-    #clean up trailing spaces: or this is left over from when i was doing cvs, cant rembmer. 
-    currentFirewall = aline.split()
-    currentFirewall = currentFirewall[0]
+
+# PAN-OS XML API error codes meaning the op command itself isn't supported
+# (1 'Unknown command', 17 'Invalid command'), anything else (ie. 12 'Invalid object') is a real error.
+UNSUPPORTED_CODES = ("1", "17")
+
+
+def api_uri(host):
+    return 'https://' + host + "/api"
+
+
+class ApiUnsupported(Exception):
+    """
+    The firewall doesn't accept the software delete op command, use SSH instead.
+    """
+    pass
+
+
+def delete_software_api(s, uri, key, version, timeout):
+    """
+    Send 'delete software version <version>' as an XML API op command.
+
+    :raises ApiUnsupported: if the command isn't supported on this PAN-OS version
+    :raises Exception: any other error returned by the firewall
+    """
+    cmd = "<delete><software><version>{}</version></software></delete>".format(version)
+    r = s.get(uri, params={'type': 'op', 'cmd': cmd, 'key': key}, timeout=timeout)
+    d = xmltodict.parse(r.text)
+    if d['response']['@status'] == "success":
+        return True
+
+    msg = json.dumps(d['response'].get('msg') or d['response'].get('result'))
+    # 'Unknown command' / 'Invalid command' means this PAN-OS doesn't support it via the API
+    if d['response'].get('@code') in UNSUPPORTED_CODES or "nknown command" in msg:
+        raise ApiUnsupported(msg)
+    raise Exception("API delete " + version + " failed: " + msg)
+
+
+def cleanup_firewall(currentFirewall, username, password, commitChange, timeout, engine="api"):
+    """
+    Delete every downloaded/uploaded software version that isn't the current one.
+
+    :param currentFirewall: firewall hostname/IP
+    :param engine: "api" (falls back to SSH if unsupported) or "ssh"
+    :return: result dictionary: host, status, deleted, engine, error, seconds, log
+    """
+    start = time.time()
+    result = {
+        "host": currentFirewall,
+        "status": "failed",
+        "deleted": [],
+        "engine": engine,
+        "error": "",
+        "seconds": 0,
+        "log": [],
+    }
 
     #set dict up for netmikko connection:
     my_device = {
         'host': currentFirewall,
         'username': username,
-        'password': password,   
+        'password': password,
         'device_type': 'paloalto_panos',
-        'global_delay_factor': global_delay_factor
+        'global_delay_factor': global_delay_factor,
+        'timeout': timeout,
     }
 
     #set up request session to firewall API
-    connectionString = 'https://' + currentFirewall + "/api"
-    uri = connectionString
+    uri = api_uri(currentFirewall)
     s = requests.session()
     s.verify = False
+    net_connect = None
 
-    # get our API KEY and error out if bad connection or password
     try:
-        parameters = {"type": "keygen", "user": username ,"password": password}
-        response = s.get(uri, params=parameters)
-    except:
-        print("Can not get API key from firwall:" + currentFirewall)
-        continue
-    
-    #convert the XML into dict because: xml
-    d = xmltodict.parse(response.text)
-    key = d['response']['result']['key']
-    
-    #Connect to device via SSH
-    print ("Establishing SSH connection to device: " + currentFirewall)
-    try:
-        net_connect = Netmiko(**my_device)
-    except NetMikoTimeoutException:
-        print('\n\n\nERROR: Can not connect to Device:' + currentFirewall + "\n\n\n")  
-        continue   ###go to top of loop if we cant connect.  
-    except NetMikoAuthenticationException:
-        print('\n\n\nERROR: Bad username or password:' + currentFirewall + "\n\n\n")
-        continue   ###go to top of loop if we cant connect. 
-    #setup API request to get software info
-    params = {'type': 'op', 'cmd': '<request><system><software><info></info></software></system></request>', 'key': key}
-    r = s.get(uri, params=params)
-
-    #print this var if you get lost in json
-    versionSonReadable = json.dumps(xmltodict.parse(r.text), indent=4)
-
-    #convert the XML into dict because: xml
-    versionSon = xmltodict.parse(r.text)
-
-    #loop threw output and send delete software command to device.    
-    for item in versionSon["response"]["result"]["sw-updates"]["versions"]["entry"]:
-        if item["current"] == "yes":
-            continue
-        if item["downloaded"] == "yes" or item["uploaded"] == "yes":
-            commandString = ("delete software version " + item["version"])
-            print ("sending commnad to device: " + commandString + "\n")
+        # get our API KEY and error out if bad connection or password
+        try:
+            parameters = {"type": "keygen", "user": username ,"password": password}
+            response = s.get(uri, params=parameters, timeout=timeout)
+            #convert the XML into dict because: xml
+            d = xmltodict.parse(response.text)
+            key = d['response']['result']['key']
+        except Exception:
+            result["error"] = "Can not get API key from firewall"
+            return result
+
+        #setup API request to get software info
+        params = {'type': 'op', 'cmd': '<request><system><software><info></info></software></system></request>', 'key': key}
+        try:
+            r = s.get(uri, params=params, timeout=timeout)
+            versionSon = xmltodict.parse(r.text)
+            versions = versionSon["response"]["result"]["sw-updates"]["versions"]["entry"]
+        except Exception:
+            result["error"] = "Can not get software info"
+            return result
+        if not isinstance(versions, list):
+            versions = [versions]
+
+        to_delete = [
+            item["version"] for item in versions
+            if item["current"] != "yes" and (item["downloaded"] == "yes" or item["uploaded"] == "yes")
+        ]
+        if not to_delete:
+            result["status"] = "nothing to delete"
+            return result
+
+        def ssh_connect():
+            result["log"].append("Establishing SSH connection to device")
+            try:
+                return Netmiko(**my_device)
+            except NetMikoTimeoutException:
+                raise Exception("Can not connect to Device")
+            except NetMikoAuthenticationException:
+                raise Exception("Bad username or password")
+
+        #send delete software command to device.
+        for version in to_delete:
+            commandString = ("delete software version " + version)
+            result["log"].append("sending command to device: " + commandString)
             if commitChange:
-                net_connect.send_command(commandString, delay_factor=10)
+                if result["engine"] == "api":
+                    try:
+                        delete_software_api(s, uri, key, version, timeout)
+                    except ApiUnsupported as e:
+                        result["log"].append("XML API delete not supported, using SSH: " + str(e))
+                        result["engine"] = "ssh"
+                if result["engine"] == "ssh":
+                    #Connect to device via SSH, only if needed
+                    if not net_connect:
+                        net_connect = ssh_connect()
+                    net_connect.send_command(commandString, delay_factor=10)
+            result["deleted"].append(version)
+
+        result["status"] = "deleted" if commitChange else "test run"
+        return result
+
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    finally:
+        #close conections.
+        if net_connect:
+            net_connect.disconnect()
+        s.close()
+        result["seconds"] = round(time.time() - start, 1)
+
+
+def write_report(results, report):
+    """
+    Write the per-device results to report (.csv, anything else is JSON)
+    """
+    if report.endswith(".csv"):
+        with open(report, "w", newline="") as fout:
+            writer = csv.writer(fout)
+            writer.writerow(["host", "status", "deleted", "engine", "error", "seconds"])
+            for result in results:
+                writer.writerow([
+                    result["host"], result["status"], " ".join(result["deleted"]),
+                    result["engine"], result["error"], result["seconds"],
+                ])
+    else:
+        with open(report, "w") as fout:
+            json.dump(results, fout, indent=4)
+    print("Report written to " + report)
+
+
+def main(filename, username, password, commitChange, workers, timeout, report=None, engine="api"):
+
+    try:
+        with open(filename) as fin:
+            #clean up trailing spaces: or this is left over from when i was doing cvs, cant rembmer.
+            firewalls = [aline.split()[0] for aline in fin if aline.strip()]
+    except OSError:
+        print("Please configure default settings with a file firewalls.txt with one hostname per line and configure defaut username and password.")
+        exit()
+    print ("Opening " + filename)
+    if commitChange:
+        print ("Not a testrun, script will make canges")
+    else:
+        print ("Test run: no changes will be made")
+    print ("{} firewalls, {} at a time\n".format(len(firewalls), workers))
+
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(cleanup_firewall, fw, username, password, commitChange, timeout, engine)
+            for fw in firewalls
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            # One block per firewall, as each one finishes
+            print("{host}: {status} {deleted} ({seconds}s)".format(
+                host=result["host"], status=result["status"],
+                deleted=" ".join(result["deleted"]), seconds=result["seconds"],
+            ))
+            if result["error"]:
+                print("\tERROR: " + result["error"])
+
+    # Keep the report in the same order as the input file
+    order = {fw: index for index, fw in enumerate(firewalls)}
+    results.sort(key=lambda x: order[x["host"]])
+
+    failed = [x for x in results if x["error"]]
+    print("\n{} firewalls, {} failed".format(len(results), len(failed)))
+    if report:
+        write_report(results, report)
+
+    print ("closeing " + filename)
+    return results
+
 
-    #close ssh conection.
-    print("closeing connections\n\n\n\n")
-    net_connect.disconnect()
-    s.close()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete unused software images from firewalls")
+    parser.add_argument("-f", "--filename", help="File with one firewall per line", default=filename)
+    parser.add_argument("-u", "--username", help="Username", default=username)
+    parser.add_argument("-w", "--workers", help="Firewalls to clean up at the same time", type=int, default=workers)
+    parser.add_argument("-t", "--timeout", help="Seconds per API call / SSH connection", type=int, default=timeout)
+    parser.add_argument("-r", "--report", help="Write per-device results to this .json or .csv file")
+    parser.add_argument("-e", "--engine", help="Delete via 'api' (SSH fallback) or 'ssh'", choices=["api", "ssh"], default=engine)
+    parser.add_argument("--commit", help="Actually delete the software (otherwise test run)", action="store_true", default=commitChange)
+    args = parser.parse_args()
 
-print ("closeing " + filename)
-firewalls.close()
\ No newline at end of file
+    password = getpass()
+    main(args.filename, args.username, password, args.commit, args.workers, args.timeout, args.report, args.engine)
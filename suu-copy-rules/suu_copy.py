@@ -37,8 +37,6 @@ import sys
 import os
 import json
 import time
-import xml.dom.minidom
-import copy
 import argparse
 
 import xmltodict
@@ -91,13 +89,8 @@ def output_and_push_changes(new_rules, filename=None, xpath=None, pa=None):
     # Prepare output
     add_entry_tag = {"entry": new_rules}   # Adds the <entry> tag to each rule
     new_rules_xml = {"config": {"security": {"rules": add_entry_tag} } } # Provides an xpath for importing
-    data = xmltodict.unparse(new_rules_xml)    # Turn XML into a string
-    prettyxml = xml.dom.minidom.parseString(data).toprettyxml() # Pretty-fi the XML before creating file
-    prettyxml = prettyxml.replace('<?xml version="1.0" ?>', "") # Can't import with this in the XML, remove it
     # Create output file
-    with open(filename, "w") as fout:
-        fout.write(prettyxml)
-        print(f"\nOutput at: {filename}\n")
+    pa_api.write_config_file(new_rules_xml, filename)
 
     if settings.PUSH_CONFIG_TO_PA:
         # Ask for filename
@@ -134,9 +127,7 @@ def output_and_push_changes(new_rules, filename=None, xpath=None, pa=None):
                 xpath = xpath.replace(pa.device_group, pa.dst_device_group)
 
             fname = filename.rsplit('/', 1)[1]  # Get filename, strip any folders before the filename.
-            load_url = f"https://{pa.pa_ip}:443/api/?type=op&key={pa.key}&cmd=<load><config><partial><mode>replace</mode><from-xpath>/config/security/rules</from-xpath><to-xpath>{xpath}</to-xpath><from>{fname}</from></partial></config></load>"
-            
-            response = pa.session[pa.pa_ip].get(load_url, verify=False)
+            response = pa.load_partial_config(fname, "/config/security/rules", xpath)
             error_check(response, "Loading Configuration")
 
             print("\nCandidate configuration successfully loaded...enjoy the new ruleset!")
@@ -168,91 +159,83 @@ def get_device_groups(pa):
     return src_device_group, dst_device_group
 
 
+def retarget_device_group(pa, xpaths):
+    """
+    --batch, load into the destination Device Group.
+
+    :param xpaths: rulebase xpaths with the source device group
+    :return: xpaths to load into
+    """
+    same_dg = ""
+    while same_dg.lower() not in ("y", "n"):
+        same_dg = input(f"Push to destination Device Group ({pa.dst_device_group})? [y/n]: ")
+
+    # Update xpaths to the destination device-group
+    if same_dg == "n":
+        print("\nWell then why'd you say so last time I asked? Try again!\n")
+        sys.exit(0)
+
+    return [xpath.replace(pa.device_group, pa.dst_device_group) for xpath in xpaths]
+
+
 def copy_rules(security_rules, zone_to_check):
     """
     COPY/CLONE SECURITY RULES
     This accepts a dictionary of rules and copies them to a new Device Group if ZONENAME matches
     ZONENAME currently taken in via user input.
 
-    :param security_rules: existing security rules
+    :param security_rules: existing security rules (list, single rule, or generator from iter_api_entries)
     :return: new_rules, new/cloned security rule-set
     """
-    def copy1(tofrom, x_zone):
-        """
-        inner function (possibly to be moved outside later)
-        The bulk of the logic is done here
-        Source & destination behave the same, this allows the same code to be used for both.
-
-        :param tofrom: the xml Address-Object tag needed for insertion into the new rule
-        :param x_zone: from or to, zone name
-        :return: True or False
-        """
-
-        tocopy = False
-
-        try:
-            if not isinstance(x_zone, list):
-                x_zone = [x_zone]
-                newrule[tofrom]["member"] = [newrule[tofrom]["member"]]
-
-            for zone in x_zone:
-                if zone_to_check == zone:   # Found relevant rule
-                    tocopy = True
-                else:
-                    pass
-
-        except TypeError:
-            print("\nError, candidate config detected. Please commit or revert changes before proceeding.\n")
-            sys.exit(0)              
-
-        # If I only made it a list to make it easier on myself, change it back.
-        if len(newrule[tofrom]["member"]) == 1:
-            newrule[tofrom]["member"] = newrule[tofrom]["member"][0]
-    
-        return tocopy 
-
     # copy_rules()
     copied_rules = []
-    if not isinstance(security_rules, list):
+    if isinstance(security_rules, dict):
         security_rules = [security_rules]
 
     print("\nEvaluating...\n")
     for oldrule in security_rules:
-        newrule = copy.deepcopy(oldrule)
-        from_zone = oldrule["from"]["member"]
-        to_zone = oldrule["to"]["member"]
-
-        # Check and copy if Zone is found
-        tocopy = copy1("from", from_zone)
-        if not tocopy:
-            tocopy = copy1("to", to_zone)
+        rule = pa_api.Rule.from_dict(oldrule)
+        if not rule.parsed:
+            print("\nError, candidate config detected. Please commit or revert changes before proceeding.\n")
+            sys.exit(0)
 
-        if tocopy:
-            copied_rules.append(newrule)
+        # Copy if Zone is found, copied as is, nothing in the rule changes so it doesn't need to be duplicated
+        if zone_to_check in rule.from_zone or zone_to_check in rule.to_zone:
+            copied_rules.append(oldrule)
 
     print("..Done.")
     return copied_rules
 
 
-def suu_copy(pa_ip, username, password, pa_type, filename=None):
+def suu_copy(pa_ip, username, password, pa_type, filename=None, stream=False, batch=False, record=None, replay=None):
     """
     Main point of entry.
     Connect to PA/Panorama.
     Grab security rules from pa/pan.
     Clone if ZONENAME is found
+    If stream, rules are evaluated one at a time as they are downloaded (large rulebases)
+    If batch, pre & post rules are uploaded as one named config and loaded in one pass
+    If record (folder), every API response is saved for replay.
+    If replay (folder), every API call is answered from a record folder, offline.
     """
 
     # Grab 'start' time
     start = time.perf_counter()
     
-    if pa_type != "xml":
+    if replay:
+        pa = pa_api.api_lib_pa.replay(replay, pa_type)
+        pa_type = pa.pa_type
+    elif pa_type != "xml":
         pa = pa_api.api_lib_pa(pa_ip, username, password, pa_type)
+        if record:
+            pa.record(record)
     to_output = []
 
     if pa_type == "xml":
         # Grab XML file, clone rules, and create output file.
         security_rules = grab_xml_or_json_file(filename)
-        new_rules = new_rules(security_rules["result"]["rules"]["entry"])
+        zone_to_check = input("\nEnter the Zone name to be migrated: ")
+        new_rules = copy_rules(security_rules["result"]["rules"]["entry"], zone_to_check)
         output_and_push_changes(new_rules, "output/new-xml-rules.xml")
 
     elif pa_type == "panorama":
@@ -265,29 +248,45 @@ def suu_copy(pa_ip, username, password, pa_type, filename=None):
         XPATH_PRE = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", pa.device_group)
         XPATH_POST = pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", pa.device_group)
 
-        # Grab Rules
-        pre_security_rules = pa.grab_api_output("xml", XPATH_PRE, "output/api/pre-rules.xml")
-        post_security_rules = pa.grab_api_output("xml", XPATH_POST, "output/api/post-rules.xml")
-
-        # Clone the rules, Pre & Post, then append to output list
-
-        if pre_security_rules["result"]:
-            if "entry" in pre_security_rules["result"]["rules"]:
-                new_rules_pre = copy_rules(pre_security_rules["result"]["rules"]["entry"], zone_to_check)
+        if stream:
+            # Clone the rules as they are downloaded, Pre & Post, then append to output list
+            new_rules_pre = copy_rules(pa.iter_api_entries(XPATH_PRE, "output/api/pre-rules.xml"), zone_to_check)
+            if new_rules_pre:
                 to_output.append([new_rules_pre,"output/new-pre-rules.xml", XPATH_PRE, pa])
 
-        if post_security_rules["result"]:
-            if "entry" in post_security_rules["result"]["rules"]:
-                new_rules_post = copy_rules(post_security_rules["result"]["rules"]["entry"], zone_to_check)
+            new_rules_post = copy_rules(pa.iter_api_entries(XPATH_POST, "output/api/post-rules.xml"), zone_to_check)
+            if new_rules_post:
                 to_output.append([new_rules_post,"output/new-post-rules.xml", XPATH_POST, pa])
+        else:
+            # Grab Rules
+            PRE_JOB = (XPATH_PRE, "output/api/pre-rules.xml")
+            POST_JOB = (XPATH_POST, "output/api/post-rules.xml")
+            api_output = pa.grab_api_output_batch([PRE_JOB, POST_JOB])
+            pre_security_rules = api_output[PRE_JOB]
+            post_security_rules = api_output[POST_JOB]
+
+            # Clone the rules, Pre & Post, then append to output list
+
+            if pre_security_rules["result"]:
+                if "entry" in pre_security_rules["result"]["rules"]:
+                    new_rules_pre = copy_rules(pre_security_rules["result"]["rules"]["entry"], zone_to_check)
+                    to_output.append([new_rules_pre,"output/new-pre-rules.xml", XPATH_PRE, pa])
+
+            if post_security_rules["result"]:
+                if "entry" in post_security_rules["result"]["rules"]:
+                    new_rules_post = copy_rules(post_security_rules["result"]["rules"]["entry"], zone_to_check)
+                    to_output.append([new_rules_post,"output/new-post-rules.xml", XPATH_POST, pa])
             
     else:
         print("Error, Device Groups don't exist on a PA, whatchu talking 'bout?")
         sys.exit(0)
 
     # Begin creating output and/or pushing rules to PA/PAN
-    for ruletype in to_output:
-        output_and_push_changes(*ruletype)
+    if batch:
+        pa_api.output_and_push_batch(to_output, push=settings.PUSH_CONFIG_TO_PA, retarget=retarget_device_group)
+    else:
+        for ruletype in to_output:
+            output_and_push_changes(*ruletype)
 
     end = time.perf_counter()
     runtime = end - start
@@ -298,11 +297,15 @@ def suu_copy(pa_ip, username, password, pa_type, filename=None):
 if __name__ == "__main__":
 
     # Check arguments, if 'xml' then don't need the rest of the input
-    argrequired = '--xml' not in sys.argv and '-x' not in sys.argv
+    argrequired = '--xml' not in sys.argv and '-x' not in sys.argv and '--replay' not in sys.argv
     parser = argparse.ArgumentParser(description="Please use this syntax:")
     parser.add_argument("-x", "--xml", help="Optional XML Filename", type=str)
+    parser.add_argument("--record", help="Save every API response to this folder, see --replay", type=str)
+    parser.add_argument("--replay", help="Offline, answer every API call from a --record folder", type=str)
     parser.add_argument("-u", "--username", help="Username", type=str, required=argrequired)
     parser.add_argument("-i", "--ipaddress", help="IP or FQDN of PA/Panorama", type=str, required=argrequired)
+    parser.add_argument("-s", "--stream", help="Stream large rulebases one rule at a time (less memory)", action="store_true")
+    parser.add_argument("-b", "--batch", help="Upload pre & post rules as one config and load them in one pass", action="store_true")
     args = parser.parse_args()
 
     # IF XML, do not connect to PA/Pan
@@ -312,6 +315,11 @@ if __name__ == "__main__":
         suu_copy("n/a","n/a","n/a","xml",filename)
         sys.exit(0)
 
+    # IF REPLAY, do not connect to PA/Pan
+    if args.replay:
+        suu_copy("n/a", "n/a", "n/a", None, stream=args.stream, batch=args.batch, replay=args.replay)
+        sys.exit(0)
+
     # Gather input
     pa_ip = args.ipaddress
     username = args.username
@@ -330,4 +338,4 @@ if __name__ == "__main__":
 
     # Run program
     print("\nThank you...connecting..\n")
-    suu_copy(pa_ip, username, password, pa_type)
\ No newline at end of file
+    suu_copy(pa_ip, username, password, pa_type, stream=args.stream, batch=args.batch, record=args.record)
\ No newline at end of file
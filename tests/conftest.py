@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# paCleanUp.py lives at the top, gARP's api_lib_pa.py is the copy the others are synced from
+for path in (ROOT, os.path.join(ROOT, "gARP")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def pa_stub():
+    from pa_stub import PAStub
+
+    stub = PAStub()
+    yield stub
+    stub.close()
@@ -0,0 +1,74 @@
+"""
+Local HTTP stand-in for a PA/Panorama XML API (/api), for the tests.
+
+Every GET/POST is recorded in stub.requests (dictionary of the query/form parameters) and answered
+by the first handler whose op command or type matches, see PAStub.on().
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+KEY = "STUBKEY"
+
+
+def response(status="success", result="", code=None, msg=None):
+    code = f' code="{code}"' if code else ""
+    body = f"<result>{result}</result>" if msg is None else f"<msg><line>{msg}</line></msg>"
+    return f'<response status="{status}"{code}>{body}</response>'
+
+
+class PAStub:
+    def __init__(self):
+        self.requests = []
+        self.handlers = []      # (type, op command substring or None, reply)
+        self.on("keygen", None, response(result=f"<key>{KEY}</key>"))
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, params):
+                stub.requests.append(params)
+                status, body = stub.reply(params)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/xml")
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+            def do_GET(self):
+                self._reply(dict(parse_qsl(urlsplit(self.path).query)))
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                params = dict(parse_qsl(urlsplit(self.path).query))
+                params.update(parse_qsl(self.rfile.read(length).decode()))
+                self._reply(params)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def on(self, call_type, cmd, reply, status=200):
+        """
+        Answer requests of this type (and op command containing cmd) with reply, newest first.
+        """
+        self.handlers.insert(0, (call_type, cmd, reply, status))
+
+    def reply(self, params):
+        for call_type, cmd, reply, status in self.handlers:
+            if params.get("type") == call_type and (cmd is None or cmd in params.get("cmd", "")):
+                return status, reply
+        return 200, response("error", code="1", msg="Unknown command")
+
+    def ops(self, cmd):
+        """
+        :return: op commands received containing cmd
+        """
+        return [x["cmd"] for x in self.requests if x.get("type") == "op" and cmd in x.get("cmd", "")]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,69 @@
+import asyncio
+import gc
+import socket
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+import api_lib_pa as pa_api
+from pa_stub import response
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pa_api, "ASYNC_BACKOFF", 0)
+
+
+def request(method, url, **kwargs):
+    async def run():
+        pa = pa_api.async_api_lib_pa("127.0.0.1", "admin", "secret", "pa")
+        try:
+            return await pa._request(method, url, **kwargs)
+        finally:
+            await pa.close()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("method, query, status, attempts", [
+    ("GET", "type=config&action=get&xpath=/config", 500, pa_api.ASYNC_RETRIES + 1),
+    ("GET", "type=op&cmd=<show><clock></clock></show>", 503, pa_api.ASYNC_RETRIES + 1),
+    ("POST", "type=keygen", 500, pa_api.ASYNC_RETRIES + 1),
+    # Might have been applied, not sent again even though they're GETs
+    ("GET", "type=config&action=set&xpath=/config&element=<x/>", 500, 1),
+    ("GET", "type=op&cmd=<load><config><partial></partial></config></load>", 503, 1),
+    ("POST", "type=config&action=delete&xpath=/config", 502, 1),
+    ("POST", "type=config&action=set&xpath=/config", 429, pa_api.ASYNC_RETRIES + 1),
+    ("GET", "type=config&action=set&xpath=/config", 200, 1),
+])
+def test_retries_follow_idempotency(pa_stub, method, query, status, attempts):
+    call_type = query.split("&")[0].split("=")[1]
+    pa_stub.on(call_type, None, response("error", msg="busy"), status=status)
+
+    if method == "POST":
+        result = request(method, f"http://{pa_stub.host}/api", data=dict(x.split("=", 1) for x in query.split("&")))
+    else:
+        result = request(method, f"http://{pa_stub.host}/api?{query}")
+
+    assert result.status_code == status
+    assert len(pa_stub.requests) == attempts
+
+
+def test_post_retried_when_never_connected():
+    with socket.socket() as sock:   # A port nothing listens on
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    with pytest.raises(aiohttp.ClientConnectorError):
+        request("POST", f"http://127.0.0.1:{port}/api", data={"type": "config", "action": "set"})
+
+
+def test_semaphores_forgotten_with_the_loop():
+    async def semaphore():
+        return pa_api.async_api_lib_pa("192.0.2.1", "admin", "secret", "pa")._semaphore()
+
+    for _ in range(3):
+        asyncio.run(semaphore())
+    gc.collect()
+
+    assert len(pa_api.async_api_lib_pa._semaphores) == 0
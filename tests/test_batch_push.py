@@ -0,0 +1,119 @@
+import os
+
+import pytest
+import xmltodict
+
+import api_lib_pa as pa_api
+
+PRE = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", "DG1")
+POST = pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", "DG1")
+
+
+class Reply:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+
+class FakePA:
+    pa_type = "panorama"
+    device_group = "DG1"
+
+    def __init__(self, fail=()):
+        self.imported = []
+        self.loaded = []
+        self.fail = fail
+
+    def import_named_configuration(self, fin):
+        self.imported.append(fin.read())
+        return Reply('<response status="success"/>')
+
+    def load_partial_config(self, fname, from_xpath, to_xpath):
+        self.loaded.append((fname, from_xpath, to_xpath))
+        if to_xpath in self.fail:
+            return Reply('<response status="error"/>')
+        return Reply('<response status="success"/>')
+
+
+def rule(name):
+    return {"@name": name, "action": "allow"}
+
+
+def test_xpath_to_dict_shares_entries():
+    config = {}
+    pa_api.xpath_to_dict(PRE, {"entry": [rule("a")]}, config)
+    pa_api.xpath_to_dict(POST, {"entry": [rule("b")]}, config)
+    pa_api.xpath_to_dict(PRE.replace("DG1", "DG2"), {"entry": [rule("c")]}, config)
+
+    device_groups = config["config"]["devices"]["entry"]["device-group"]["entry"]
+    assert config["config"]["devices"]["entry"]["@name"] == "localhost.localdomain"
+    assert [dg["@name"] for dg in device_groups] == ["DG1", "DG2"]
+    assert device_groups[0]["pre-rulebase"]["security"]["rules"]["entry"] == [rule("a")]
+    assert device_groups[0]["post-rulebase"]["security"]["rules"]["entry"] == [rule("b")]
+    assert device_groups[1]["pre-rulebase"]["security"]["rules"]["entry"] == [rule("c")]
+
+
+def test_xpath_to_dict_round_trips_through_xml():
+    config = pa_api.xpath_to_dict(PRE, {"entry": [rule("a"), rule("b")]})
+    parsed = xmltodict.parse(xmltodict.unparse(config))
+
+    dg = parsed["config"]["devices"]["entry"]["device-group"]["entry"]
+    assert dg["@name"] == "DG1"
+    assert [x["@name"] for x in dg["pre-rulebase"]["security"]["rules"]["entry"]] == ["a", "b"]
+
+
+@pytest.fixture
+def output(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("output")
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+
+
+def test_batch_one_import_every_rulebase_loaded(output, capsys):
+    pa = FakePA()
+    to_output = [
+        [[rule("a")], "output/pre.xml", PRE, pa, None],
+        [[rule("b")], "output/post.xml", POST, pa, None],
+    ]
+
+    results = pa_api.output_and_push_batch(to_output)
+
+    assert results == [(PRE, True), (POST, True)]
+    # One named configuration, both rulebases at their real xpaths
+    assert len(pa.imported) == 1
+    imported = xmltodict.parse(pa.imported[0])
+    dg = imported["config"]["devices"]["entry"]["device-group"]["entry"]
+    assert dg["pre-rulebase"]["security"]["rules"]["entry"]["@name"] == "a"
+    assert dg["post-rulebase"]["security"]["rules"]["entry"]["@name"] == "b"
+    assert pa.loaded == [("batch-rules.xml", PRE, PRE), ("batch-rules.xml", POST, POST)]
+    # The per rulebase output files too
+    assert os.path.exists("output/pre.xml") and os.path.exists("output/post.xml")
+    assert "successfully loaded" in capsys.readouterr().out
+
+
+def test_batch_keeps_going_after_a_failed_load(output, capsys):
+    pa = FakePA(fail=(PRE,))
+    to_output = [[[rule("a")], "output/pre.xml", PRE, pa], [[rule("b")], "output/post.xml", POST, pa]]
+
+    assert pa_api.output_and_push_batch(to_output) == [(PRE, False), (POST, True)]
+    assert "successfully loaded" not in capsys.readouterr().out
+
+
+def test_batch_retarget(output):
+    pa = FakePA()
+    to_output = [[[rule("a")], "output/pre.xml", PRE, pa]]
+
+    def retarget(pa, xpaths):
+        return [xpath.replace("DG1", "DG2") for xpath in xpaths]
+
+    pa_api.output_and_push_batch(to_output, retarget=retarget)
+    assert pa.loaded == [("batch-rules.xml", PRE, PRE.replace("DG1", "DG2"))]
+
+
+def test_batch_output_only(output):
+    pa = FakePA()
+
+    assert pa_api.output_and_push_batch([[[rule("a")], "output/pre.xml", PRE, pa]], push=False) is None
+    assert pa.imported == []
+    with open("output/pre.xml") as fin:
+        assert xmltodict.parse(fin.read())["config"]["security"]["rules"]["entry"]["@name"] == "a"
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+import requests
+
+import api_lib_pa as pa_api
+from pa_stub import response
+
+XPATH = "/config/devices/entry[@name='localhost.localdomain']/vsys/entry[@name='vsys1']/rulebase/security/rules"
+
+
+class PlainHTTP(requests.Session):
+    """
+    The PA stub is plain HTTP on a random port, api_lib_pa uses https://<pa_ip>:443/
+    """
+    def request(self, method, url, **kwargs):
+        return super().request(method, url.replace("https://", "http://").replace(":443/", "/"), **kwargs)
+
+
+@pytest.fixture
+def recorded(pa_stub, tmp_path):
+    pa_stub.on("config", None, response(result='<rules><entry name="allow-web"><action>allow</action></entry></rules>'))
+    pa = pa_api.api_lib_pa._offline(pa_stub.host, "pa")
+    pa.key = "LIVEKEY"
+    pa.session[pa.pa_ip] = PlainHTTP()
+    folder = str(tmp_path / "cassette")
+
+    pa.record(folder)
+    output = pa.grab_api_output("xml", XPATH)
+    pa_stub.close()     # No device from here on
+    return folder, output
+
+
+def test_replay_without_a_device(recorded):
+    folder, output = recorded
+    assert output["result"]["rules"]["entry"]["@name"] == "allow-web"
+
+    pa = pa_api.api_lib_pa.replay(folder)
+    pa.key = "ANOTHERKEY"   # Keys change between runs, the recording still matches
+
+    assert pa.pa_type == "pa"
+    assert pa.grab_api_output("xml", XPATH) == output
+
+
+def test_key_left_out_of_the_request_key(recorded):
+    folder, _ = recorded
+
+    with open(os.path.join(folder, pa_api.Cassette.INDEX)) as fin:
+        index = fin.read()
+    assert "LIVEKEY" not in index
+    (filename, details), = json.loads(index)["responses"].items()
+    assert ["key", "LIVEKEY"] not in details["params"]
+    assert ["xpath", XPATH] in details["params"]
+
+    url = f"https://fw:443/api?type=config&action=get&xpath={XPATH}"
+    assert pa_api.Cassette.request_key("GET", url + "&key=A") == pa_api.Cassette.request_key("GET", url + "&key=B")
+    assert pa_api.Cassette.request_key("GET", url + "&key=A")[0] == filename
+    # POST data too
+    post = pa_api.Cassette.request_key("POST", "https://fw/api/", {"type": "config", "action": "get", "key": "A"})
+    assert post == pa_api.Cassette.request_key("POST", "https://fw/api/", {"type": "config", "action": "get", "key": "B"})
+
+
+def test_replay_miss(recorded):
+    folder, _ = recorded
+    pa = pa_api.api_lib_pa.replay(folder)
+
+    with pytest.raises(pa_api.CassetteMiss):
+        pa.grab_api_output("xml", XPATH.replace("security", "nat"))
+
+
+def test_replay_needs_a_recording(tmp_path):
+    with pytest.raises(pa_api.CassetteMiss):
+        pa_api.api_lib_pa.replay(str(tmp_path))
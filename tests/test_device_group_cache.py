@@ -0,0 +1,45 @@
+import api_lib_pa as pa_api
+
+PANORAMA_CONFIG = """
+<response status="success"><result><config>
+  <shared>
+    <address>
+      <entry name="web"><ip-netmask>10.0.0.1</ip-netmask></entry>
+      <entry name="dns"><ip-netmask>10.0.0.53</ip-netmask></entry>
+    </address>
+  </shared>
+  <devices><entry name="localhost.localdomain">
+    <device-group>
+      <entry name="branch">
+        <address><entry name="web"><ip-netmask>10.9.0.1</ip-netmask></entry></address>
+      </entry>
+    </device-group>
+  </entry></devices>
+  <readonly><devices><entry name="localhost.localdomain"><device-group>
+    <entry name="branch"/>
+  </device-group></entry></devices></readonly>
+</config></result></response>
+"""
+
+
+def cache(folder):
+    snapshot = pa_api.ConfigSnapshot.from_string(PANORAMA_CONFIG)
+    return pa_api.DeviceGroupCache(pa_api.api_lib_pa.from_snapshot(snapshot, "panorama"), folder=str(folder))
+
+
+def test_shared_entries_before_any_prefetch(tmp_path):
+    dg_cache = cache(tmp_path)
+
+    assert sorted(dg_cache.entries(dg_cache.SHARED, "address")) == ["dns", "web"]
+    # Still there once the device groups are fetched
+    dg_cache.prefetch(["branch"])
+    assert sorted(dg_cache.entries(dg_cache.SHARED, "address")) == ["dns", "web"]
+
+
+def test_device_group_overrides_shared(tmp_path):
+    dg_cache = cache(tmp_path)
+
+    assert dg_cache.chain("branch") == ["branch", dg_cache.SHARED]
+    assert dg_cache.resolver("branch").resolve("web") == ["10.9.0.1"]
+    assert dg_cache.resolver("branch").resolve("dns") == ["10.0.0.53"]
+    assert dg_cache.resolver(dg_cache.SHARED).resolve("web") == ["10.0.0.1"]
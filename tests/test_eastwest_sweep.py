@@ -0,0 +1,118 @@
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+import api_lib_pa as pa_api
+from conftest import ROOT
+
+PANORAMA_CONFIG = """
+<response status="success"><result><config>
+  <shared>
+    <address>
+      <entry name="app1"><ip-netmask>192.168.77.10</ip-netmask></entry>
+      <entry name="db"><ip-netmask>10.5.5.5</ip-netmask></entry>
+    </address>
+  </shared>
+  <devices><entry name="localhost.localdomain">
+    <device-group>
+      <entry name="DG1">
+        <pre-rulebase><security><rules>
+          <entry name="to-app"><from><member>untrust</member></from><to><member>trusted</member></to>
+            <source><member>any</member></source><destination><member>app1</member></destination><action>allow</action></entry>
+          <entry name="to-db"><from><member>untrust</member></from><to><member>trusted</member></to>
+            <source><member>any</member></source><destination><member>db</member></destination><action>allow</action></entry>
+        </rules></security></pre-rulebase>
+      </entry>
+      <entry name="DG2">
+        <address><entry name="app1"><ip-netmask>10.6.6.6</ip-netmask></entry></address>
+        <pre-rulebase><security><rules>
+          <entry name="to-app"><from><member>untrust</member></from><to><member>trusted</member></to>
+            <source><member>any</member></source><destination><member>app1</member></destination><action>allow</action></entry>
+        </rules></security></pre-rulebase>
+        <post-rulebase><security><rules>
+          <entry name="from-app"><from><member>trusted</member></from><to><member>untrust</member></to>
+            <source><member>app1</member></source><destination><member>any</member></destination><action>allow</action></entry>
+        </rules></security></post-rulebase>
+      </entry>
+    </device-group>
+  </entry></devices>
+  <readonly><devices><entry name="localhost.localdomain"><device-group>
+    <entry name="DG1"/><entry name="DG2"/>
+  </device-group></entry></devices></readonly>
+</config></result></response>
+"""
+
+
+def load_script(folder, filename, name):
+    """
+    Import a project's script (hyphenated names can't be imported), with it's own zone_settings.
+    Registered in sys.modules so the sweep's worker processes can find it's functions.
+    """
+    folder = os.path.join(ROOT, folder)
+    sys.modules.pop("zone_settings", None)
+    sys.path.insert(0, folder)
+    try:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(folder, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(folder)
+        sys.modules.pop("zone_settings", None)
+    return module
+
+
+@pytest.fixture
+def eastwest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("output/api")
+    yield load_script("eastwest-helper", "eastwest-helper.py", "eastwest_helper")
+    sys.modules.pop("eastwest_helper", None)
+
+
+def names(rules):
+    return [rule["@name"] for rule in rules]
+
+
+def test_sweep_in_worker_processes(eastwest):
+    pa = pa_api.api_lib_pa.from_snapshot(pa_api.ConfigSnapshot.from_string(PANORAMA_CONFIG), "panorama")
+
+    to_output = eastwest.sweep_device_groups(pa, ["DG1", "DG2"])
+
+    rulebases = {xpath: (rules, fetched) for rules, _, xpath, _, fetched in to_output}
+    dg1_pre = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", "DG1")
+    dg2_pre = pa_api.XPATH_SECURITY_RULES_PRE_PAN.replace("DEVICE_GROUP", "DG2")
+    dg2_post = pa_api.XPATH_SECURITY_RULES_POST_PAN.replace("DEVICE_GROUP", "DG2")
+    assert sorted(rulebases) == sorted([dg1_pre, dg2_pre, dg2_post])
+
+    # Shared app1 is in the trust subnet, DG2 overrides it with an address outside of it
+    assert names(rulebases[dg1_pre][0]) == ["to-app-cloned", "to-app", "to-db"]
+    assert names(rulebases[dg2_pre][0]) == ["to-app"]
+    assert names(rulebases[dg2_post][0]) == ["from-app"]
+    cloned = rulebases[dg1_pre][0][0]
+    assert cloned["to"]["member"] == "Application-Servers"
+    # The fetched rules are kept for --diff
+    assert names(rulebases[dg1_pre][1]) == ["to-app", "to-db"]
+
+    # Same as modifying each device group in this process
+    for dg, xpath in (("DG1", dg1_pre), ("DG2", dg2_pre)):
+        eastwest.mem.resolver = pa_api.DeviceGroupCache(pa).resolver(dg)
+        eastwest.mem.trust_matches = {}
+        assert eastwest.eastwest_addnew_zone(rulebases[xpath][1]) == rulebases[xpath][0]
+
+
+@pytest.mark.parametrize("folder, script", [
+    ("eastwest-helper", "eastwest-helper.py"),
+    ("becu", "becu.py"),
+])
+def test_device_groups_with_stream_rejected(folder, script):
+    result = subprocess.run(
+        [sys.executable, script, "-u", "admin", "-i", "192.0.2.1", "-g", "all", "--stream"],
+        cwd=os.path.join(ROOT, folder), capture_output=True, text=True, stdin=subprocess.DEVNULL, timeout=60,
+    )
+
+    assert result.returncode == 2
+    assert "can't be combined with --stream" in result.stderr
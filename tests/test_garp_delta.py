@@ -0,0 +1,23 @@
+import glob
+import os
+
+import garp
+from test_garp_fleet import CONFIG
+
+
+def test_delta_review_folder_per_side(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    for side, prefix in (("old", "203.0.113"), ("new", "198.51.100")):
+        with open(f"{side}.xml", "w") as fout:
+            fout.write(CONFIG.format(prefix=prefix, name=side))
+
+    delta = garp.garp_delta("old.xml", "new.xml")
+
+    assert delta == [("198.51.100.1", "ethernet1/1"), ("198.51.100.10", "ethernet1/1")]
+    # Both sides' review files kept, the new firewall doesn't overwrite the old one's
+    for side in ("old", "new"):
+        reviews = glob.glob(f"api/{side}/review/**/*.xml", recursive=True)
+        assert [os.path.basename(x) for x in reviews] == [f"review-off-{side}.xml"]
+    assert not os.path.exists("api/review")
+    out = capsys.readouterr().out
+    assert "old: " in out and "new: " in out
@@ -0,0 +1,67 @@
+import glob
+import json
+import os
+
+import pytest
+
+import api_lib_pa as pa_api
+import garp
+
+CONFIG = """<config><devices><entry name="localhost.localdomain">
+  <network><interface><ethernet>
+    <entry name="ethernet1/1"><layer3><ip><entry name="{prefix}.1/24"/></ip></layer3></entry>
+  </ethernet></interface></network>
+  <vsys><entry name="vsys1">
+    <address><entry name="pub"><ip-netmask>{prefix}.10</ip-netmask></entry></address>
+    <rulebase><nat><rules>
+      <entry name="snat"><source-translation><static-ip><translated-address>pub</translated-address></static-ip></source-translation></entry>
+      <entry name="off-{name}"><disabled>yes</disabled></entry>
+    </rules></nat></rulebase>
+  </entry></vsys>
+</entry></devices></config>"""
+
+FIREWALLS = {"fw1": "203.0.113", "fw2": "198.51.100"}
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def fleet(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sent = []
+    offline = pa_api.api_lib_pa.from_snapshot
+
+    def login(host, username, password, pa_type):
+        if host not in FIREWALLS:
+            raise SystemExit(0)
+        snapshot = pa_api.ConfigSnapshot.from_string(CONFIG.format(prefix=FIREWALLS[host], name=host))
+        pa = offline(snapshot)
+        pa.op = lambda cmd: sent.append((host, cmd)) or Reply('<response status="success"><result/></response>')
+        return pa
+
+    monkeypatch.setattr(garp.pa_api, "api_lib_pa", login)
+    with open("inventory.csv", "w") as fout:
+        fout.write("# firewalls\nfw1\nbad\nfw2\n")
+    return sent
+
+
+def test_fleet_files_per_firewall(fleet):
+    summary = garp.garp_fleet("inventory.csv", "admin", "secret", 3, folder="out", send=True, garp_rate=0)
+
+    assert [x["host"] for x in summary] == ["fw1", "bad", "fw2"]
+    assert summary[1]["error"] == "Login Failed"
+    for host, prefix in FIREWALLS.items():
+        with open(f"out/{host}.json") as fin:
+            result = json.load(fin)
+        assert result["interfaces"] == [f"test arp gratuitous ip {prefix}.1 interface ethernet1/1"]
+        assert result["nat"] == [f"test arp gratuitous ip {prefix}.10 interface ethernet1/1"]
+        assert result["garp"]["sent"] == 2
+        # Each firewall's review files in it's own folder
+        reviews = glob.glob(f"out/api/{host}/review/**/*.xml", recursive=True)
+        assert [os.path.basename(x) for x in reviews] == [f"review-off-{host}.xml"]
+
+    assert sorted(host for host, _ in fleet) == ["fw1", "fw1", "fw2", "fw2"]
+    assert not os.path.exists("api/review")
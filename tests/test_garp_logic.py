@@ -0,0 +1,17 @@
+import pytest
+
+import garp
+from test_garp_fleet import CONFIG
+
+
+def test_exported_config_never_sends(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(garp, "confirm_send", lambda *args: pytest.fail("offline, nothing to send"))
+    with open("running-config.xml", "w") as fout:
+        fout.write(CONFIG.format(prefix="203.0.113", name="fw"))
+
+    garp.garp_logic("n/a", "n/a", "n/a", "xml", "running-config.xml", send=True)
+
+    out = capsys.readouterr().out
+    assert "test arp gratuitous ip 203.0.113.10 interface ethernet1/1" in out
+    assert "Offline, no gARP's sent." in out
@@ -0,0 +1,43 @@
+import pytest
+
+import garp
+
+
+@pytest.fixture
+def trie():
+    trie = garp.InterfaceTrie()
+    assert trie.insert("10.0.0.1/8", "ethernet1/1")
+    assert trie.insert("10.1.0.1/16", "ethernet1/2")
+    assert trie.insert("10.1.2.1/24", "ethernet1/3.10")
+    assert trie.insert("2001:db8::1/32", "ethernet1/4")
+    assert trie.insert("2001:db8:1::1/48", "ethernet1/5")
+    return trie
+
+
+@pytest.mark.parametrize("ip, ifname", [
+    ("10.9.9.9", "ethernet1/1"),
+    ("10.1.9.9", "ethernet1/2"),
+    ("10.1.2.200", "ethernet1/3.10"),
+    ("10.1.2.0/28", "ethernet1/3.10"),     # Networks too, the most specific one containing it
+    ("10.1.0.0/16", "ethernet1/2"),
+    ("10.0.0.0/7", None),                  # Bigger than any interface subnet
+    ("192.168.1.1", None),
+    ("2001:db8:ffff::1", "ethernet1/4"),
+    ("2001:db8:1:2::1", "ethernet1/5"),
+    ("pub-object", None),
+])
+def test_longest_prefix_match(trie, ip, ifname):
+    assert trie.lookup(ip) == ifname
+
+
+def test_first_interface_wins_and_default_route():
+    trie = garp.InterfaceTrie()
+    assert trie.insert("10.1.2.1/24", "ethernet1/1")
+    assert trie.insert("10.1.2.2/24", "ethernet1/2")
+    assert not trie.insert("not-an-ip", "ethernet1/3")
+    assert trie.lookup("10.1.2.3") == "ethernet1/1"
+    assert trie.lookup("8.8.8.8") is None
+
+    assert trie.insert("0.0.0.0/0", "ethernet1/9")
+    assert trie.lookup("8.8.8.8") == "ethernet1/9"
+    assert trie.lookup("2001:db8::1") is None
@@ -0,0 +1,69 @@
+import glob
+
+import pytest
+import xmltodict
+
+import api_lib_pa as pa_api
+
+XPATH = pa_api.XPATH_SECURITYRULES
+
+RULES = """<response status="success"><result total-count="1" count="1"><rules>
+  <entry name="r1" uuid="1d3c6a4e-0000-4000-8000-000000000001">
+    <from><member>trust</member></from>
+    <to><member>untrust</member><member>dmz</member></to>
+    <target><devices><entry name="0123456789"/></devices></target>
+    <action>allow</action>
+    <description>a &amp; b</description>
+  </entry>
+  <entry name="r2"><from><member>any</member></from><disabled>yes</disabled></entry>
+  <entry name="r3"/>
+</rules></result></response>"""
+
+ONE_RULE = """<response status="success"><result><rules>
+  <entry name="only"><action>deny</action></entry>
+</rules></result></response>"""
+
+NO_RULES = """<response status="success" code="7"><result/></response>"""
+
+
+class FakeSession:
+    def __init__(self, content):
+        self.content = content.encode()
+
+    def get(self, url, **kwargs):
+        return pa_api.build_response(url, 200, self.content)
+
+
+def streaming_pa(content):
+    pa = pa_api.api_lib_pa._offline("192.0.2.1", "pa")
+    pa.session[pa.pa_ip] = FakeSession(content)
+    return pa
+
+
+def expected(content):
+    result = xmltodict.parse(content)["response"]["result"]
+    return pa_api.as_list(((result or {}).get("rules") or {}).get("entry"))
+
+
+@pytest.mark.parametrize("content", [RULES, ONE_RULE, NO_RULES])
+def test_stream_matches_xmltodict(content):
+    assert list(streaming_pa(content).iter_api_entries(XPATH)) == expected(content)
+
+
+@pytest.mark.parametrize("content", [RULES, ONE_RULE])
+def test_snapshot_matches_xmltodict(content):
+    config = f"""<config><devices><entry name="localhost.localdomain"><vsys><entry name="vsys1">
+        <rulebase><security>{content.split("<result", 1)[1].split(">", 1)[1].rsplit("</result>", 1)[0]}</security></rulebase>
+    </entry></vsys></entry></devices></config>"""
+    pa = pa_api.api_lib_pa.from_snapshot(pa_api.ConfigSnapshot.from_string(config), "pa")
+
+    assert list(pa.iter_api_entries(XPATH)) == expected(content)
+
+
+def test_stream_archives_the_raw_response(tmp_path):
+    entries = list(streaming_pa(RULES).iter_api_entries(XPATH, f"{tmp_path}/api/rules.xml"))
+
+    assert len(entries) == 3
+    archived, = glob.glob(f"{tmp_path}/api/*/rules.xml")
+    with open(archived, "rb") as fin:
+        assert fin.read() == RULES.encode()
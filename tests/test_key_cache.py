@@ -0,0 +1,113 @@
+import json
+import os
+import stat
+
+import pytest
+
+import api_lib_pa as pa_api
+
+
+@pytest.fixture
+def cache_file(tmp_path, monkeypatch):
+    filename = str(tmp_path / "keys.json")
+    monkeypatch.setattr(pa_api, "KEY_CACHE_FILE", filename)
+    return filename
+
+
+def test_hit(cache_file):
+    pa_api.cache_key("fw1", "admin", "secret", "KEY1")
+
+    assert pa_api.get_cached_key("fw1", "admin", "secret") == "KEY1"
+    # Per host and user
+    assert pa_api.get_cached_key("fw2", "admin", "secret") is None
+    assert pa_api.get_cached_key("fw1", "other", "secret") is None
+
+
+def test_miss_after_password_change(cache_file):
+    pa_api.cache_key("fw1", "admin", "secret", "KEY1")
+
+    assert pa_api.get_cached_key("fw1", "admin", "changed") is None
+    # The password itself is never stored
+    with open(cache_file) as fin:
+        text = fin.read()
+    assert "secret" not in text
+    assert json.loads(text)["fw1|admin"]["check"]
+
+
+def test_expired_and_uncached(cache_file, monkeypatch):
+    pa_api.cache_key("fw1", "admin", "secret", "KEY1")
+    pa_api.cache_key("fw2", "admin", "secret", "KEY2")
+
+    pa_api.uncache_key("fw1", "admin")
+    assert pa_api.get_cached_key("fw1", "admin", "secret") is None
+    assert pa_api.get_cached_key("fw2", "admin", "secret") == "KEY2"
+
+    monkeypatch.setattr(pa_api.time, "time", lambda: 2 ** 40)
+    assert pa_api.get_cached_key("fw2", "admin", "secret") is None
+
+
+def test_unreadable_cache_is_empty(cache_file):
+    with open(cache_file, "w") as fout:
+        fout.write("not json")
+
+    assert pa_api.get_cached_key("fw1", "admin", "secret") is None
+    pa_api.cache_key("fw1", "admin", "secret", "KEY1")
+    assert pa_api.get_cached_key("fw1", "admin", "secret") == "KEY1"
+
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX file permissions")
+def test_file_permissions(cache_file):
+    pa_api.cache_key("fw1", "admin", "secret", "KEY1")
+    assert stat.S_IMODE(os.stat(cache_file).st_mode) == 0o600
+
+    # An existing file with wider permissions is tightened
+    os.chmod(cache_file, 0o644)
+    pa_api.cache_key("fw2", "admin", "secret", "KEY2")
+    assert stat.S_IMODE(os.stat(cache_file).st_mode) == 0o600
+
+
+@pytest.fixture
+def plain_http(monkeypatch):
+    """
+    The PA stub is plain HTTP on a random port, login() uses https://<pa_ip>(:443)/
+    """
+    request = pa_api.ScheduledSession.request
+
+    def http(self, method, url, **kwargs):
+        return request(self, method, url.replace("https://", "http://").replace(":443/", "/"), **kwargs)
+
+    monkeypatch.setattr(pa_api.ScheduledSession, "request", http)
+    monkeypatch.setattr(pa_api, "_sessions", {})
+
+
+def keygens(pa_stub):
+    return len([x for x in pa_stub.requests if x.get("type") == "keygen"])
+
+
+def test_login_reuses_cached_key(cache_file, plain_http, pa_stub):
+    from pa_stub import KEY, response
+
+    pa_stub.on("op", "<clock>", response(result="<clock/>"))
+    assert pa_api.api_lib_pa(pa_stub.host, "admin", "secret", "pa").key == KEY
+    assert keygens(pa_stub) == 1
+
+    # Next run, no keygen
+    pa_api._sessions.clear()
+    assert pa_api.api_lib_pa(pa_stub.host, "admin", "secret", "pa").key == KEY
+    assert keygens(pa_stub) == 1
+    assert pa_stub.ops("<clock>")
+
+    # Password changed, keygen again
+    pa_api._sessions.clear()
+    pa_api.api_lib_pa(pa_stub.host, "admin", "changed", "pa")
+    assert keygens(pa_stub) == 2
+
+
+def test_login_drops_rejected_key(cache_file, plain_http, pa_stub):
+    pa_api.cache_key(pa_stub.host, "admin", "secret", "REVOKED")
+
+    pa = pa_api.api_lib_pa(pa_stub.host, "admin", "secret", "pa")   # <show><clock> isn't answered
+
+    assert pa.key != "REVOKED"
+    assert keygens(pa_stub) == 1
+    assert pa_api.get_cached_key(pa_stub.host, "admin", "secret") == pa.key
@@ -0,0 +1,75 @@
+import api_lib_pa as pa_api
+
+RULE = {
+    "@name": "allow-web",
+    "@uuid": "1d3c6a4e-0000-4000-8000-000000000001",
+    "to": {"member": "untrust"},
+    "from": {"member": ["trust", "dmz"]},
+    "source": {"member": ["10.0.0.0/8", "grp-servers"]},
+    "destination": {"member": "any"},
+    "source-user": {"member": "any"},
+    "category": {"member": "any"},
+    "application": {"member": ["web-browsing", "ssl"]},
+    "service": {"member": "application-default"},
+    "source-hip": {"member": "any"},
+    "destination-hip": {"member": "any"},
+    "action": "allow",
+    "profile-setting": {"group": {"member": "default"}},
+    "description": "web out",
+}
+
+
+def test_rule_round_trip():
+    rule = pa_api.Rule.from_dict(RULE)
+
+    assert rule.name == "allow-web"
+    assert rule.from_zone == ("trust", "dmz")
+    assert rule.to_zone == ("untrust",)
+    assert rule.action == "allow"
+    assert rule.parsed
+    # Same dictionary back, same field order
+    assert list(rule.to_dict().items()) == list(RULE.items())
+
+
+def test_rule_round_trip_unparsed_members():
+    # Candidate config members carry attributes, kept as is
+    entry = dict(RULE, source={"member": [{"@admin": "x", "#text": "10.0.0.0/8"}]})
+    rule = pa_api.Rule.from_dict(entry)
+
+    assert not rule.parsed
+    assert rule.source == ()
+    assert list(rule.to_dict().items()) == list(entry.items())
+
+
+def test_rule_replace_is_copy_on_write():
+    rule = pa_api.Rule.from_dict(RULE)
+    new = rule.replace(name="allow-web-cloned", from_zone=["new-zone"], tag=rule.tag + ("cloned",))
+
+    assert rule.to_dict() == RULE
+    assert new.name == "allow-web-cloned"
+    assert new.from_zone == ("new-zone",)
+    assert new.application is rule.application
+    new_dict = new.to_dict()
+    assert new_dict["from"] == {"member": "new-zone"}
+    assert new_dict["tag"] == {"member": "cloned"}
+    # Fields it didn't have are added at the end, the rest keep their place
+    assert list(new_dict) == list(RULE) + ["tag"]
+
+
+def test_rule_replace_parsed_field_drops_unparsed_value():
+    entry = dict(RULE, source={"member": [{"@admin": "x", "#text": "10.0.0.0/8"}]})
+    new = pa_api.Rule.from_dict(entry).replace(source=["192.168.0.0/16"])
+
+    assert new.parsed
+    assert new.to_dict()["source"] == {"member": "192.168.0.0/16"}
+    assert list(new.to_dict()) == list(entry)
+
+
+def test_address_models_round_trip():
+    address = {"@name": "web", "ip-netmask": "10.0.0.1/32", "tag": {"member": ["a", "b"]}}
+    group = {"@name": "dyn", "dynamic": {"filter": "'web' and 'prod'"}}
+
+    assert pa_api.AddressObject.from_dict(address).to_dict() == address
+    assert pa_api.AddressObject.from_dict(address).ip_netmask == "10.0.0.1/32"
+    assert pa_api.AddressGroup.from_dict(group).to_dict() == group
+    assert pa_api.AddressGroup.from_dict(group).static == ()
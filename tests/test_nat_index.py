@@ -0,0 +1,109 @@
+import pytest
+
+import api_lib_pa as pa_api
+import garp
+
+OBJECTS = [
+    {"@name": "pub", "ip-netmask": "203.0.113.10"},
+    {"@name": "pool", "ip-netmask": "203.0.113.32/29"},
+    {"@name": "pool6", "ip-netmask": "2001:db8:1::/120"},
+    {"@name": "web", "ip-netmask": "10.1.1.10"},
+    {"@name": "partner", "fqdn": "vpn.example.com"},
+    {"@name": "legacy", "ip-range": "203.0.113.50-203.0.113.60"},
+]
+GROUPS = [
+    {"@name": "egress", "static": {"member": ["pub", "partner", "legacy"]}},
+]
+RULES = {"entry": [
+    {"@name": "dipp", "source-translation": {"dynamic-ip-and-port": {"translated-address": {"member": "pub"}}}},
+    {"@name": "dip", "source-translation": {"dynamic-ip": {"translated-address": {"member": ["pool", "pool6"]}}}},
+    {"@name": "bidir", "source-translation": {"static-ip": {"translated-address": "203.0.113.20", "bi-directional": "yes"}}},
+    {"@name": "dnat", "destination-translation": {"translated-address": "web"}},
+    {"@name": "v6", "source-translation": {"static-ip": {"translated-address": "2001:db8::5"}}},
+    {"@name": "off", "disabled": "yes", "source-translation": {"dynamic-ip-and-port": {"translated-address": {"member": "pub"}}}},
+]}
+
+
+def interfaces(ip):
+    return garp.InterfaceTrie._network(ip) and (
+        "ethernet1/2" if garp.InterfaceTrie._network(ip).version == 6 else "ethernet1/1"
+    )
+
+
+@pytest.fixture
+def index():
+    return garp.NatIndex(pa_api.AddressResolver(OBJECTS, GROUPS), interfaces).add_rules(RULES)
+
+
+def rules(found):
+    return sorted((x.rule, x.kind) for x in found)
+
+
+def test_source_dipp(index):
+    assert rules(index.lookup("203.0.113.10")) == [
+        ("dipp", "dynamic-ip-and-port"), ("off", "dynamic-ip-and-port"),
+    ]
+    assert [x.disabled for x in index.by_rule["off"]] == [True]
+    assert index.lookup("pub") == index.lookup("203.0.113.10")
+
+
+def test_dip_pools(index):
+    # Any IP in the pool, not just the configured network
+    assert rules(index.lookup("203.0.113.37")) == [("dip", "dynamic-ip")]
+    assert rules(index.lookup("203.0.113.32/30")) == [("dip", "dynamic-ip")]
+    assert index.lookup("203.0.113.40") == []
+    assert index.lookup("203.0.113.0/26") == []  # Bigger than the pool
+
+
+def test_static_bidirectional(index):
+    found = index.lookup("203.0.113.20")
+    assert rules(found) == [("bidir", "static-ip bi-directional")]
+    assert found[0].interface == "ethernet1/1"
+
+
+def test_destination(index):
+    assert rules(index.lookup("10.1.1.10")) == [("dnat", "destination")]
+    assert rules(index.lookup("web")) == [("dnat", "destination")]
+
+
+def test_mixed_ipv4_ipv6(index):
+    assert rules(index.lookup("2001:db8::5")) == [("v6", "static-ip")]
+    assert rules(index.lookup("2001:db8:1::80")) == [("dip", "dynamic-ip")]
+    assert index.lookup("2001:db8:2::1") == []
+    assert index.lookup("2001:db8::5")[0].interface == "ethernet1/2"
+
+
+def test_pool_lookup_is_indexed(index):
+    # Pools are grouped by IP version and prefix length, no scan over every pool
+    assert set(index.pools[4]) == {29}
+    assert set(index.pools[6]) == {120}
+
+
+def test_unsupported_members_of_a_resolving_group():
+    index = garp.NatIndex(pa_api.AddressResolver(OBJECTS, GROUPS), interfaces)
+    index.add({"@name": "grp", "source-translation": {"dynamic-ip-and-port": {"translated-address": {"member": "egress"}}}})
+
+    assert [x.ip for x in index.by_rule["grp"]] == ["203.0.113.10"]
+    assert sorted(index.unsupported) == ["legacy", "partner"]
+    assert index.unsupported["partner"]["fqdn"] == "vpn.example.com"
+
+
+def test_nat_lookup_cli(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with open("running-config.xml", "w") as fout:
+        fout.write("""<config><devices><entry name="localhost.localdomain">
+  <network><interface><ethernet>
+    <entry name="ethernet1/1"><layer3><ip><entry name="203.0.113.1/24"/></ip></layer3></entry>
+  </ethernet></interface></network>
+  <vsys><entry name="vsys1">
+    <rulebase><nat><rules>
+      <entry name="pool-nat"><source-translation><dynamic-ip><translated-address><member>203.0.113.32/29</member></translated-address></dynamic-ip></source-translation></entry>
+    </rules></nat></rulebase>
+  </entry></vsys>
+</entry></devices></config>""")
+
+    garp.garp_logic("n/a", "n/a", "n/a", "xml", "running-config.xml", nat_lookup="203.0.113.33")
+
+    out = capsys.readouterr().out
+    assert "NAT RULES USING 203.0.113.33" in out
+    assert "pool-nat: dynamic-ip 203.0.113.32/29, interface ethernet1/1" in out
@@ -0,0 +1,106 @@
+import pytest
+
+pytest.importorskip("netmiko")
+import paCleanUp
+from pa_stub import response
+
+SOFTWARE_INFO = response(result="""
+<sw-updates><versions>
+    <entry><version>10.1.3</version><downloaded>yes</downloaded><current>yes</current><uploaded>no</uploaded></entry>
+    <entry><version>10.1.2</version><downloaded>yes</downloaded><current>no</current><uploaded>no</uploaded></entry>
+    <entry><version>10.0.8</version><downloaded>no</downloaded><current>no</current><uploaded>yes</uploaded></entry>
+    <entry><version>9.1.0</version><downloaded>no</downloaded><current>no</current><uploaded>no</uploaded></entry>
+</versions></sw-updates>""")
+
+
+class FakeSSH:
+    """
+    Netmiko stand-in, records the commands sent.
+    """
+    sessions = []
+
+    def __init__(self, **device):
+        self.device = device
+        self.commands = []
+        self.disconnected = False
+        FakeSSH.sessions.append(self)
+
+    def send_command(self, command, **kwargs):
+        self.commands.append(command)
+        return ""
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+@pytest.fixture
+def firewall(pa_stub, monkeypatch):
+    monkeypatch.setattr(paCleanUp, "api_uri", lambda host: "http://" + host + "/api")
+    monkeypatch.setattr(paCleanUp, "Netmiko", FakeSSH)
+    FakeSSH.sessions = []
+    pa_stub.on("op", "<software><info>", SOFTWARE_INFO)
+    return pa_stub
+
+
+def cleanup(stub, commit=True):
+    return paCleanUp.cleanup_firewall(stub.host, "admin", "secret", commit, 5)
+
+
+def test_api_delete(firewall):
+    firewall.on("op", "<delete><software>", response(result="Deleted"))
+
+    result = cleanup(firewall)
+
+    assert result["status"] == "deleted"
+    assert result["error"] == ""
+    assert result["engine"] == "api"
+    assert result["deleted"] == ["10.1.2", "10.0.8"]
+    assert firewall.ops("<delete>") == [
+        "<delete><software><version>10.1.2</version></software></delete>",
+        "<delete><software><version>10.0.8</version></software></delete>",
+    ]
+    assert FakeSSH.sessions == []
+
+
+def test_test_run_deletes_nothing(firewall):
+    result = cleanup(firewall, commit=False)
+
+    assert result["status"] == "test run"
+    assert result["deleted"] == ["10.1.2", "10.0.8"]
+    assert firewall.ops("<delete>") == []
+    assert FakeSSH.sessions == []
+
+
+@pytest.mark.parametrize("code, msg", [("1", "Unknown command"), ("17", "Invalid command")])
+def test_unsupported_falls_back_to_ssh(firewall, code, msg):
+    firewall.on("op", "<delete><software>", response("error", code=code, msg=msg))
+
+    result = cleanup(firewall)
+
+    assert result["status"] == "deleted"
+    assert result["engine"] == "ssh"
+    # Only the first version is tried through the API, one SSH session for the rest
+    assert len(firewall.ops("<delete>")) == 1
+    assert len(FakeSSH.sessions) == 1
+    assert FakeSSH.sessions[0].commands == ["delete software version 10.1.2", "delete software version 10.0.8"]
+    assert FakeSSH.sessions[0].disconnected
+
+
+def test_object_error_is_not_unsupported(firewall):
+    firewall.on("op", "<delete><software>", response("error", code="12", msg="Invalid object"))
+
+    result = cleanup(firewall)
+
+    assert result["status"] == "failed"
+    assert "Invalid object" in result["error"]
+    assert result["engine"] == "api"
+    assert FakeSSH.sessions == []
+
+
+def test_bad_password(firewall):
+    firewall.on("keygen", None, response("error", code="403", msg="Invalid credentials."), status=403)
+
+    result = cleanup(firewall)
+
+    assert result["error"] == "Can not get API key from firewall"
+    assert firewall.ops("") == []
@@ -0,0 +1,202 @@
+import io
+
+import pytest
+import requests
+
+import api_lib_pa as pa_api
+from pa_stub import response
+
+
+class Clock:
+    """
+    Fake time.monotonic()/time.sleep(), sleeping only moves the clock.
+    """
+    def __init__(self):
+        self.now = 1024.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(pa_api.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(pa_api.time, "sleep", clock.sleep)
+    monkeypatch.setattr(pa_api, "REQUEST_BACKOFF", 0)
+    return clock
+
+
+@pytest.mark.parametrize("method, url, data, idempotent", [
+    ("POST", "https://fw/api?type=keygen", {"user": "admin", "password": "x"}, True),
+    ("GET", "https://fw/api?type=config&action=get&xpath=/config", None, True),
+    ("GET", "https://fw/api?type=config&action=show&xpath=/config", None, True),
+    ("GET", "https://fw/api?type=op&cmd=<show><clock></clock></show>", None, True),
+    ("GET", "https://fw/api?type=export&category=configuration", None, True),
+    ("GET", "https://fw/restapi/v10.1/Objects/Addresses?location=shared", None, True),
+    ("GET", "https://fw/api?type=config&action=set&xpath=/config&element=<x/>", None, False),
+    ("GET", "https://fw/api?type=config&action=edit&xpath=/config&element=<x/>", None, False),
+    ("GET", "https://fw/api?type=config&action=delete&xpath=/config", None, False),
+    ("GET", "https://fw/api/?type=op&cmd=<load><config><partial></partial></config></load>", None, False),
+    ("GET", "https://fw/api?type=op&cmd=<test><arp><gratuitous></gratuitous></arp></test>", None, False),
+    ("GET", "https://fw/api?type=commit&cmd=<commit></commit>", None, False),
+    ("POST", "https://fw/api", {"type": "config", "action": "set", "xpath": "/config"}, False),
+    ("POST", "https://fw/api?type=import&category=configuration", None, False),
+    ("POST", "https://fw/restapi/v10.1/Objects/Addresses?location=shared", None, False),
+])
+def test_is_idempotent(method, url, data, idempotent):
+    assert pa_api.is_idempotent(method, url, data=data) is idempotent
+
+
+def attempts(scheduler, idempotent, outcome):
+    """
+    :param outcome: exception raised, or status code returned, by every attempt
+    :return: (number of attempts, result or exception)
+    """
+    calls = []
+
+    def send():
+        calls.append(1)
+        if isinstance(outcome, Exception):
+            raise outcome
+        reply = requests.Response()
+        reply.status_code = outcome
+        reply.raw = io.BytesIO()
+        return reply
+
+    try:
+        result = scheduler.send(idempotent, send).status_code
+    except requests.exceptions.RequestException as e:
+        result = e
+    return len(calls), result
+
+
+@pytest.mark.parametrize("idempotent, outcome, tries", [
+    (True, 500, pa_api.REQUEST_RETRIES + 1),
+    (True, 429, pa_api.REQUEST_RETRIES + 1),
+    (True, requests.exceptions.ReadTimeout(), pa_api.REQUEST_RETRIES + 1),
+    (False, 500, 1),
+    (False, 503, 1),
+    (False, 429, pa_api.REQUEST_RETRIES + 1),
+    (False, requests.exceptions.ReadTimeout(), 1),      # Reached the PA/Panorama, might be applied
+    (False, requests.exceptions.ConnectionError("Connection aborted"), 1),
+    (False, requests.exceptions.ConnectTimeout(), pa_api.REQUEST_RETRIES + 1),
+    (True, 200, 1),
+    (False, 200, 1),
+])
+def test_retry_policy(clock, idempotent, outcome, tries):
+    count, result = attempts(pa_api.RequestScheduler(rate=None), idempotent, outcome)
+
+    assert count == tries
+    assert result is outcome if isinstance(outcome, Exception) else result == outcome
+
+
+def test_retry_when_never_connected(clock):
+    reason = requests.packages.urllib3.exceptions.NewConnectionError(None, "Connection refused")
+    error = requests.exceptions.ConnectionError(requests.packages.urllib3.exceptions.MaxRetryError(None, "/api", reason))
+
+    assert attempts(pa_api.RequestScheduler(rate=None), False, error)[0] == pa_api.REQUEST_RETRIES + 1
+
+
+def test_retry_after_honored(clock):
+    scheduler = pa_api.RequestScheduler(rate=None)
+    reply = requests.Response()
+    reply.headers["Retry-After"] = "7"
+
+    assert scheduler.backoff(0, reply) == 7
+    reply.headers["Retry-After"] = "3600"
+    assert scheduler.backoff(0, reply) == pa_api.REQUEST_BACKOFF_MAX
+
+
+def test_session_decides_from_the_request(pa_stub, clock):
+    pa_stub.on("config", None, response("error", msg="busy"), status=500)
+    pa_stub.on("op", "<show>", response("error", msg="busy"), status=500)
+    session = pa_api.ScheduledSession(pa_stub.host)
+    session.scheduler = pa_api.RequestScheduler(rate=None)
+
+    session.get(f"http://{pa_stub.host}/api?type=config&action=get&xpath=/config")
+    assert len(pa_stub.requests) == pa_api.REQUEST_RETRIES + 1
+    del pa_stub.requests[:]
+
+    session.get(f"http://{pa_stub.host}/api?type=config&action=set&xpath=/config&element=<x/>")
+    assert len(pa_stub.requests) == 1
+    del pa_stub.requests[:]
+
+    session.get(f"http://{pa_stub.host}/api?type=op&cmd=<show><clock></clock></show>")
+    assert len(pa_stub.requests) == pa_api.REQUEST_RETRIES + 1
+    del pa_stub.requests[:]
+
+    # The caller knows better
+    session.get(f"http://{pa_stub.host}/api?type=config&action=get&xpath=/config", idempotent=False)
+    assert len(pa_stub.requests) == 1
+
+
+def test_token_bucket(clock):
+    scheduler = pa_api.RequestScheduler(rate=4, burst=2)
+
+    for _ in range(2):      # The burst goes out at once
+        scheduler._take_token()
+    assert clock.slept == 0
+
+    for _ in range(3):      # Then 'rate' per second
+        scheduler._take_token()
+    assert clock.slept == pytest.approx(0.75)
+
+    clock.now += 60         # Refills up to the burst only
+    for _ in range(2):
+        scheduler._take_token()
+    assert clock.slept == pytest.approx(0.75)
+    scheduler._take_token()
+    assert clock.slept == pytest.approx(1)
+
+
+def test_concurrency_halved_on_overload_and_grown_back(clock):
+    scheduler = pa_api.RequestScheduler(rate=None, max_concurrency=8)
+
+    scheduler._acquire()
+    scheduler._release(0.5, overloaded=True)
+    assert scheduler.limit == 4
+    # Calls already in flight saw the same overload, once per round trip
+    scheduler._acquire()
+    scheduler._release(0.5, overloaded=True)
+    assert scheduler.limit == 4
+    clock.now += 1
+    scheduler._acquire()
+    scheduler._release(0.5, overloaded=True)
+    assert scheduler.limit == 2
+
+    # Additive increase, about one more call per round of 'limit' healthy calls
+    for _ in range(40):
+        scheduler._acquire()
+        scheduler._release(0.5, overloaded=False)
+    assert scheduler.limit == 8
+    assert scheduler.in_flight == 0
+
+
+def test_concurrency_halved_on_latency(clock):
+    scheduler = pa_api.RequestScheduler(rate=None, max_concurrency=8)
+    for _ in range(5):
+        scheduler._acquire()
+        scheduler._release(0.5, overloaded=False)
+    assert scheduler.limit == 8
+
+    clock.now += 10
+    scheduler._acquire()
+    scheduler._release(10, overloaded=False)    # Latency way past LATENCY_FACTOR times the baseline
+    assert scheduler.limit == 4
+
+
+def test_in_flight_limit_blocks(clock):
+    scheduler = pa_api.RequestScheduler(rate=None, max_concurrency=2)
+    scheduler._acquire()
+    scheduler._acquire()
+
+    with scheduler._cond:
+        assert not scheduler._cond.wait_for(lambda: scheduler.in_flight < int(scheduler.limit), timeout=0.01)
+    scheduler._release(0.5, overloaded=False)
+    assert scheduler.in_flight < int(scheduler.limit)
@@ -0,0 +1,150 @@
+import os
+
+import pytest
+import xmltodict
+
+import api_lib_pa as pa_api
+
+
+def rule(name, **fields):
+    return {"@name": name, "@uuid": f"uuid-{name}", **fields}
+
+
+def test_new_rules_drop_copied_uuid():
+    old = [rule("web", action="allow")]
+    clone = dict(old[0], **{"@name": "web-clone"})   # cloned, still has web's @uuid
+    delta = pa_api.rule_delta(old, [clone] + old)
+
+    (action, name, entry, _), = [x for x in delta if x[0] == "set"]
+    assert (action, name) == ("set", "web-clone")
+    assert "@uuid" not in entry
+    assert "uuid" not in pa_api.entry_element(entry)
+    assert clone["@uuid"] == "uuid-web"     # The modified rules aren't changed
+
+
+def test_edited_rules_keep_uuid():
+    old = [rule("web", action="allow")]
+    delta = pa_api.rule_delta(old, [rule("web", action="deny")])
+
+    assert delta == [("edit", "web", rule("web", action="deny"), None)]
+
+
+def apply(names, delta):
+    """
+    Apply a rule_delta() to a list of rule names the way PAN-OS would.
+    """
+    names = list(names)
+    for action, name, _, before in delta:
+        if action == "set":
+            names.append(name)
+        elif action == "move":
+            names.remove(name)
+            names.insert(names.index(before), name)
+        elif action == "delete":
+            names.remove(name)
+    return names
+
+
+def test_rule_delta_order():
+    old = [rule("a"), rule("b"), rule("c"), rule("d")]
+    new = [rule("x"), rule("a"), rule("b", action="deny"), rule("y"), rule("c"), rule("z")]
+    delta = pa_api.rule_delta(old, new)
+
+    assert [x[0] for x in delta] == ["set", "set", "set", "edit", "move", "move", "delete"]
+    assert [x[1] for x in delta if x[0] == "set"] == ["x", "y", "z"]
+    # Last one first, 'z' is already at the bottom
+    assert [(x[1], x[3]) for x in delta if x[0] == "move"] == [("y", "c"), ("x", "a")]
+    assert [x[1] for x in delta if x[0] == "delete"] == ["d"]
+    assert apply([x["@name"] for x in old], delta) == [x["@name"] for x in new]
+
+
+def test_rule_delta_unchanged():
+    old = [rule("a"), rule("b")]
+
+    assert pa_api.rule_delta(old, [dict(x) for x in old]) == []
+    assert pa_api.rule_delta(old[0], [old[0]]) == []    # Single entries, as xmltodict gives them
+
+
+class Reply:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+
+class FakePA(pa_api.api_lib_pa):
+    """
+    push_rule_delta() without a device, every multi-config element is kept.
+    """
+    def __init__(self, fail=False):
+        self.elements = []
+        self.fail = fail
+
+    def post_xml_request_pa(self, call_type="config", action="set", xpath=None, element=None):
+        self.elements.append((call_type, action, element))
+        return Reply(f'<response status="{"error" if self.fail else "success"}"/>')
+
+
+XPATH = "/config/devices/entry[@name='localhost.localdomain']/vsys/entry[@name='vsys1']/rulebase/security/rules"
+
+
+def test_multi_config_body():
+    pa = FakePA()
+    old = [rule("a"), rule("b")]
+    delta = pa_api.rule_delta(old, [rule("x", action="allow"), rule("a", action="deny")])
+
+    assert pa.push_rule_delta(XPATH, delta) == [(4, True, '<response status="success"/>')]
+    (call_type, action, element), = pa.elements
+    assert (call_type, action) == ("config", "multi-config")
+    body = xmltodict.parse(element)["multi-configure-request"]
+
+    assert body["set"]["@id"] == "1" and body["set"]["@xpath"] == XPATH
+    assert body["set"]["entry"] == {"@name": "x", "action": "allow"}
+    assert body["edit"]["@xpath"] == f"{XPATH}/entry[@name='a']"
+    assert body["edit"]["entry"]["action"] == "deny"
+    assert body["move"]["@xpath"] == f"{XPATH}/entry[@name='x']"
+    assert (body["move"]["@where"], body["move"]["@dst"]) == ("before", "a")
+    assert body["delete"]["@xpath"] == f"{XPATH}/entry[@name='b']"
+    assert [body[x]["@id"] for x in ("set", "edit", "move", "delete")] == ["1", "2", "3", "4"]
+
+
+def test_multi_config_split_by_size():
+    pa = FakePA()
+    delta = pa_api.rule_delta([], [rule(f"r{i}") for i in range(5)])
+
+    results = pa.push_rule_delta(XPATH, delta, size=4)
+    assert [count for count, _, _ in results] == [4, 4, 1]
+    # ids keep counting across requests
+    assert 'id="9"' in pa.elements[2][2]
+
+
+def test_output_and_push_diff(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("builtins.input", lambda prompt: "y")
+    pa, failing = FakePA(), FakePA(fail=True)
+    old = [rule("a"), rule("b")]
+    to_output = [
+        [[rule("a"), rule("b", action="deny")], "pre.xml", XPATH, pa, old],
+        [list(old), "post.xml", XPATH + "-post", pa, old],      # Unchanged, nothing sent
+        [[rule("a")], "other.xml", XPATH + "-other", failing, old],
+    ]
+
+    results = pa_api.output_and_push_diff(to_output)
+
+    assert results == [(XPATH, True), (XPATH + "-other", False)]
+    assert len(pa.elements) == 1 and "<edit" in pa.elements[0][2]
+    assert "<delete" in failing.elements[0][2]
+    out = capsys.readouterr().out
+    assert "new: 0, changed: 1, moved: 0, deleted: 0" in out
+    assert "successfully updated" not in out
+    assert all(os.path.exists(x) for x in ("pre.xml", "post.xml", "other.xml"))
+
+
+def test_output_and_push_diff_nothing_changed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("builtins.input", lambda prompt: pytest.fail("nothing to confirm"))
+    pa = FakePA()
+    old = [rule("a")]
+
+    assert pa_api.output_and_push_diff([[list(old), "pre.xml", XPATH, pa, old]]) is None
+    assert pa_api.output_and_push_diff([[[rule("b")], "pre.xml", XPATH, pa, old]], push=False) is None
+    assert pa.elements == []
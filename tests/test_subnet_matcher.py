@@ -0,0 +1,72 @@
+import ipaddress
+import random
+
+import pytest
+
+import api_lib_pa as pa_api
+
+SUBNETS = ["192.168.77.0/24", "192.168.78.0/25", "10.0.0.0/8", "2001:db8:77::/48", "not-a-subnet"]
+
+
+def python_only(monkeypatch):
+    monkeypatch.setattr(pa_api, "numpy", None)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        python_only(monkeypatch)
+    return request.param
+
+
+def as_lists(result):
+    return [[bool(x) for x in row] for row in result]
+
+
+def test_matches(backend):
+    matcher = pa_api.SubnetMatcher(SUBNETS)
+    address_sets = [
+        ["192.168.77.14/32"],
+        ["172.16.1.1", "192.168.78.200"],       # Just outside the /25
+        ["192.168.0.0/16"],                      # Bigger than the subnets, still overlaps
+        ["2001:db8:77:1::5", "web-fqdn.example.com"],
+        [],
+        ["10.255.255.255", "2001:db8:78::1"],
+    ]
+
+    assert as_lists(matcher.matrix(address_sets)) == [
+        [True, False, False, False, False],
+        [False, False, False, False, False],
+        [True, True, False, False, False],
+        [False, False, False, True, False],
+        [False, False, False, False, False],
+        [False, False, True, False, False],
+    ]
+    assert [bool(x) for x in matcher.mask(address_sets)] == [True, False, True, True, False, True]
+    assert matcher.overlaps(["192.168.78.127"]) is True
+    assert matcher.overlaps(["192.168.78.128"]) is False
+
+
+def random_network(rng):
+    if rng.random() < 0.8:
+        address = ipaddress.IPv4Address(rng.choice((0x0A000000, 0xC0A84C00, 0xAC100000)) + rng.randrange(1 << 10))
+        return f"{address}/{rng.randrange(16, 33)}"
+    address = ipaddress.IPv6Address((0x20010DB8 << 96) + (rng.randrange(1 << 18) << 80))
+    return f"{address}/{rng.randrange(40, 129)}"
+
+
+def test_numpy_same_as_python(monkeypatch):
+    pytest.importorskip("numpy")
+    rng = random.Random(7)
+    subnets = [random_network(rng) for _ in range(25)] + ["fqdn-object"]
+    address_sets = [[random_network(rng) for _ in range(rng.randrange(0, 6))] for _ in range(300)]
+    matcher = pa_api.SubnetMatcher(subnets)
+
+    vectorized = as_lists(matcher.matrix(address_sets))
+    python_only(monkeypatch)
+    plain = as_lists(matcher.matrix(address_sets))
+
+    assert vectorized == plain
+    assert any(any(row) for row in plain) and not all(all(row) for row in plain)